@@ -0,0 +1,89 @@
+"""
+Measures the CPU time per request when many identical chart updates arrive at once, with and without coalescing.
+
+A cohort of users opening the dashboard together sends the same /_dash-update-component request for the Home page
+pie chart within milliseconds. For each level of concurrency the figure cache is cleared, then that many threads
+wait on a barrier and post the same request through the Flask test client at once. The CPU time of the whole
+process over the burst, divided by the number of requests, is reported with the number of times the figure was
+built. With coalescing the first request builds the figure and the others share it. Without, simulated by a
+figure cache timeout of zero so no request waits for another, every request that misses the cache builds it.
+
+A synthetic CSV with scale times the rows of data/df_prepared.csv is used, so a build takes as long as it would
+on a large dataset. Each level is run REPEAT times and the median is shown.
+
+Run with: python benchmarks/bench_coalescing.py [scale]
+"""
+import logging
+from pathlib import Path
+from statistics import median
+import sys
+import tempfile
+import threading
+import time
+from bench_suite import app, callback_payload, data_store, figure_cache, write_synthetic_csv
+
+CONCURRENCY = [1, 2, 4, 8, 16, 32, 64]
+
+REPEAT = 5
+
+OUTPUT_ID = 'pie_chart_total'
+
+TIME_PERIOD = 201819
+
+
+def burst(count, payload):
+    """
+    Posts payload from count threads at once with an empty figure cache, and returns the CPU milliseconds per
+    request and the number of figures built.
+    """
+    figure_cache.clear()
+    barrier = threading.Barrier(count + 1)
+
+    def post():
+        client = app.server.test_client()
+        barrier.wait()
+        response = client.post('/_dash-update-component', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f'The callback failed with status {response.status_code}')
+
+    threads = [threading.Thread(target=post) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    start = time.process_time()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - start
+    info = figure_cache.cache_info()
+    return cpu * 1000 / count, info['misses'] - info['coalesced']
+
+
+def main(scale):
+    # Requests giving up on waiting at once log a warning each, which would be timed too
+    logging.getLogger('figures.figure_cache').setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'df_prepared.csv'
+        write_synthetic_csv(data_store.data_path, path, scale)
+        data_store.data_path = path
+        rows = len(data_store.get_snapshot().data)
+        # Dash registers the callbacks on its first request
+        app.server.test_client().get('/')
+        payload = callback_payload(OUTPUT_ID, (TIME_PERIOD,))
+        burst(1, payload)
+
+        print(f'{rows} rows, {OUTPUT_ID}, CPU ms per request (figures built)')
+        print(f"{'requests':>8} {'coalesced':>16} {'independent':>16}")
+        timeout = figure_cache.timeout
+        for count in CONCURRENCY:
+            columns = []
+            for figure_cache.timeout in (timeout, 0):
+                results = [burst(count, payload) for _ in range(REPEAT)]
+                cpu = median(result[0] for result in results)
+                builds = median(result[1] for result in results)
+                columns.append(f'{cpu:9.2f} ({builds:4.0f})')
+            figure_cache.timeout = timeout
+            print(f'{count:8} {columns[0]:>16} {columns[1]:>16}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000)
@@ -0,0 +1,96 @@
+"""
+Compares loading the dataset from CSV with loading it from the partitioned Parquet copy.
+
+A synthetic CSV is written at each scale by repeating the rows of data/df_prepared.csv; every copy after the
+first is labelled as provider-level data, as in the full outcomes files. Each load runs in a fresh Python
+process so its peak memory can be measured on its own. The RSS column is the growth in peak resident memory
+caused by the load, after pandas and pyarrow have been imported.
+
+Run with: python benchmarks/bench_columnar.py [scale ...]
+"""
+import json
+from pathlib import Path
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from figures.columnar_store import convert
+from figures.data_store import GEOGRAPHIC_LEVEL, SCHEMA, data_path
+
+SCALES = [1, 100, 10_000]
+
+LOADERS = ['read_csv', 'parquet all', 'parquet national']
+
+
+def write_csv(path, scale):
+    """
+    Writes the dataset repeated scale times, labelling every copy after the first as provider-level.
+    """
+    header, *rows = data_path.read_text().splitlines(keepends=True)
+    provider_rows = [row.replace(f',{GEOGRAPHIC_LEVEL},', ',Provider,', 1) for row in rows]
+    with open(path, 'w') as file:
+        file.write(header)
+        file.writelines(rows)
+        for _ in range(scale - 1):
+            file.writelines(provider_rows)
+
+
+def peak_rss_mb():
+    # On Linux ru_maxrss survives exec and so includes the parent's peak; VmHWM covers this process only
+    try:
+        with open('/proc/self/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('VmHWM')) / 1024
+    except OSError:
+        # ru_maxrss is in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20)
+
+
+def load(loader, path):
+    """
+    Runs one loader in this process and prints its load time, peak RSS growth and row count as JSON.
+    """
+    import pandas as pd
+    import pyarrow.dataset  # noqa: F401 - imported up front so its memory is not counted as part of a load
+    from figures.columnar_store import read_columnar
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    if loader == 'read_csv':
+        data = pd.read_csv(path, dtype=SCHEMA)
+    elif loader == 'parquet all':
+        data = read_columnar(source=path)
+    else:
+        data = read_columnar(filters={'geographic_level': GEOGRAPHIC_LEVEL}, source=path)
+    seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'rss': peak_rss_mb() - before, 'rows': len(data)}))
+
+
+def measure(loader, path):
+    output = subprocess.run([sys.executable, __file__, '--load', loader, str(path)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main(scales):
+    print(f"{'scale':>7} {'rows':>10} {'csv MB':>8} {'convert s':>9}  "
+          + '  '.join(f'{loader + " s":>18} {"RSS MB":>7}' for loader in LOADERS))
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            path = Path(directory) / f'outcomes_{scale}.csv'
+            write_csv(path, scale)
+            start = time.perf_counter()
+            convert(path)
+            converted = time.perf_counter() - start
+
+            results = [measure(loader, path) for loader in LOADERS]
+            rows = results[0]['rows']
+            line = f'{scale:7} {rows:10} {path.stat().st_size / (1 << 20):8.1f} {converted:9.2f}  '
+            print(line + '  '.join(f"{result['seconds']:18.3f} {result['rss']:7.1f}" for result in results))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--load']:
+        load(sys.argv[2], Path(sys.argv[3]))
+    else:
+        main([int(scale) for scale in sys.argv[1:]] or SCALES)
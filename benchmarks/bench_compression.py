@@ -0,0 +1,107 @@
+"""
+Measures the bytes a user session downloads from the Dash endpoints, and the server time it takes, with responses
+sent uncompressed (COMPRESS=0), compressed with gzip only and with brotli.
+
+The session is a scripted walkthrough of the four pages: the page HTML, /_dash-layout and /_dash-dependencies, then
+for each page the request that renders it, the callback of every chart on it with the inputs the page starts with,
+and one change of each chart's first input to another value it offers. A returning session repeats it with the
+ETags the first one received. Every request goes through the Flask test client of a worker process started in each
+mode, as a browser sending Accept-Encoding: gzip, deflate, br would. The scripts and stylesheets are left out; see
+bench_first_load.py for those.
+
+Run with: python benchmarks/bench_compression.py
+"""
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+ROOT = Path(__file__).parent.parent
+
+# The environment and the Accept-Encoding header of each mode
+MODES = {
+    'none': ({'COMPRESS': '0'}, 'gzip, deflate, br'),
+    'gzip': ({'COMPRESS': '1'}, 'gzip, deflate'),
+    'brotli': ({'COMPRESS': '1'}, 'gzip, deflate, br'),
+}
+
+# Walks through the pages twice, printing the (session, kind, bytes, server ms) of every request
+WORKER = """
+import json
+import sys
+import time
+sys.path.insert(0, sys.argv[2])
+import dash
+from dash import dcc
+from bench_suite import app, callback_payload
+from services.clientside import CHARTS
+from services.static_export import walk
+client = app.server.test_client()
+results = []
+client.get('/')
+
+def fetch(session, kind, url, payload=None, tag=None):
+    headers = {'Accept-Encoding': sys.argv[1]}
+    if tag:
+        headers['If-None-Match'] = tag
+    start = time.perf_counter()
+    response = client.post(url, json=payload, headers=headers) if payload else client.get(url, headers=headers)
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code not in (200, 304):
+        raise RuntimeError(f'{url} returned {response.status_code}')
+    results.append((session, kind, len(response.data), elapsed))
+    return response.headers.get('ETag')
+
+tags = {}
+for session in ('first', 'returning'):
+    fetch(session, 'html', '/')
+    for url in ('/_dash-layout', '/_dash-dependencies'):
+        tags[url] = fetch(session, 'layout', url, tag=tags.get(url))
+    for page in dash.page_registry.values():
+        fetch(session, 'page', '/_dash-update-component', {
+            'output': '.._pages_content.children..._pages_store.data..',
+            'outputs': [{'id': '_pages_content', 'property': 'children'}, {'id': '_pages_store', 'property': 'data'}],
+            'inputs': [{'id': '_pages_location', 'property': 'pathname', 'value': page['path']},
+                       {'id': '_pages_location', 'property': 'search', 'value': ''}],
+            'changedPropIds': ['_pages_location.pathname'],
+        })
+        components = {component.id: component for component in walk(page['layout']())
+                      if isinstance(getattr(component, 'id', None), str)}
+        for output_id, component in components.items():
+            if isinstance(component, dcc.Graph) and output_id in CHARTS:
+                inputs = app.callback_map[f'{output_id}.figure']['inputs']
+                start = tuple(getattr(components[item['id']], item['property']) for item in inputs)
+                changed = next(args for args in CHARTS[output_id][1] if args[0] != start[0])
+                for args in (start, changed):
+                    fetch(session, 'chart', '/_dash-update-component', callback_payload(output_id, args))
+print(json.dumps(results))
+"""
+
+
+def measure(mode):
+    """
+    Runs the worker in a mode and returns its (session, kind, bytes, server ms) results.
+    """
+    settings, accept = MODES[mode]
+    env = {**os.environ, **settings, 'WARMUP': '0'}
+    output = subprocess.run([sys.executable, '-c', WORKER, accept, str(ROOT / 'benchmarks')], env=env,
+                            cwd=ROOT / 'src', check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    kinds = ['html', 'layout', 'page', 'chart']
+    print(f"{'mode':>7} {'session':>10} {'requests':>9} " + ' '.join(f'{kind + " KB":>9}' for kind in kinds)
+          + f" {'total KB':>9} {'server ms':>10}")
+    for mode in MODES:
+        results = measure(mode)
+        for session in ('first', 'returning'):
+            responses = [result for result in results if result[0] == session]
+            sizes = [sum(result[2] for result in responses if result[1] == kind) / 1024 for kind in kinds]
+            print(f'{mode:>7} {session:>10} {len(responses):9} ' + ' '.join(f'{size:9.1f}' for size in sizes)
+                  + f' {sum(sizes):9.1f} {sum(result[3] for result in responses):10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares the fast figure builders with the Plotly Express versions of every figure function.
+
+Each figure function is run uncached twice: once as it is, building a plain dictionary, and once with
+Plotly Express patched in, as the functions did before. The serialize column is the time Dash spends
+encoding the returned figure for the response.
+
+Run with: python benchmarks/bench_fast_figure.py
+"""
+from statistics import median
+import time
+from unittest import mock
+import plotly.express as px
+from plotly.io.json import to_json_plotly
+from figures import figure_analysis, figure_course_level, figure_home
+from figures.data_store import get_snapshot
+
+REPEAT = 50
+
+
+class PlotlyExpress:
+    """Stands in for the fast_figure module so a figure function builds its figure with Plotly Express."""
+    pie = staticmethod(px.pie)
+    bar = staticmethod(px.bar)
+    line = staticmethod(px.line)
+
+    @staticmethod
+    def update_layout(fig, **kwargs):
+        return fig.update_layout(**kwargs)
+
+
+CASES = [
+    (figure_home, 'pie_chart_total', (202122,)),
+    (figure_home, 'pie_chart_age', (202122, ['Undergraduate', 'Postgraduate'])),
+    (figure_course_level, 'bar_ethnicity', ('Undergraduate', 202122)),
+    (figure_course_level, 'line_chart', ('Undergraduate', 'Awarded QTS')),
+    (figure_course_level, 'bar_ethnicity', ('Postgraduate', 202122)),
+    (figure_course_level, 'line_chart', ('Postgraduate', 'Teaching in a state-funded school')),
+    (figure_analysis, 'line_chart_analysis',
+     (get_snapshot(), 'pct_total_age_u25', ['201718', '201819', '201920', '202021', '202122'])),
+]
+
+
+def measure(function, args):
+    """
+    Returns the median build and serialize times of a figure function in milliseconds.
+    """
+    build_times, serialize_times = [], []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fig = function(*args)
+        built = time.perf_counter()
+        to_json_plotly(fig)
+        build_times.append(built - start)
+        serialize_times.append(time.perf_counter() - built)
+    return median(build_times) * 1000, median(serialize_times) * 1000
+
+
+def main():
+    print(f"{'figure':45} {'px build':>9} {'px json':>8} {'fast build':>10} {'fast json':>9} {'speedup':>8}")
+    for module, name, args in CASES:
+        function = getattr(module, name).__wrapped__
+        with mock.patch.object(module, 'fast_figure', PlotlyExpress):
+            px_build, px_json = measure(function, args)
+        fast_build, fast_json = measure(function, args)
+        speedup = (px_build + px_json) / (fast_build + fast_json)
+        label = f'{module.__name__.split(".")[-1]}.{name}'
+        if module is figure_course_level:
+            label += f' {args[0]}'
+        print(f'{label:45} {px_build:9.2f} {px_json:8.2f} {fast_build:10.2f} {fast_json:9.2f} {speedup:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Compares the bytes a browser downloads on a first and a repeat visit to the Home page, and a modelled time to
+interactive, before and after the precompressed asset bundle of build_assets.py.
+
+Before, the QUARTZ theme came from the jsDelivr CDN and Dash served its JavaScript and the assets folder
+uncompressed. After, the vendored theme and every script are served as brotli from the bundle. The app is started
+in a worker process for each mode, and every file the page loads is requested through the Flask test client as a
+browser sending Accept-Encoding: gzip, deflate, br would: the HTML, the scripts and stylesheets it links, the
+layout and callback definitions, then the chunks the components load on demand (the graph, dropdown and slider
+code and plotly.js). The CDN theme is counted at its gzip size, as the CDN compresses it, on a connection of its own.
+
+There is no browser here, so the time to interactive is modelled from the measured server times and sizes: the
+page loads in four rounds (HTML; scripts and stylesheets; layout and dependencies; on-demand chunks), each taking
+one round trip, plus a connection set-up for the first round and the CDN, plus its bytes over the bandwidth. Parsing
+and running the scripts is the same in both modes and is left out, as are the chart callbacks.
+
+A repeat visit requests again every response the browser may not reuse from its cache without asking, in the same
+rounds: one with an ETag or Last-Modified comes back as a 304 with no body, and the others are downloaded in full.
+
+Run with: python benchmarks/bench_first_load.py
+"""
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+
+ROOT = Path(__file__).parent.parent
+
+# Round trip in ms and bandwidth in Mbit/s; mobile is Lighthouse's throttled slow 4G
+NETWORKS = {'broadband': (20, 50), 'mobile': (150, 1.6)}
+
+# Round trips to set up a new HTTPS connection (DNS, TCP, TLS)
+HANDSHAKE = 3
+
+# Requests every file a first visit loads and prints (round, url, bytes, server ms, cache-control,
+# whether it can be revalidated) for each
+WORKER = """
+import gzip
+import json
+import re
+import sys
+import time
+from app import app
+from services.assets import THEME_PATH
+before = sys.argv[1] == 'before'
+client = app.server.test_client()
+headers = {'Accept-Encoding': 'gzip, deflate, br'}
+results = []
+
+def fetch(stage, url, method='get'):
+    start = time.perf_counter()
+    response = getattr(client, method)(url, headers=headers)
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} returned {response.status_code}')
+    results.append((stage, url, len(response.data), elapsed, response.headers.get('Cache-Control', ''),
+                    bool(response.headers.get('ETag') or response.headers.get('Last-Modified'))))
+    return response
+
+client.get('/')
+html = fetch(0, '/').get_data(as_text=True)
+for url in re.findall(r'(?:src|href)="(/[^"]+\\.(?:js|css)[^"]*)"', html):
+    if before and 'bootstrap-quartz' in url:
+        results.append((1, 'cdn', len(gzip.compress(THEME_PATH.read_bytes())), 0, 'public, max-age=31536000', True))
+    else:
+        fetch(1, url)
+fetch(2, '/_dash-layout')
+fetch(2, '/_dash-dependencies')
+for chunk in ['dash/dcc/async-graph', 'dash/dcc/async-dropdown', 'dash/dcc/async-slider']:
+    fetch(3, f'/_dash-component-suites/{chunk}.v1m0.js')
+fetch(3, '/_dash-component-suites/plotly/package_data/plotly.v1m0.min.js')
+print(json.dumps(results))
+"""
+
+
+def measure(mode, bundle):
+    """
+    Runs the worker for a mode and returns its (round, url, bytes, server ms, cache-control, revalidates) results.
+    """
+    env = {**os.environ, 'ASSET_BUNDLE_DIR': str(bundle), 'WARMUP': '0'}
+    output = subprocess.run([sys.executable, '-c', WORKER, mode], env=env, cwd=ROOT / 'src', check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def cached(cache_control):
+    """
+    Returns whether a response with this Cache-Control header is reused on a repeat visit without asking.
+    """
+    return 'max-age' in cache_control and 'max-age=0' not in cache_control and 'no-cache' not in cache_control
+
+
+def model(results, rtt, mbps, repeat=False):
+    """
+    Returns the bytes downloaded and the modelled milliseconds to interactive of a visit.
+    """
+    total, ms = 0, HANDSHAKE * rtt
+    for stage in range(4):
+        responses = [result for result in results if result[0] == stage]
+        if repeat:
+            # A response the browser can revalidate comes back as a 304 with no body
+            responses = [(*result[:2], 0 if result[5] else result[2], *result[3:]) for result in responses
+                         if not cached(result[4])]
+            if not responses:
+                continue
+        size = sum(result[2] for result in responses)
+        total += size
+        cdn = HANDSHAKE * rtt if any(result[1] == 'cdn' for result in responses) and not repeat else 0
+        ms += rtt + cdn + max(result[3] for result in responses) + size * 8 / (mbps * 1000)
+    return total, ms
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        bundle = Path(directory) / 'assets'
+        subprocess.run([sys.executable, 'build_assets.py', str(bundle)], cwd=ROOT / 'src', check=True,
+                       capture_output=True)
+        results = {'before': measure('before', Path(directory) / 'none'), 'after': measure('after', bundle)}
+
+    print(f"{'mode':>7} {'visit':>7} {'requests':>9} {'KB':>9}  " + '  '.join(f'{name + " TTI ms":>18}'
+                                                                             for name in NETWORKS))
+    for visit in ('first', 'repeat'):
+        for mode, responses in results.items():
+            repeat = visit == 'repeat'
+            count = len([result for result in responses if result[1] != 'cdn'
+                         and not (repeat and cached(result[4]))])
+            times = [model(responses, rtt, mbps, repeat) for rtt, mbps in NETWORKS.values()]
+            print(f'{mode:>7} {visit:>7} {count:9} {times[0][0] / 1024:9.1f}  '
+                  + '  '.join(f'{ms:18.0f}' for _, ms in times))
+
+
+if __name__ == '__main__':
+    main()
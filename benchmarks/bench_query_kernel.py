@@ -0,0 +1,82 @@
+"""
+Compares the aggregation engine and its NumPy query kernel with the pandas boolean-mask filtering they replace, from
+10^3 to 10^7 rows.
+
+A synthetic frame is made at each size by repeating the rows of data/df_prepared.csv. The query is the one behind
+the ethnicity bar charts: the mean of the six ethnicity percentages over the rows of one time period and course
+level that were awarded QTS. It is answered two ways:
+
+- pandas: data[(a == x) & (b == y) & (c == z)][columns].mean(), as the figure functions used to do;
+- aggregates: Aggregates.means(), which reads the per-combination sums the kernel computes once per snapshot.
+
+The one-off costs the app pays per snapshot are reported separately: encoding the frame, summing every measure for
+every combination with EncodedFrame.group_sums(), the pass the aggregation engine runs, and building the whole
+engine. Every query and pass is timed REPEAT times and the fastest run is shown.
+
+Run with: python benchmarks/bench_query_kernel.py [rows ...]
+"""
+import sys
+import time
+import numpy as np
+from figures.aggregates import MEASURES, Aggregates
+from figures.data_store import INDEX_COLUMNS, DataSnapshot, read_data
+from figures.query_kernel import EncodedFrame
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+REPEAT = 5
+
+ETHNICITY_COLUMNS = [
+    'pct_total_ethnic_asian',
+    'pct_total_ethnic_black',
+    'pct_total_ethnic_mixed_ethnicity',
+    'pct_total_ethnic_other',
+    'pct_total_ethnic_white',
+    'pct_total_ethnic_unknown',
+]
+
+FILTERS = {'time_period': 201718, 'course_level_recoded': 'Undergraduate', 'qts_status': 'Awarded QTS'}
+
+
+def fastest(call, repeat=REPEAT):
+    """
+    Returns the result of call() and the fastest of repeat timings in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        times.append(time.perf_counter() - start)
+    return result, min(times) * 1000
+
+
+def pandas_means(data):
+    mask = ((data['time_period'] == FILTERS['time_period'])
+            & (data['course_level_recoded'] == FILTERS['course_level_recoded'])
+            & (data['qts_status'] == FILTERS['qts_status']))
+    return data[mask][ETHNICITY_COLUMNS].mean().tolist()
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    source = read_data()[INDEX_COLUMNS + MEASURES]
+    print(f"{'rows':>10} {'pandas ms':>10} {'aggregates ms':>14} {'speed-up':>9} {'encode ms':>10} "
+          f"{'group_sums ms':>14} {'build ms':>9}")
+    for size in sizes:
+        data = source.iloc[np.resize(np.arange(len(source)), size)].reset_index(drop=True)
+
+        expected, pandas_ms = fastest(lambda: pandas_means(data))
+        encoded, encode_ms = fastest(lambda: EncodedFrame(data, INDEX_COLUMNS, MEASURES), repeat=1)
+        _, group_sums_ms = fastest(lambda: encoded.group_sums(MEASURES))
+        snapshot = DataSnapshot(data)
+        engine, build_ms = fastest(lambda: Aggregates(snapshot), repeat=1)
+        aggregated, aggregates_ms = fastest(lambda: engine.means(ETHNICITY_COLUMNS, **FILTERS).tolist())
+        if not np.allclose(aggregated, expected):
+            raise RuntimeError(f'The aggregates and pandas disagree at {size} rows')
+
+        print(f'{size:10} {pandas_ms:10.3f} {aggregates_ms:14.3f} {pandas_ms / aggregates_ms:8.1f}x '
+              f'{encode_ms:10.1f} {group_sums_ms:14.1f} {build_ms:9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Compares the throughput of /_dash-update-component under the Flask development server and under gunicorn.
+
+Each server is started in turn and given a few seconds to load. Then CLIENTS client processes each keep one
+connection open and post chart updates for DURATION seconds, cycling through the time periods of the Home page
+pie chart. The development server is started as `python src/app.py`; gunicorn uses gunicorn.conf.py with 1, 4
+and 8 workers. The numbers depend heavily on the number of CPUs of the machine, which is printed first.
+
+Run from the repository root with: python benchmarks/bench_server.py
+"""
+import http.client
+import json
+from multiprocessing import Pool
+import os
+from pathlib import Path
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).parent.parent
+
+PORT = 8097
+
+DURATION = 10
+
+CLIENTS = 8
+
+WORKERS = [1, 4, 8]
+
+PERIODS = [201718, 201819, 201920, 202021, 202122]
+
+
+def request_body(period):
+    return json.dumps({
+        'output': 'pie_chart_total.figure',
+        'outputs': {'id': 'pie_chart_total', 'property': 'figure'},
+        'inputs': [{'id': 'time_period_dropdown_h', 'property': 'value', 'value': period}],
+        'changedPropIds': ['time_period_dropdown_h.value'],
+    })
+
+
+def wait_until_ready(timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('localhost', PORT, timeout=5)
+            connection.request('GET', '/healthz')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('The server did not start')
+
+
+def client(deadline):
+    """
+    Posts chart updates over one connection until the deadline and returns the number of responses.
+    """
+    bodies = [request_body(period) for period in PERIODS]
+    headers = {'Content-Type': 'application/json'}
+    connection = http.client.HTTPConnection('localhost', PORT)
+    count = 0
+    while time.time() < deadline:
+        connection.request('POST', '/_dash-update-component', body=bodies[count % len(bodies)], headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f'Request failed with status {response.status}')
+        count += 1
+    return count
+
+
+def measure(command, env=None):
+    """
+    Starts a server, loads it with CLIENTS connections for DURATION seconds and returns the requests per second.
+    """
+    server = subprocess.Popen(command, cwd=ROOT, env={**os.environ, 'PORT': str(PORT), **(env or {})},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_until_ready()
+        with Pool(CLIENTS) as pool:
+            # Warm up every worker before measuring
+            pool.map(client, [time.time() + 2] * CLIENTS)
+            counts = pool.map(client, [time.time() + DURATION] * CLIENTS)
+    finally:
+        # The development server's reloader runs the app in a child process, so stop the whole group
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    return sum(counts) / DURATION
+
+
+def main():
+    print(f'{os.cpu_count()} CPUs, {CLIENTS} client connections, {DURATION} s per run')
+    results = [('development server', measure([sys.executable, 'src/app.py']))]
+    for workers in WORKERS:
+        rate = measure([sys.executable, '-m', 'gunicorn'], {'WEB_CONCURRENCY': str(workers)})
+        results.append((f'gunicorn, {workers} workers', rate))
+    for name, rate in results:
+        print(f'{name:22} {rate:8.0f} requests/s')
+
+
+if __name__ == '__main__':
+    main()
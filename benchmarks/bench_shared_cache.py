@@ -0,0 +1,128 @@
+"""
+Measures how often the chart callbacks of 8 worker processes are answered from a cache, and how fast, with each
+worker keeping its own figure cache and with the figure cache shared on disk between them (SHARED_CACHE=1).
+
+A synthetic CSV with scale times the rows of data/df_prepared.csv is written first. The workers are started
+together, each importing the app and loading the data before the measurement begins. Each one then answers the same
+number of requests, drawn from every input the pages register with chart_callback. Some charts are much more
+popular than others: the inputs are ranked in one order shared by every worker and requested with a probability
+proportional to 1 / rank, as users tend to look at the same few charts.
+
+Each request is counted as a hit in the worker's own cache, a hit in the shared cache or a build, from the figure
+cache's counters. The hit rate, the number of figures built across all workers and the p50 and p95 latency of each
+kind of request are reported.
+
+Run with: python benchmarks/bench_shared_cache.py [scale] [requests per worker]
+"""
+import json
+import os
+from pathlib import Path
+from statistics import quantiles
+import subprocess
+import sys
+import tempfile
+from figures.data_store import data_path
+
+WORKERS = 8
+
+MODES = {'process': {'SHARED_CACHE': '0'}, 'shared': {'SHARED_CACHE': '1'}}
+
+# The app is imported and the data loaded before the measurement, so only the requests are timed
+WORKER = """
+import json
+from pathlib import Path
+import random
+import sys
+import time
+from figures import data_store
+data_store.data_path = Path(sys.argv[1])
+from app import app
+from figures.figure_cache import figure_cache
+from services.clientside import CHARTS
+data_store.get_snapshot()
+cases = [(output_id, args) for output_id, (_, space) in CHARTS.items() for args in space]
+random.Random(0).shuffle(cases)
+weights = [1 / rank for rank in range(1, len(cases) + 1)]
+requests = random.Random(int(sys.argv[2])).choices(cases, weights, k=int(sys.argv[3]))
+print('imported', flush=True)
+sys.stdin.readline()
+results = []
+for output_id, args in requests:
+    before = figure_cache.cache_info()
+    start = time.perf_counter()
+    CHARTS[output_id][0](*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    after = figure_cache.cache_info()
+    if after['shared_hits'] > before['shared_hits']:
+        kind = 'shared'
+    elif after['misses'] > before['misses']:
+        kind = 'built'
+    else:
+        kind = 'local'
+    results.append((kind, elapsed))
+print(json.dumps(results), flush=True)
+"""
+
+
+def write_csv(path, scale):
+    """
+    Writes the dataset repeated scale times.
+    """
+    header, *rows = data_path.read_text().splitlines(keepends=True)
+    with open(path, 'w') as file:
+        file.write(header)
+        for _ in range(scale):
+            file.writelines(rows)
+
+
+def measure(path, mode, requests, cache_dir):
+    """
+    Starts the workers in a mode and returns every (kind, milliseconds) they recorded.
+    """
+    env = {**os.environ, **MODES[mode], 'SHARED_CACHE_DIR': str(cache_dir)}
+    workers = [subprocess.Popen([sys.executable, '-c', WORKER, str(path), str(seed), str(requests)], env=env,
+                                text=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+               for seed in range(WORKERS)]
+    try:
+        for worker in workers:
+            worker.stdout.readline()
+        for worker in workers:
+            worker.stdin.write('\n')
+            worker.stdin.flush()
+        return [result for worker in workers for result in json.loads(worker.stdout.readline())]
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+
+
+def percentiles(times):
+    """
+    Returns the p50 and p95 of some times, or None for both when there are fewer than two.
+    """
+    if len(times) < 2:
+        return None, None
+    cuts = quantiles(times, n=100, method='inclusive')
+    return cuts[49], cuts[94]
+
+
+def main(scale, requests):
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'df_prepared.csv'
+        write_csv(path, scale)
+        print(f'{scale}x rows, {WORKERS} workers, {requests} requests each')
+        print(f"{'mode':>8} {'hit rate':>9} {'built':>6}  " + '  '.join(
+            f'{kind + " n":>9} {"p50 ms":>8} {"p95 ms":>8}' for kind in ['local', 'shared', 'built', 'all']))
+        for mode in MODES:
+            results = measure(path, mode, requests, Path(directory) / mode)
+            row = []
+            for kind in ['local', 'shared', 'built', 'all']:
+                times = [elapsed for name, elapsed in results if kind in (name, 'all')]
+                p50, p95 = percentiles(times)
+                row.append(f'{len(times):9} {p50 or 0:8.2f} {p95 or 0:8.2f}')
+            built = sum(name == 'built' for name, _ in results)
+            print(f'{mode:>8} {1 - built / len(results):9.1%} {built:6}  ' + '  '.join(row))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000, int(sys.argv[2]) if len(sys.argv) > 2 else 200)
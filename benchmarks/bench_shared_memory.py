@@ -0,0 +1,108 @@
+"""
+Measures the memory used by the dataset as the number of worker processes grows, for each data backend.
+
+A synthetic CSV with scale times the rows of data/df_prepared.csv is written first, and the mmap snapshot is
+built from it once. Then 1, 2, 4 and 8 worker processes are started together. Each one imports the app's data
+code, loads the snapshot with the chosen backend, reads every value so the data is resident and builds the
+aggregates the figures read. Total PSS (proportional set size) splits shared pages between the processes that map
+them, so it is the physical memory the workers' data really takes; total RSS counts shared pages once per process.
+Both are the growth caused by loading the data, summed over the workers. Linux only, as it reads
+/proc/<pid>/smaps_rollup.
+
+Run with: python benchmarks/bench_shared_memory.py [scale]
+"""
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+from figures.data_store import data_path
+from figures.mmap_store import build
+
+WORKERS = [1, 2, 4, 8]
+
+BACKENDS = ['csv', 'mmap']
+
+# Libraries are imported before the first measurement, so only memory taken up by the data is counted
+WORKER = """
+import sys
+from pathlib import Path
+import pandas
+import pyarrow.ipc
+from figures.aggregates import aggregates
+from figures.data_store import load_snapshot
+print('imported', flush=True)
+sys.stdin.readline()
+snapshot = load_snapshot(Path(sys.argv[1]))
+total = sum(int(snapshot.data[column].sum()) for column in snapshot.data.select_dtypes('number'))
+aggregates(snapshot)
+print('loaded', flush=True)
+sys.stdin.readline()
+"""
+
+
+def write_csv(path, scale):
+    """
+    Writes the dataset repeated scale times.
+    """
+    header, *rows = data_path.read_text().splitlines(keepends=True)
+    with open(path, 'w') as file:
+        file.write(header)
+        for _ in range(scale):
+            file.writelines(rows)
+
+
+def memory_mb(pid):
+    """
+    Returns the PSS and RSS of a process in megabytes.
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            name, _, rest = line.partition(':')
+            if name in ('Pss', 'Rss'):
+                values[name] = int(rest.split()[0]) / 1024
+    return values['Pss'], values['Rss']
+
+
+def measure(backend, path, count):
+    """
+    Starts count workers using the backend and returns the growth of their total PSS and RSS from loading the data.
+    """
+    env = {**os.environ, 'DATA_BACKEND': backend}
+    workers = [subprocess.Popen([sys.executable, '-c', WORKER, str(path)], env=env, text=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(count)]
+    try:
+        for worker in workers:
+            worker.stdout.readline()
+        before = [memory_mb(worker.pid) for worker in workers]
+        for worker in workers:
+            worker.stdin.write('\n')
+            worker.stdin.flush()
+        for worker in workers:
+            worker.stdout.readline()
+        after = [memory_mb(worker.pid) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+    pss = sum(memory[0] for memory in after) - sum(memory[0] for memory in before)
+    rss = sum(memory[1] for memory in after) - sum(memory[1] for memory in before)
+    return pss, rss
+
+
+def main(scale):
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'outcomes.csv'
+        write_csv(path, scale)
+        build(path)
+        print(f'{scale}x rows, {path.stat().st_size / (1 << 20):.1f} MB of CSV')
+        print(f"{'workers':>7}  " + '  '.join(f'{backend + " PSS MB":>13} {backend + " RSS MB":>13}'
+                                              for backend in BACKENDS))
+        for count in WORKERS:
+            results = [measure(backend, path, count) for backend in BACKENDS]
+            print(f'{count:7}  ' + '  '.join(f'{pss:13.1f} {rss:13.1f}' for pss, rss in results))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,268 @@
+"""
+Headless benchmark suite for every figure function and chart callback.
+
+Every figure function is called, uncached, for every input the pages can send it, and every chart callback is
+posted to /_dash-update-component through the Flask test client with the payload the browser sends when an input
+changes. Callbacks are measured twice: cold, with the figure cache cleared before each request, and warm. The input
+spaces are the ones the pages register with chart_callback. The calls are made in rounds, each calling every input
+of every benchmark once, so a slow spell of the machine is shared out between them.
+
+For each benchmark the best time, the p50, p95 and p99 latency, the peak memory allocated per call (from tracemalloc,
+in a separate pass so it does not slow down the timings) and the response size are reported. The results are written
+as JSON and compared with a saved baseline: a best time, allocation or size more than --threshold times its baseline
+value is reported as a regression and the script exits with status 1. The best time is the median over the inputs of
+each input's fastest call, which varies far less between runs than the percentiles. It also has to be more than the
+baseline's own spread (its p95 minus its p50) and --min-delta-ms above its baseline value, so noise on the machine
+is not reported. Latency is only checked when the baseline was recorded with the same --repeat.
+
+Run with: python benchmarks/bench_suite.py [--scale N] [--repeat N] [--output FILE] [--baseline FILE] [--save-baseline]
+[--threshold RATIO] [--min-delta-ms MS]
+e.g. python benchmarks/bench_suite.py --scale 20000 runs against 1.2 million synthetic rows.
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import platform
+from statistics import median, quantiles
+import sys
+import tempfile
+import time
+import tracemalloc
+from plotly.io.json import to_json_plotly
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+
+from app import app  # noqa: E402 - the pages register their callbacks when the app is imported
+from figures import data_store, figure_analysis, figure_course_level, figure_home  # noqa: E402
+from figures.figure_cache import figure_cache  # noqa: E402
+from pages import Analysis  # noqa: E402
+from services.clientside import CHARTS  # noqa: E402
+
+BASELINE = ROOT / 'benchmarks' / 'baseline.json'
+
+# Metrics checked against the baseline. The percentiles are reported but vary too much between runs to gate on;
+# latency is gated on best_ms instead, the median over the inputs of each input's fastest call.
+METRICS = ['best_ms', 'alloc_kb', 'bytes']
+
+
+def write_synthetic_csv(source, path, scale):
+    """
+    Writes the dataset repeated scale times.
+    """
+    header, *rows = source.read_text().splitlines(keepends=True)
+    with open(path, 'w') as file:
+        file.write(header)
+        for _ in range(scale):
+            file.writelines(rows)
+
+
+def figure_cases():
+    """
+    Returns (name, function, list of argument tuples) for every figure function, using the pages' input spaces.
+    """
+    snapshot = data_store.get_snapshot()
+    analysis_space = [(snapshot, feature, Analysis.time_periods[start:end + 1])
+                      for feature, (start, end) in CHARTS['line_chart_a'][1]]
+    return [
+        ('figure_home.pie_chart_total', figure_home.pie_chart_total, CHARTS['pie_chart_total'][1]),
+        ('figure_home.pie_chart_age', figure_home.pie_chart_age, CHARTS['pie_chart_age'][1]),
+        ('figure_course_level.bar_ethnicity Undergraduate', figure_course_level.bar_ethnicity,
+         [('Undergraduate', *args) for args in CHARTS['bar_u'][1]]),
+        ('figure_course_level.line_chart Undergraduate', figure_course_level.line_chart,
+         [('Undergraduate', *args) for args in CHARTS['line_u'][1]]),
+        ('figure_course_level.bar_ethnicity Postgraduate', figure_course_level.bar_ethnicity,
+         [('Postgraduate', *args) for args in CHARTS['bar_p'][1]]),
+        ('figure_course_level.line_chart Postgraduate', figure_course_level.line_chart,
+         [('Postgraduate', *args) for args in CHARTS['line_p'][1]]),
+        ('figure_analysis.line_chart_analysis', figure_analysis.line_chart_analysis, analysis_space),
+    ]
+
+
+def callback_payload(output_id, args):
+    """
+    Returns the request body the browser posts when the first input of a chart callback changes.
+    """
+    inputs = app.callback_map[f'{output_id}.figure']['inputs']
+    return {
+        'output': f'{output_id}.figure',
+        'outputs': {'id': output_id, 'property': 'figure'},
+        'inputs': [{**item, 'value': value} for item, value in zip(inputs, args)],
+        'changedPropIds': [f"{inputs[0]['id']}.{inputs[0]['property']}"],
+    }
+
+
+def summarize(samples, allocations, sizes):
+    """
+    Returns the latency percentiles and best time in milliseconds, the mean peak allocation in KB and the mean size
+    in bytes.
+
+    samples holds the times of each input's calls, one list per input.
+    """
+    cuts = quantiles([sample * 1000 for times in samples for sample in times], n=100, method='inclusive')
+    return {
+        'calls': sum(len(times) for times in samples),
+        'best_ms': round(median(min(times) * 1000 for times in samples), 4),
+        'p50_ms': round(cuts[49], 4),
+        'p95_ms': round(cuts[94], 4),
+        'p99_ms': round(cuts[98], 4),
+        'alloc_kb': round(sum(allocations) / len(allocations) / 1024, 2),
+        'bytes': round(sum(sizes) / len(sizes)),
+    }
+
+
+def measure(cases, repeat):
+    """
+    Times every case repeat times for every input, then measures its allocations once per input.
+
+    Each case is a (name, call, inputs, before) tuple. call returns the size of its output in bytes, and before, if
+    given, runs untimed with the same arguments ahead of every call. Every input is run once untimed first, so
+    one-off costs such as loading the plot template are not counted. The calls are made in rounds, each calling
+    every input of every case once, so a slow spell of the machine falls on a few rounds of every case rather than
+    on all the calls of one, and each input's fastest call is still a clean one.
+
+    Returns:
+    - results: dict, the summarize() of each case by name.
+    """
+    for _, call, inputs, before in cases:
+        for args in inputs:
+            if before:
+                before(*args)
+            call(*args)
+
+    samples = {name: [[] for _ in inputs] for name, _, inputs, _ in cases}
+    sizes = {name: [] for name, _, _, _ in cases}
+    for _ in range(repeat):
+        for name, call, inputs, before in cases:
+            for times, args in zip(samples[name], inputs):
+                if before:
+                    before(*args)
+                start = time.perf_counter()
+                size = call(*args)
+                times.append(time.perf_counter() - start)
+                sizes[name].append(size)
+
+    results = {}
+    for name, call, inputs, before in cases:
+        allocations = []
+        tracemalloc.start()
+        for args in inputs:
+            if before:
+                before(*args)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call(*args)
+            allocations.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+        results[name] = summarize(samples[name], allocations, sizes[name])
+    return results
+
+
+def run(repeat):
+    """
+    Runs every benchmark and returns a dictionary of results keyed by benchmark name.
+    """
+    cases = []
+    for name, function, inputs in figure_cases():
+        build = function.__wrapped__
+        cases.append((f'figure {name}', lambda *args, build=build: len(to_json_plotly(build(*args))), inputs, None))
+
+    client = app.server.test_client()
+    client.get('/')
+
+    def post(payload):
+        response = client.post('/_dash-update-component', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{payload['output']} failed with status {response.status_code}")
+        return len(response.data)
+
+    for output_id, (_, input_space) in CHARTS.items():
+        payloads = [(callback_payload(output_id, args),) for args in input_space]
+        # A cold call starts from an empty figure cache, and a warm one from the figure its own request just cached,
+        # as the other cases clear the cache in between
+        cases.append((f'callback {output_id} cold', post, payloads, lambda payload: figure_cache.clear()))
+        cases.append((f'callback {output_id} warm', post, payloads, post))
+    return measure(cases, repeat)
+
+
+def compare(results, baseline, threshold, min_delta_ms=0, metrics=METRICS):
+    """
+    Prints every result next to its baseline and returns the list of regressions in the given metrics.
+
+    A best time within the noise band of its baseline, the larger of min_delta_ms and the baseline's p95 minus its
+    p50, is not counted, whatever its ratio.
+    """
+    regressions = []
+    print(f"{'benchmark':48} {'calls':>6} {'best ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'alloc KB':>9}"
+          f" {'bytes':>7} {'best vs base':>13}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base and 'best_ms' not in base:
+            base = None
+            print(f'{name} has no best time in the baseline, record it again with --save-baseline')
+        ratio = f"{result['best_ms'] / base['best_ms']:12.2f}x" if base and base['best_ms'] else f"{'-':>13}"
+        print(f"{name:48} {result['calls']:6} {result['best_ms']:8.3f} {result['p50_ms']:8.3f} "
+              f"{result['p95_ms']:8.3f} {result['p99_ms']:8.3f} {result['alloc_kb']:9.1f} {result['bytes']:7} {ratio}")
+        for metric in metrics if base else []:
+            noise = max(min_delta_ms, base['p95_ms'] - base['p50_ms'])
+            if metric == 'best_ms' and result[metric] - base[metric] <= noise:
+                continue
+            if base[metric] and result[metric] > base[metric] * threshold:
+                regressions.append(f'{name}: {metric} {result[metric]} vs baseline {base[metric]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1, help='repeat the dataset rows this many times')
+    parser.add_argument('--repeat', type=int, default=20, help='times each input is timed')
+    parser.add_argument('--output', type=Path, default=Path('bench_results.json'), help='where to write the results')
+    parser.add_argument('--baseline', type=Path, default=BASELINE, help='the results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='also save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=1.5, help='ratio to the baseline counted as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='smallest increase of a best time over the baseline counted as a regression')
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if options.scale > 1:
+            path = Path(directory) / 'df_prepared.csv'
+            write_synthetic_csv(data_store.data_path, path, options.scale)
+            data_store.data_path = path
+        rows = len(data_store.get_snapshot().data)
+        results = run(options.repeat)
+
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'scale': options.scale,
+            'rows': rows,
+            'repeat': options.repeat,
+        },
+        'results': results,
+    }
+    options.output.write_text(json.dumps(report, indent=2))
+    if options.save_baseline:
+        options.baseline.write_text(json.dumps(report, indent=2))
+
+    baseline = json.loads(options.baseline.read_text()) if options.baseline.exists() else {'meta': {}, 'results': {}}
+    if baseline['meta'].get('scale', options.scale) != options.scale:
+        print(f"The baseline was recorded at scale {baseline['meta']['scale']}, not {options.scale}")
+    metrics = METRICS
+    if baseline['meta'].get('repeat', options.repeat) != options.repeat:
+        # The best of fewer calls is slower, so only the allocations and sizes are compared
+        metrics = [metric for metric in METRICS if metric != 'best_ms']
+        print(f"The baseline was recorded with --repeat {baseline['meta']['repeat']}, not {options.repeat}, so "
+              f"latency is not checked")
+    print(f"{rows} rows, results written to {options.output}")
+    regressions = compare(results, baseline['results'], options.threshold, options.min_delta_ms, metrics)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# Configuration for running the app in production with gunicorn.
+# Run from the repository root with: gunicorn
+# The app is imported and the data loaded once in the parent process, then the workers are forked from it and share
+# those memory pages copy-on-write. Settings can be overridden with the environment variables below.
+import multiprocessing
+import os
+
+# The Flask server of the Dash app in src/app.py
+wsgi_app = 'app:server'
+pythonpath = 'src'
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+
+# Worker processes, defaulted to one per CPU, and the threads handling requests in each of them
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# Import the app before forking the workers
+preload_app = True
+
+# Replace each worker after it has handled this many requests, with jitter so they are not all replaced at once.
+# A worker being replaced finishes its current requests first, waiting up to graceful_timeout seconds.
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+timeout = 60
+
+
+def when_ready(server):
+    # Runs in the parent process after the app is imported and before the first worker is forked
+    from app import app
+    from services.preload import preload
+    summary = preload(app)
+    if summary:
+        server.log.info('Warmed %(warmed)d chart states in %(seconds).2f s (%(failed)d failed, %(skipped)d over '
+                        'the time budget)', summary)
@@ -1,17 +1,50 @@
+import logging
+import os
 import dash
 from dash import Dash, html
 import dash_bootstrap_components as dbc
-
-# Variable that contains the external_stylesheet to use
-external_stylesheets = [dbc.themes.QUARTZ]
+from services.api import register_api
+from services.assets import register_assets
+from services.clientside import slices_store
+from services.compression import register_compression
+from services.metrics import register_metrics
+from services.preload import WARMUP, ready, start_warm_up
 
 # Define a variable that contains the meta tags
 meta_tags = [
     {"name": "viewport", "content": "width=device-width, initial-scale=1"},
 ]
 
-# Pass the stylesheet variable to the Dash app constructor
-app = Dash(__name__, external_stylesheets=external_stylesheets, meta_tags=meta_tags, use_pages=True)
+# The QUARTZ theme is vendored as assets/bootstrap-quartz.min.css, which Dash includes in every page
+# The page layouts are functions that build their figures on first visit, so callbacks are not validated
+# against every page layout up front
+app = Dash(__name__, meta_tags=meta_tags, use_pages=True,
+           suppress_callback_exceptions=True)
+
+# The Flask server, used by gunicorn in production (see gunicorn.conf.py)
+server = app.server
+
+
+# Health check for load balancers and the process manager, which reports not ready while the figures are warmed
+@server.route('/healthz')
+def healthz():
+    if not ready.is_set():
+        return {'status': 'warming'}, 503
+    return {'status': 'ok'}
+
+
+# Brotli or gzip for the responses built per request unless COMPRESS=0, and 304s for the layout and dependencies.
+# Registered first, so it runs after the other hooks have finished the response.
+register_compression(server)
+
+# Callback timings and cache statistics for Prometheus, unless METRICS=0
+register_metrics(server)
+
+# Read-only JSON API with the aggregates behind the charts
+register_api(server)
+
+# Precompressed JavaScript and CSS with long-lived content-hashed URLs, once built with build_assets.py
+register_assets(app)
 
 # Define the sidebar
 sidebar = html.Div(
@@ -50,12 +83,24 @@ page_content_style = {
     "padding": "2rem 1rem"
 }
 
-app.layout = html.Div([
-    # Sidebar
-    sidebar,
-    # Area where the page content is displayed
-    html.Div(id="page-content", style=page_content_style, children=[dash.page_container]),
-])
+
+# The layout is a function so the clientside chart data is only built when the first page is requested
+def serve_layout():
+    return html.Div([
+        # Sidebar
+        sidebar,
+        # Area where the page content is displayed
+        html.Div(id="page-content", style=page_content_style, children=[dash.page_container]),
+        # Chart data for the browser when the charts are updated clientside
+        *slices_store(),
+    ])
+
+
+app.layout = serve_layout
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # Warm the figures in the process serving requests, not in the debug reloader watching the files
+    if WARMUP and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up(app)
     app.run(debug=True)
@@ -0,0 +1,19 @@
+import argparse
+from app import app
+from services.assets import BUNDLE_DIR, build, vendor_theme
+
+# Compresses the app's JavaScript and CSS for services.assets to serve, run after installing or upgrading Dash.
+# Run from the repository root with: python src/build_assets.py
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the precompressed bundle of static assets.')
+    parser.add_argument('directory', nargs='?', default=BUNDLE_DIR,
+                        help='where to write the bundle, defaulted to build/assets; replaced if it exists')
+    parser.add_argument('--update-theme', action='store_true', help='download the theme stylesheet again first')
+    options = parser.parse_args()
+    if options.update_theme:
+        vendor_theme()
+    manifest = build(app, options.directory)
+    sizes = {encoding: sum(entry['sizes'].get(encoding, 0) for entry in manifest.values())
+             for encoding in ('identity', 'gzip', 'br')}
+    print(f"Wrote {len(manifest)} files to {options.directory}: {sizes['identity']:,} bytes, "
+          f"{sizes['gzip']:,} gzipped, {sizes['br']:,} with brotli")
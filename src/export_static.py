@@ -0,0 +1,18 @@
+import argparse
+from app import app
+from services.static_export import export
+
+# Writes every chart state of the app with a static HTML/JS shell, so it can be served without Python.
+# Run from the repository root with: python src/export_static.py build/static
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the dashboard as static files.')
+    parser.add_argument('directory', help='where to write the bundle; replaced if it holds a previous export')
+    parser.add_argument('--workers', type=int, help='worker processes, defaulted to the number of CPUs')
+    parser.add_argument('--force', action='store_true',
+                        help='replace the directory even if it holds something other than a previous export')
+    options = parser.parse_args()
+    try:
+        count = export(app, options.directory, options.workers, options.force)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f'Wrote {count} figures to {options.directory}')
@@ -0,0 +1,170 @@
+from itertools import product
+import threading
+from weakref import WeakKeyDictionary
+from figures.data_store import INDEX_COLUMNS, PCT_COLUMNS, get_snapshot
+from figures.figure_cache import figure_cache
+from figures.sqlite_store import SqliteSnapshot
+from figures.query_kernel import EncodedFrame
+
+# The columns summed for every combination of INDEX_COLUMNS
+MEASURES = ['n_total', *PCT_COLUMNS]
+
+_lock = threading.Lock()
+# The engine of every snapshot still in use; an entry goes when its snapshot is no longer referenced
+_engines = WeakKeyDictionary()
+
+
+class Aggregates:
+    """
+    The sum of every measure and the number of rows for each combination of INDEX_COLUMNS in a data snapshot.
+
+    The table is computed by the query kernel in a single pass over the encoded rows when the engine is created,
+    for every course level, QTS status and employment status at once. Every figure then reads its values from this table, which
+    has one row per combination, instead of filtering the rows of the snapshot again, so the work done per
+    snapshot grows with its number of rows and not with the number of callbacks. A mean over any set of
+    combinations is the sum of their sums divided by the sum of their row counts, the same as the mean of the
+    rows themselves.
+
+    Attributes:
+    - table: DataFrame, one row per combination present in the data, ordered by the INDEX_COLUMNS, with the
+      INDEX_COLUMNS, 'time_period_label', the summed MEASURES and the number of 'rows'. It must not be modified.
+    - averages: DataFrame, the same rows with the mean of each percentage in place of its sum.
+    """
+
+    def __init__(self, snapshot):
+        import numpy as np
+        import pandas as pd
+
+        encoded = EncodedFrame(snapshot.data, INDEX_COLUMNS, MEASURES)
+        counts, sums = encoded.group_sums(MEASURES)
+        present = np.flatnonzero(counts)
+        codes = encoded.decode(present)
+        table = {}
+        for column in INDEX_COLUMNS:
+            dictionary = encoded.dictionaries[column]
+            if column == 'time_period':
+                labels = [str(period) for period in dictionary]
+                table[column] = np.asarray(dictionary, dtype=np.int32)[codes[column]]
+                table['time_period_label'] = pd.Categorical.from_codes(codes[column], labels)
+            else:
+                table[column] = pd.Categorical.from_codes(codes[column], dictionary)
+        table.update({column: sums[column][present] for column in MEASURES})
+        table['rows'] = counts[present]
+        self.table = pd.DataFrame(table)
+        self.averages = self.table.assign(**self.table[PCT_COLUMNS].div(self.table['rows'], axis=0))
+        # The position of each combination in the table, so a query is a few dictionary lookups, and the columns
+        # as arrays, as summing a handful of entries with pandas would cost more than the lookups
+        keys = zip(*(self.table[column].tolist() for column in INDEX_COLUMNS))
+        self._positions = {key: position for position, key in enumerate(keys)}
+        # A plain dict rather than the snapshot's read-only mapping, so the engine can be pickled to the shared cache
+        self._values = dict(snapshot.values)
+        self._columns = {column: self.table[column].to_numpy() for column in [*INDEX_COLUMNS, *MEASURES, 'rows']}
+
+    def where(self, time_period=None, course_level_recoded=None, qts_status=None, employment_status=None):
+        """
+        Returns the combinations matching every given filter.
+
+        Each filter may be a single value, a list of accepted values, or None to accept any value.
+
+        Parameters:
+        - time_period: int or list, the academic years formatted as YYYYYY.
+        - course_level_recoded: str or list, the course levels.
+        - qts_status: str or list, the QTS statuses.
+        - employment_status: str or list, the employment statuses.
+
+        Returns:
+        - combinations: DataFrame, the matching rows of the table.
+        """
+        return self.table.iloc[self._rows(time_period, course_level_recoded, qts_status, employment_status)]
+
+    def _rows(self, *filters):
+        # The positions of the matching combinations, in table order
+        wanted = []
+        for column, value in zip(INDEX_COLUMNS, filters):
+            if value is None:
+                wanted.append(self._values[column])
+            elif isinstance(value, (list, tuple, set)):
+                wanted.append(list(dict.fromkeys(value)))
+            else:
+                wanted.append([value])
+        wanted[0] = [int(period) for period in wanted[0]]
+        positions = self._positions
+        return sorted(positions[key] for key in product(*wanted) if key in positions)
+
+    def sums(self, by, column='n_total', **filters):
+        """
+        Returns the sum of a measure for each value of a column, over the combinations matching the filters.
+
+        Parameters:
+        - by: str, the column to group by.
+        - column: str, the measure to sum, defaulted to 'n_total'.
+        - filters: the filters passed to where().
+
+        Returns:
+        - sums: DataFrame, with the columns by and column, ordered by the values of by.
+        """
+        import pandas as pd
+
+        rows = self._rows(*(filters.get(name) for name in INDEX_COLUMNS))
+        totals = {}
+        for key, value in zip(self._columns[by][rows], self._columns[column][rows]):
+            totals[key] = totals.get(key, 0) + value
+        keys = [key for key in self._values[by] if key in totals]
+        return pd.DataFrame({by: keys, column: [totals[key] for key in keys]})
+
+    def means(self, columns, **filters):
+        """
+        Returns the mean of some measures over every row of the combinations matching the filters.
+
+        Parameters:
+        - columns: list, the measures to average.
+        - filters: the filters passed to where().
+
+        Returns:
+        - means: Series, the mean of each measure indexed by its name, NaN when no row matches.
+        """
+        import pandas as pd
+
+        rows = self._rows(*(filters.get(name) for name in INDEX_COLUMNS))
+        count = self._columns['rows'][rows].sum()
+        means = [self._columns[column][rows].sum() / count if count else float('nan') for column in columns]
+        return pd.Series(means, index=columns)
+
+    def series(self, **filters):
+        """
+        Returns the mean of every percentage for each combination matching the filters, in time period order.
+
+        Parameters:
+        - filters: the filters passed to where().
+
+        Returns:
+        - series: DataFrame, the matching rows of averages.
+        """
+        positions = self._rows(*(filters.get(column) for column in INDEX_COLUMNS))
+        return self.averages.iloc[positions].sort_values('time_period_label', kind='stable')
+
+
+def aggregates(snapshot=None):
+    """
+    Returns the aggregation engine of a snapshot, building it on first use.
+
+    When SHARED_CACHE is on, an engine built by another worker process for the same data version is loaded from
+    the shared cache instead of being built again. A SqliteSnapshot has its own engine, which runs the queries
+    in its database.
+
+    Parameters:
+    - snapshot: DataSnapshot or SqliteSnapshot, defaulted to the snapshot of the current request from
+      get_snapshot().
+
+    Returns:
+    - engine: Aggregates or SqlAggregates, shared by every caller using the same snapshot.
+    """
+    snapshot = snapshot or get_snapshot()
+    if isinstance(snapshot, SqliteSnapshot):
+        return snapshot.engine
+    with _lock:
+        engine = _engines.get(snapshot)
+        if engine is None:
+            engine = _engines[snapshot] = figure_cache.shared_get_or_build(
+                snapshot.version, ('aggregates',), lambda: Aggregates(snapshot))
+    return engine
@@ -0,0 +1,149 @@
+# Stores the prepared dataset as Parquet files partitioned by geographic_level and time_period.
+# The CSV stays the ingest format: it is converted the first time the columnar copy is read and again whenever
+# it changes. Queries read only the columns they name, skip partitions that do not match their filters and
+# push the remaining filters down to the Parquet row groups.
+import json
+import os
+import shutil
+from figures.data_store import CATEGORICAL_COLUMNS, SCHEMA, build_lock, data_path, file_version
+
+# Columns used to split the dataset into directories, e.g. geographic_level=National/time_period=201718
+PARTITION_COLUMNS = ['geographic_level', 'time_period']
+
+# Records the version of the CSV a dataset was converted from
+VERSION_FILE = '_source_version.json'
+
+# Bytes of CSV parsed per batch while converting, so large files are never held in memory at once
+BLOCK_SIZE = 16 << 20
+
+
+def dataset_path(source=data_path):
+    """
+    Returns the directory holding the Parquet copy of a CSV file.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+
+    Returns:
+    - path: Path, the dataset directory next to the CSV, e.g. data/df_prepared_parquet.
+    """
+    return source.with_name(f'{source.stem}_parquet')
+
+
+def _arrow_type(dtype):
+    import pyarrow as pa
+    return {'int32': pa.int32(), 'uint8': pa.uint8(), 'category': pa.string()}[dtype]
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(column, _arrow_type(SCHEMA[column])) for column in PARTITION_COLUMNS]),
+                           flavor='hive')
+
+
+def _expression(filters):
+    # Combine {column: value or list of values} into one Arrow filter expression
+    import pyarrow.dataset as ds
+    expression = None
+    for column, value in (filters or {}).items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        condition = ds.field(column).isin(values)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def is_current(source=data_path, target=None):
+    """
+    Checks whether the Parquet copy was converted from the current version of the CSV.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the dataset directory, defaulted to the one next to the CSV.
+
+    Returns:
+    - current: bool, True if the dataset exists and matches the CSV.
+    """
+    target = target or dataset_path(source)
+    try:
+        with open(target / VERSION_FILE) as file:
+            return tuple(json.load(file)) == file_version(source)
+    except (OSError, ValueError):
+        return False
+
+
+def convert(source=data_path, target=None):
+    """
+    Converts the CSV to a Parquet dataset partitioned by PARTITION_COLUMNS.
+
+    The CSV is streamed in batches of BLOCK_SIZE bytes and only the columns in SCHEMA are kept. The dataset
+    is written to a staging directory first and then moved into place, so readers never see a partial copy.
+    The caller holds the exclusive build_lock() of the target, as read_columnar() does, so workers converting
+    the same change together do not swap the directory under each other.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the dataset directory, defaulted to the one next to the CSV.
+
+    Returns:
+    - target: Path, the dataset directory.
+    """
+    import pyarrow.csv as pv
+    import pyarrow.dataset as ds
+
+    target = target or dataset_path(source)
+    version = file_version(source)
+    column_types = {column: _arrow_type(dtype) for column, dtype in SCHEMA.items()}
+    reader = pv.open_csv(
+        source,
+        read_options=pv.ReadOptions(block_size=BLOCK_SIZE),
+        convert_options=pv.ConvertOptions(column_types=column_types, include_columns=list(SCHEMA)),
+    )
+
+    staging = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    ds.write_dataset(reader, staging, format='parquet', partitioning=_partitioning(),
+                     existing_data_behavior='overwrite_or_ignore')
+    with open(staging / VERSION_FILE, 'w') as file:
+        json.dump(version, file)
+
+    previous = target.with_name(f'{target.name}.{os.getpid()}.old')
+    if target.exists():
+        os.replace(target, previous)
+    os.replace(staging, target)
+    shutil.rmtree(previous, ignore_errors=True)
+    return target
+
+
+def read_columnar(columns=None, filters=None, source=data_path, target=None):
+    """
+    Reads part of the dataset from its Parquet copy, converting the CSV first if it has changed.
+
+    Only one process converts at a time; the others wait for it and then read its copy. The copy is read under
+    a shared lock, so it is never swapped mid-read.
+
+    Parameters:
+    - columns: list, the columns to read, defaulted to every column in SCHEMA.
+    - filters: dict, maps a column to the value or list of values to keep, e.g. {'time_period': [201718]}.
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the dataset directory, defaulted to the one next to the CSV.
+
+    Returns:
+    - data: DataFrame, the matching rows with the dtypes from SCHEMA.
+    """
+    import pyarrow.dataset as ds
+
+    target = target or dataset_path(source)
+    if not is_current(source, target):
+        with build_lock(target):
+            # Another worker may have converted the same change while this one waited for the lock
+            if not is_current(source, target):
+                convert(source, target)
+
+    columns = list(columns or SCHEMA)
+    parquet = ds.ParquetFileFormat(read_options={'dictionary_columns': [
+        column for column in CATEGORICAL_COLUMNS if column not in PARTITION_COLUMNS]})
+    with build_lock(target, shared=True):
+        dataset = ds.dataset(target, format=parquet, partitioning=_partitioning())
+        table = dataset.to_table(columns=columns, filter=_expression(filters))
+    return table.to_pandas().astype({column: SCHEMA[column] for column in columns})
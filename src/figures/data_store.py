@@ -0,0 +1,330 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import fcntl
+import logging
+from pathlib import Path
+from types import MappingProxyType
+import os
+import threading
+import time
+
+# Location of the prepared dataset shared by every figure and page
+data_path = Path(__file__).parent.parent.parent.joinpath("data", "df_prepared.csv")
+
+# Columns that only take a handful of distinct values are stored as categoricals
+CATEGORICAL_COLUMNS = [
+    'geographic_level',
+    'course_level_recoded',
+    'qts_status',
+    'employment_status',
+]
+
+# Percentages are whole numbers between 0 and 100 so they fit in a single byte
+PCT_COLUMNS = [
+    'pct_n_total',
+    'pct_total_age_u25',
+    'pct_total_age_25andover',
+    'pct_total_sex_m',
+    'pct_total_sex_f',
+    'pct_total_ethnic_asian',
+    'pct_total_ethnic_black',
+    'pct_total_ethnic_mixed_ethnicity',
+    'pct_total_ethnic_other',
+    'pct_total_ethnic_white',
+    'pct_total_ethnic_unknown',
+    'pct_total_disability',
+    'pct_total_nondisability',
+    'pct_total_disability_unknown',
+]
+
+# Explicit schema used when parsing the CSV. 'time_period' is always an integer such as 201718;
+# each snapshot adds a 'time_period_label' column holding the same value as text for chart axes.
+SCHEMA = {
+    'time_period': 'int32',
+    'n_total': 'int32',
+    **{column: 'category' for column in CATEGORICAL_COLUMNS},
+    **{column: 'uint8' for column in PCT_COLUMNS},
+}
+
+# Columns every figure filters on, in the order used for the keys of the aggregates
+INDEX_COLUMNS = ['time_period', 'course_level_recoded', 'qts_status', 'employment_status']
+
+# Set DATA_BACKEND=parquet to read the dataset from a partitioned Parquet copy of the CSV instead of the CSV itself,
+# DATA_BACKEND=mmap to map a binary snapshot of the CSV that all worker processes share, or DATA_BACKEND=sqlite to
+# query a SQLite copy of the CSV without loading its rows into memory
+DATA_BACKEND = os.environ.get('DATA_BACKEND', 'csv')
+
+# The geographic level shown by the dashboard; the Parquet backend reads only these partitions
+GEOGRAPHIC_LEVEL = 'National'
+
+# Seconds between checks of the data file for changes; set DATA_CHECK_INTERVAL to override
+CHECK_INTERVAL = float(os.environ.get('DATA_CHECK_INTERVAL', 1.0))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_snapshot = None
+_last_check = 0.0
+# The version of the data file that last failed to load, so it is not parsed again until the file changes
+_rejected_version = None
+# The background thread loading a changed data file, if one is running
+_reloader = None
+# The snapshot pinned for the current request by use_snapshot()
+_pinned = ContextVar('pinned_snapshot', default=None)
+
+
+class DataSnapshot:
+    """
+    An immutable snapshot of the parsed dataset.
+
+    The figures read their values from the aggregates engine built on the snapshot (see figures.aggregates), not
+    from its rows. Derived columns such as 'time_period_label' and the values each of the INDEX_COLUMNS takes are
+    computed once here, so figure functions never convert columns per call.
+
+    A snapshot cannot be changed once built: its attributes cannot be reassigned and the frame is only handed
+    out as Copy-on-Write views, so it can be shared between threads safely.
+
+    Attributes:
+    - data: DataFrame, a view of the dataset.
+    - version: tuple, identifies the file contents the snapshot was loaded from.
+    - values: mapping, maps each index column to the sorted values that occur in the data.
+    """
+
+    def __init__(self, data, version=None):
+        # Label the few distinct periods rather than converting every row, so no per-row strings are created
+        periods = data['time_period'].astype('category')
+        data = data.assign(time_period_label=periods.cat.rename_categories(periods.cat.categories.astype(str)))
+        values = {column: tuple(sorted(data[column].dropna().unique().tolist())) for column in INDEX_COLUMNS}
+
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'values', MappingProxyType(values))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('DataSnapshot is immutable')
+
+    @property
+    def data(self):
+        # A shallow Copy-on-Write copy, so changes made by the caller never reach the shared frame
+        return self._data.copy(deep=False)
+
+
+def read_data(path=data_path):
+    """
+    Parses the prepared dataset using the explicit schema.
+
+    With DATA_BACKEND=parquet the rows for GEOGRAPHIC_LEVEL are read from the Parquet copy of the CSV,
+    which is converted first if the CSV has changed. With DATA_BACKEND=mmap the columns are mapped from the
+    Arrow snapshot of the CSV, and with DATA_BACKEND=sqlite every row is read from the SQLite copy of the CSV;
+    both are likewise rebuilt if the CSV has changed.
+
+    Parameters:
+    - path: Path, the CSV file to read, defaulted to data/df_prepared.csv.
+
+    Returns:
+    - data: DataFrame, the parsed dataset.
+    """
+    # pandas is imported on first use so that starting the app does not wait for it
+    import pandas as pd
+
+    # Copy-on-Write makes shallow copies safe to hand out as read-only views. It is always on from pandas 3.
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option('mode.copy_on_write', True)
+    if DATA_BACKEND == 'parquet':
+        from figures.columnar_store import read_columnar
+        return read_columnar(filters={'geographic_level': GEOGRAPHIC_LEVEL}, source=path)
+    if DATA_BACKEND == 'mmap':
+        from figures.mmap_store import read_mapped
+        return read_mapped(source=path)
+    if DATA_BACKEND == 'sqlite':
+        from figures.sqlite_store import read_sqlite
+        return read_sqlite(source=path)
+    return pd.read_csv(path, dtype=SCHEMA)
+
+
+def file_version(path=data_path):
+    """
+    Returns the modification time and size of the data file, used to detect when it changes.
+
+    Parameters:
+    - path: Path, the CSV file to check, defaulted to data/df_prepared.csv.
+
+    Returns:
+    - version: tuple, (mtime in nanoseconds, size in bytes).
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def build_lock(target, shared=False, blocking=True):
+    """
+    Context manager that holds a lock on a copy of the data file across every process on the machine.
+
+    A process rebuilding the copy holds it exclusively, and one reading the copy holds it shared, so no worker
+    reads a copy while another one is swapping it, and two workers never rebuild it at once. The lock is taken on
+    a .lock file next to the copy, which is left in place.
+
+    Parameters:
+    - target: Path, the copy, e.g. data/df_prepared_parquet.
+    - shared: bool, whether to take the lock shared, for reading, rather than exclusively.
+    - blocking: bool, whether to wait for the lock rather than fail when another process holds it.
+
+    Raises:
+    - BlockingIOError: if blocking is False and the lock is held by another process.
+    """
+    with open(target.with_name(f'{target.name}.lock'), 'a') as file:
+        fcntl.flock(file, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def validate(data):
+    """
+    Checks that a parsed dataset has the columns and values the figures rely on.
+
+    Parameters:
+    - data: DataFrame, the parsed dataset.
+
+    Raises:
+    - ValueError: if a column is missing or has the wrong type, an index column has missing values, a percentage
+      is above 100 or there are no rows.
+    """
+    missing = [column for column in SCHEMA if column not in data.columns]
+    if missing:
+        raise ValueError(f'Missing columns: {", ".join(missing)}')
+    wrong = [column for column, dtype in SCHEMA.items() if str(data[column].dtype) != dtype]
+    if wrong:
+        raise ValueError(f'Columns with the wrong type: {", ".join(wrong)}')
+    if data.empty:
+        raise ValueError('The dataset has no rows')
+    if data[INDEX_COLUMNS].isna().any().any():
+        raise ValueError(f'Missing values in {", ".join(INDEX_COLUMNS)}')
+    if (data[PCT_COLUMNS] > 100).any().any():
+        raise ValueError('Percentages above 100')
+
+
+def load_snapshot(path=data_path):
+    """
+    Parses the data file and validates it.
+
+    With DATA_BACKEND=sqlite the file is loaded into its SQLite copy instead, if it has changed, and the snapshot
+    queries the database.
+
+    Parameters:
+    - path: Path, the CSV file to read, defaulted to data/df_prepared.csv.
+
+    Returns:
+    - snapshot: DataSnapshot or SqliteSnapshot, the dataset and its version.
+
+    Raises:
+    - ValueError: if the file cannot be parsed with the schema or fails validate().
+    """
+    if DATA_BACKEND == 'sqlite':
+        from figures.sqlite_store import load_sqlite
+        return load_sqlite(source=path)
+    version = file_version(path)
+    data = read_data(path)
+    validate(data)
+    return DataSnapshot(data, version)
+
+
+def _reload(version):
+    # Runs in a background thread; the live snapshot is replaced in a single assignment once the new one is ready
+    global _snapshot, _rejected_version, _reloader
+    try:
+        snapshot = load_snapshot(data_path)
+    except ValueError as error:
+        logger.warning('Keeping the current data, %s could not be loaded: %s', data_path, error)
+        with _lock:
+            _rejected_version = version
+            _reloader = None
+        return
+    except Exception as error:
+        # Not the file's fault, e.g. it was being replaced or is locked; the same version is tried again at the
+        # next check
+        logger.warning('Keeping the current data, %s could not be loaded this time: %s', data_path, error)
+        with _lock:
+            _reloader = None
+        return
+    with _lock:
+        _snapshot = snapshot
+        _reloader = None
+
+
+def current_snapshot():
+    """
+    Returns the live data snapshot, loading the dataset on first use.
+
+    The first load happens in the calling thread. After that the data file is checked at most once every
+    CHECK_INTERVAL seconds, and when its modification time or size has changed the new file is parsed and
+    validated in a background thread. Until it is ready, and for good if it fails validation, callers keep
+    getting the current snapshot; a load failing for another reason, such as an OSError, is tried again at the
+    next check, so no request waits for the reload. Caches derived from the data are keyed by
+    the snapshot version and are invalidated when the new snapshot is swapped in.
+
+    Returns:
+    - snapshot: DataSnapshot, the shared dataset and its version.
+    """
+    global _snapshot, _last_check, _reloader
+    if _snapshot is not None and time.monotonic() - _last_check < CHECK_INTERVAL:
+        return _snapshot
+    with _lock:
+        now = time.monotonic()
+        if _snapshot is None:
+            _snapshot = load_snapshot(data_path)
+            _last_check = now
+        elif now - _last_check >= CHECK_INTERVAL:
+            _last_check = now
+            try:
+                version = file_version(data_path)
+            except OSError:
+                # The file is being replaced; keep serving the current snapshot
+                version = _snapshot.version
+            if version not in (_snapshot.version, _rejected_version) and _reloader is None:
+                _reloader = threading.Thread(target=_reload, args=(version,), name='data-reload', daemon=True)
+                _reloader.start()
+        return _snapshot
+
+
+def get_snapshot():
+    """
+    Returns the data snapshot to use for the current request.
+
+    This is the snapshot pinned with use_snapshot() if there is one, so a request that started before a reload
+    finishes on the data it started with, and the live snapshot from current_snapshot() otherwise.
+
+    Returns:
+    - snapshot: DataSnapshot, the shared dataset and its version.
+    """
+    return _pinned.get() or current_snapshot()
+
+
+@contextmanager
+def use_snapshot(snapshot):
+    """
+    Context manager that makes get_snapshot() return the given snapshot in the current thread until it exits.
+
+    Parameters:
+    - snapshot: DataSnapshot, the snapshot to pin.
+    """
+    token = _pinned.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _pinned.reset(token)
+
+
+def get_data():
+    """
+    Returns a read-only view of the dataset.
+
+    Every caller receives a shallow copy that shares memory with the stored frame; Copy-on-Write means
+    any change a caller makes is applied to its own copy only.
+
+    Returns:
+    - data: DataFrame, a view of the shared dataset.
+    """
+    return get_snapshot().data
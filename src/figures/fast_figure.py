@@ -0,0 +1,247 @@
+# Builds Plotly figures as plain dictionaries.
+# The functions mirror the subset of the Plotly Express API used by the figure modules and produce the same
+# traces, colours and layout as px.pie, px.bar and px.line. They skip creating and validating graph objects,
+# so a figure can be returned from a callback and serialized straight away.
+from functools import lru_cache, wraps
+import json
+import plotly.io as pio
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+# Layout properties that update_layout() accepts in the short form, e.g. xaxis_tickangle
+COMPOUND_PROPERTIES = ('xaxis', 'yaxis', 'legend', 'title')
+
+# Called as build_hook(builder, args, kwargs) in place of each figure builder when set; services.metrics sets it
+# to time the figure stage of the chart callbacks
+build_hook = None
+
+
+def _builder(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if build_hook is None:
+            return function(*args, **kwargs)
+        return build_hook(function, args, kwargs)
+
+    return wrapper
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    return pio.templates[name].to_plotly_json()
+
+
+def _new_layout():
+    return {'template': _template(pio.templates.default)}
+
+
+def _label(labels, column):
+    return (labels or {}).get(column, column)
+
+
+def _plain(value):
+    # Convert numpy arrays and pandas Series to lists so the figure holds only JSON types
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def _groups(data, column, category_orders):
+    # Group values in the order Plotly Express uses: category_orders first, then order of appearance
+    present = _unique(_plain(data[column]))
+    ordered = [value for value in (category_orders or {}).get(column, []) if value in present]
+    return ordered + [value for value in present if value not in ordered]
+
+
+def _color_map(values, color_discrete_map, color_discrete_sequence):
+    # Plotly Express assigns unmapped values the next colour in the sequence, counting mapped values too
+    sequence = color_discrete_sequence or _template(pio.templates.default)['layout']['colorway']
+    val_map = dict(color_discrete_map or {})
+    for value in values:
+        if value not in val_map:
+            val_map[value] = sequence[len(val_map) % len(sequence)]
+    return val_map
+
+
+def _cartesian_figure(data, x, y, color, title, labels, category_orders, color_discrete_map, trace):
+    x_label, y_label = _label(labels, x), _label(labels, y)
+    hovertemplate = f'{x_label}=%{{x}}<br>{y_label}=%{{y}}<extra></extra>'
+
+    if color is None:
+        groups = [(None, data)]
+        colors = _color_map([None], {}, None)
+    else:
+        values = _groups(data, color, category_orders)
+        groups = [(value, data[data[color] == value]) for value in values]
+        colors = _color_map(values, color_discrete_map, None)
+
+    traces = []
+    for value, rows in groups:
+        name = '' if value is None else value
+        prefix = f'{_label(labels, color)}={value}<br>' if color not in (None, x, y) else ''
+        traces.append({
+            'hovertemplate': prefix + hovertemplate,
+            'legendgroup': name,
+            'name': name,
+            'orientation': 'v',
+            'showlegend': color is not None,
+            'x': _plain(rows[x]),
+            'xaxis': 'x',
+            'y': _plain(rows[y]),
+            'yaxis': 'y',
+            **trace(colors[value]),
+        })
+
+    layout = _new_layout()
+    layout['xaxis'] = {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': x_label}}
+    layout['yaxis'] = {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': y_label}}
+    if x == color or x in (category_orders or {}):
+        layout['xaxis']['categoryorder'] = 'array'
+        layout['xaxis']['categoryarray'] = _groups(data, x, category_orders)
+    layout['legend'] = {'tracegroupgap': 0}
+    if color is not None:
+        layout['legend']['title'] = {'text': _label(labels, color)}
+    if title is not None:
+        layout['title'] = {'text': title}
+    return {'data': traces, 'layout': layout}
+
+
+@_builder
+def pie(data, names, values, title=None, labels=None, color_discrete_sequence=None):
+    """
+    Generates a pie chart in the same form as px.pie.
+
+    Parameters:
+    - data: DataFrame, one row per slice.
+    - names: str, the column holding the slice labels.
+    - values: str, the column holding the slice sizes.
+    - title: str, the chart title.
+    - labels: dict, display names for the columns.
+    - color_discrete_sequence: list, the slice colours.
+
+    Returns:
+    - fig: dict, the figure.
+    """
+    trace = {
+        'domain': {'x': [0.0, 1.0], 'y': [0.0, 1.0]},
+        'hovertemplate': f'{_label(labels, names)}=%{{label}}<br>{_label(labels, values)}=%{{value}}<extra></extra>',
+        'labels': _plain(data[names]),
+        'legendgroup': '',
+        'name': '',
+        'showlegend': True,
+        'values': _plain(data[values]),
+        'type': 'pie',
+    }
+    layout = _new_layout()
+    layout['legend'] = {'tracegroupgap': 0}
+    if title is not None:
+        layout['title'] = {'text': title}
+    if color_discrete_sequence is not None:
+        layout['piecolorway'] = list(color_discrete_sequence)
+    return {'data': [trace], 'layout': layout}
+
+
+@_builder
+def bar(data, x, y, title=None, labels=None, color=None, color_discrete_map=None, category_orders=None):
+    """
+    Generates a vertical bar chart in the same form as px.bar.
+
+    Parameters:
+    - data: DataFrame, the values to plot.
+    - x: str, the column on the x-axis.
+    - y: str, the column on the y-axis.
+    - title: str, the chart title.
+    - labels: dict, display names for the columns.
+    - color: str, the column used to split the bars into coloured traces.
+    - color_discrete_map: dict, fixed colours for values of the color column.
+    - category_orders: dict, the order of values for any column.
+
+    Returns:
+    - fig: dict, the figure.
+    """
+    def trace(trace_color):
+        return {'marker': {'color': trace_color, 'pattern': {'shape': ''}}, 'textposition': 'auto', 'type': 'bar'}
+
+    fig = _cartesian_figure(data, x, y, color, title, labels, category_orders, color_discrete_map, trace)
+    fig['layout']['barmode'] = 'relative'
+    return fig
+
+
+@_builder
+def line(data, x, y, title=None, labels=None, color=None, color_discrete_map=None, category_orders=None,
+         markers=False):
+    """
+    Generates a line chart in the same form as px.line.
+
+    Parameters:
+    - data: DataFrame, the values to plot.
+    - x: str, the column on the x-axis.
+    - y: str, the column on the y-axis.
+    - title: str, the chart title.
+    - labels: dict, display names for the columns.
+    - color: str, the column used to split the data into coloured lines.
+    - color_discrete_map: dict, fixed colours for values of the color column.
+    - category_orders: dict, the order of values for any column.
+    - markers: bool, whether to draw a marker at every point.
+
+    Returns:
+    - fig: dict, the figure.
+    """
+    def trace(trace_color):
+        return {
+            'line': {'color': trace_color, 'dash': 'solid'},
+            'marker': {'symbol': 'circle'},
+            'mode': 'lines+markers' if markers else 'lines',
+            'type': 'scatter',
+        }
+
+    return _cartesian_figure(data, x, y, color, title, labels, category_orders, color_discrete_map, trace)
+
+
+@_builder
+def update_layout(fig, **kwargs):
+    """
+    Updates the layout of a figure dictionary in the same way as Figure.update_layout.
+
+    Nested dictionaries are merged into the existing layout, and the short form is accepted for the
+    properties in COMPOUND_PROPERTIES, e.g. xaxis_tickangle=-30.
+
+    Parameters:
+    - fig: dict, the figure to update in place.
+    - kwargs: the layout properties to set.
+
+    Returns:
+    - fig: dict, the updated figure.
+    """
+    layout = fig['layout']
+    for key, value in kwargs.items():
+        prefix, _, rest = key.partition('_')
+        if prefix in COMPOUND_PROPERTIES and rest:
+            key, value = prefix, {rest: value}
+        if isinstance(value, dict):
+            target = layout.setdefault(key, {})
+            for name, item in value.items():
+                target[name] = _plain(item)
+        else:
+            layout[key] = _plain(value)
+    return fig
+
+
+def to_json(fig):
+    """
+    Encodes a figure dictionary as JSON, using orjson when it is installed.
+
+    Parameters:
+    - fig: dict, the figure.
+
+    Returns:
+    - json: bytes, the encoded figure.
+    """
+    if orjson is not None:
+        return orjson.dumps(fig, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(fig).encode()
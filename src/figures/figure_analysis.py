@@ -1,54 +1,60 @@
-from pathlib import Path
-import pandas as pd
-import plotly.express as px
+from figures import fast_figure
+from figures.aggregates import aggregates
+from figures.figure_cache import cached_figure
 
-# Extract the data
-data_path = Path(__file__).parent.parent.parent.joinpath("data", "df_prepared.csv")
 
-data = pd.read_csv(data_path)
+def metric_rows(data, time_period_range, qts_status="Awarded QTS"):
+    """
+    Returns the mean of every percentage for undergraduates and postgraduates with a QTS status in a range of
+    academic years, for each combination of time period, course level and employment status.
 
+    Parameters:
+    - data: DataSnapshot, the indexed dataset containing the information.
+    - time_period_range: list, a list of strings representing the range of academic years to include.
+    - qts_status: str, the QTS status to filter on, defaulted to "Awarded QTS".
 
+    Returns:
+    - filtered_data: DataFrame, the matching combinations in time period order.
+    """
+    # Exclude "total" category from course_level_recoded
+    course_levels = [level for level in data.values['course_level_recoded'] if 'total' not in level.lower()]
+    # Filter data based on QTS status and the specified time period range, sorted by time_period to ensure the
+    # order is correct on the x-axis
+    filtered_data = aggregates(data).series(time_period=time_period_range, course_level_recoded=course_levels,
+                                            qts_status=qts_status)
+    return filtered_data
+
+
+@cached_figure
 def line_chart_analysis(data, selected_feature, time_period_range, qts_status="Awarded QTS"):
     """
     Generates a line chart to compare selected metrics of undergraduates and postgraduates who were awarded QTS.
 
     Parameters:
-    - data: DataFrame, the dataset containing the information.
+    - data: DataSnapshot, the indexed dataset containing the information.
     - selected_feature: str, one of the metrics to be compared.
     - time_period_range: list, a list of strings representing the range of academic years to include in the chart.
     - qts_status: str, the QTS status to filter on, defaulted to "Awarded QTS".
 
     Returns:
-    - fig: A Plotly Express figure object representing the line chart.
+    - fig: A figure dictionary representing the line chart.
     """
-    # Convert 'time_period' to string
-    data['time_period'] = data['time_period'].astype(str)
-    # Filter data based on QTS status and the specified time period range
-    filtered_data = data[
-        (data['qts_status'] == qts_status) &
-        (data['time_period'].isin(time_period_range))
-    ]
-
-    # Exclude "total" category from course_level_recoded
-    filtered_data = filtered_data[~filtered_data['course_level_recoded'].str.lower().str.contains('total')]
-
-    # Sort the data by time_period to ensure the order is correct on the x-axis
-    filtered_data = filtered_data.sort_values('time_period')
+    filtered_data = metric_rows(data, time_period_range, qts_status)
 
     # Define color mapping for 'Postgraduate' and 'Undergraduate'
     color_discrete_map = {'Postgraduate': 'blue', 'Undergraduate': 'magenta'}
 
-    # Create the line chart
-    fig = px.line(
+    # Create the line chart, using the text labels of 'time_period' precomputed in the snapshot
+    fig = fast_figure.line(
         filtered_data,
-        x='time_period',
+        x='time_period_label',
         y=selected_feature,
         color='course_level_recoded',
         title=f'Comparison of {selected_feature} by Course Level Over Time',
-        labels={'time_period': 'Academic Year', selected_feature: f'Percentage of {selected_feature}'},
+        labels={'time_period_label': 'Academic Year', selected_feature: f'Percentage of {selected_feature}'},
         markers=True,
         color_discrete_map=color_discrete_map,
-        category_orders={"time_period": time_period_range}  # Ensure the x-axis respects the order of academic years
+        category_orders={"time_period_label": time_period_range}  # Ensure the x-axis respects the order of academic years
     )
 
     return fig
@@ -0,0 +1,267 @@
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import logging
+import os
+from pathlib import Path
+import threading
+from figures.data_store import DataSnapshot, current_snapshot, get_snapshot, use_snapshot
+from figures.sqlite_store import SqliteSnapshot
+
+# Maximum number of figures kept in memory; set FIGURE_CACHE_SIZE to override
+CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 256))
+
+# Set SHARED_CACHE=1 to also keep figures and aggregates in a cache on disk shared by every worker process
+SHARED_CACHE = os.environ.get('SHARED_CACHE', '0') == '1'
+
+# Where the shared cache is stored; set SHARED_CACHE_DIR to override
+SHARED_CACHE_DIR = Path(os.environ.get('SHARED_CACHE_DIR',
+                                       Path(__file__).parent.parent.parent.joinpath('.cache', 'figures')))
+
+# Bytes the shared cache may use before the oldest entries are evicted; set SHARED_CACHE_BYTES to override
+SHARED_CACHE_BYTES = int(os.environ.get('SHARED_CACHE_BYTES', 256 << 20))
+
+# Seconds an entry of the shared cache is kept; set SHARED_CACHE_TTL to override
+SHARED_CACHE_TTL = float(os.environ.get('SHARED_CACHE_TTL', 24 * 3600))
+
+# Seconds a lookup waits for the same figure being built by another request before building it itself;
+# set COALESCE_TIMEOUT to override
+COALESCE_TIMEOUT = float(os.environ.get('COALESCE_TIMEOUT', 30))
+
+logger = logging.getLogger(__name__)
+
+# Returned by the shared cache for a missing key, as None is a valid value
+_MISSING = object()
+
+
+class _Flight:
+    # A build in progress, which the other lookups of the same key wait for and share
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class FigureCache:
+    """
+    A thread-safe, size-bounded cache of figures that evicts the least recently used entry when full.
+
+    Every entry belongs to one version of the data file. When the shared data snapshot changes version
+    the whole cache is cleared, so figures are never served from out of date data. Requests still pinned to
+    an older snapshot build their figures without the cache rather than clearing it again.
+
+    A lookup that misses can be answered from a second level shared by every process, such as a diskcache.Cache,
+    before the figure is built. Its keys include the data version, so entries of an older version are never
+    read and age out through the shared cache's own expiry and size limit.
+
+    Concurrent lookups of the same missing key are coalesced: the first one builds the value and the others
+    wait for it and share its result, or its exception if the build fails. A lookup that has waited timeout
+    seconds builds the value itself, so a stuck build cannot hold up every request for that figure.
+
+    Attributes:
+    - maxsize: int, the maximum number of entries kept.
+    - hits: int, the number of lookups answered from the cache.
+    - misses: int, the number of lookups not in this process's cache.
+    - shared: the cache shared between processes, or None.
+    - shared_hits: int, the number of misses answered from the shared cache.
+    - coalesced: int, the number of misses answered by waiting for a build already in progress.
+    - timeout: float, the seconds a lookup waits for a build in progress.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, shared=None, timeout=COALESCE_TIMEOUT):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.shared = shared
+        self.shared_hits = 0
+        self.coalesced = 0
+        self.timeout = timeout
+        self.version = None
+        self._entries = OrderedDict()
+        # The builds in progress, by data version and key
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached value for key, calling build() to create it if it is not cached.
+
+        Parameters:
+        - key: tuple, the normalized arguments identifying the value.
+        - build: callable, creates the value when it is not cached.
+
+        Returns:
+        - value: the cached or newly built value.
+        """
+        snapshot = get_snapshot()
+        with self._lock:
+            if snapshot.version != self.version and snapshot is current_snapshot():
+                self._entries.clear()
+                self.version = snapshot.version
+            if snapshot.version == self.version and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            flight_key = (snapshot.version, key)
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[flight_key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(self.timeout):
+                with self._lock:
+                    self.coalesced += 1
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            logger.warning('Building %s after waiting %s seconds for another request to build it', key[0],
+                           self.timeout)
+            with use_snapshot(snapshot):
+                return self.shared_get_or_build(snapshot.version, key, build)
+
+        # Build from the snapshot the lookup was made for, even if a new one is swapped in meanwhile
+        try:
+            with use_snapshot(snapshot):
+                value = self.shared_get_or_build(snapshot.version, key, build)
+        except BaseException as error:
+            flight.error = error
+            with self._lock:
+                del self._flights[flight_key]
+            flight.done.set()
+            raise
+
+        flight.value = value
+        with self._lock:
+            if snapshot.version == self.version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            del self._flights[flight_key]
+        flight.done.set()
+        return value
+
+    def shared_get_or_build(self, version, key, build):
+        """
+        Returns the value for key and a data version from the shared cache, calling build() and storing its result
+        there if it is missing. Without a shared cache, or if it fails, the value is just built.
+
+        Parameters:
+        - version: tuple, the version of the data the value is built from.
+        - key: tuple, the normalized arguments identifying the value.
+        - build: callable, creates the value when it is not cached.
+
+        Returns:
+        - value: the shared or newly built value.
+        """
+        if self.shared is None:
+            return build()
+        shared_key = hashlib.sha256(repr((version, key)).encode()).hexdigest()
+        try:
+            value = self.shared.get(shared_key, default=_MISSING)
+        except Exception as error:
+            logger.warning('Could not read the shared cache: %s', error)
+            return build()
+        if value is not _MISSING:
+            with self._lock:
+                self.shared_hits += 1
+            return value
+
+        value = build()
+        try:
+            self.shared.set(shared_key, value, expire=SHARED_CACHE_TTL)
+        except Exception as error:
+            logger.warning('Could not write to the shared cache: %s', error)
+        return value
+
+    def clear(self):
+        """
+        Removes every entry of this process's cache and resets the hit and miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.shared_hits = 0
+            self.coalesced = 0
+
+    def cache_info(self):
+        """
+        Returns the cache statistics.
+
+        Returns:
+        - info: dict, the hits, misses, shared cache hits, coalesced misses, current size and maximum size of the
+          cache.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'shared_hits': self.shared_hits,
+                    'coalesced': self.coalesced, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+def open_shared_cache(directory=SHARED_CACHE_DIR, size_limit=SHARED_CACHE_BYTES):
+    """
+    Opens the cache on disk that worker processes share.
+
+    diskcache stores the entries in SQLite with large values in separate files, so writes are atomic and any
+    number of processes and threads can read and write at once. Once the cache holds more than size_limit bytes
+    the least recently stored entries are evicted.
+
+    Parameters:
+    - directory: Path, where the cache is stored, defaulted to .cache/figures.
+    - size_limit: int, the most bytes the cache may use.
+
+    Returns:
+    - cache: diskcache.Cache, the shared cache.
+    """
+    import diskcache
+    return diskcache.Cache(directory, size_limit=size_limit)
+
+
+# The cache shared by every figure function
+figure_cache = FigureCache(shared=open_shared_cache() if SHARED_CACHE else None)
+
+
+def normalize(value):
+    """
+    Converts a figure argument into a hashable form so equal arguments give equal cache keys.
+
+    Lists and tuples become tuples, sets become frozensets and a DataSnapshot or SqliteSnapshot is replaced by its
+    version.
+
+    Parameters:
+    - value: the argument passed to a figure function.
+
+    Returns:
+    - value: the hashable equivalent of the argument.
+    """
+    if isinstance(value, (DataSnapshot, SqliteSnapshot)):
+        return ('DataSnapshot', value.version)
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(normalize(item) for item in value)
+    return value
+
+
+def cached_figure(function):
+    """
+    Decorator that memoizes a figure function in the shared figure cache.
+
+    The returned figures are shared between callers and must not be modified.
+
+    Parameters:
+    - function: callable, the figure function to wrap.
+
+    Returns:
+    - wrapper: callable, the memoized figure function.
+    """
+    name = f'{function.__module__}.{function.__qualname__}'
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (name, normalize(args), normalize(tuple(sorted(kwargs.items()))))
+        return figure_cache.get_or_build(key, lambda: function(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,136 @@
+from figures.aggregates import aggregates
+from figures import fast_figure
+from figures.figure_cache import cached_figure
+
+# The course levels with a page of their own
+COURSE_LEVELS = ['Undergraduate', 'Postgraduate']
+
+# The group named in the title of each level's bar chart. The two titles have always been the wrong way round;
+# they are kept so the charts do not change.
+BAR_TITLE_GROUPS = {'Undergraduate': 'Postgraduates', 'Postgraduate': 'Undergraduates'}
+
+
+def ethnicity_breakdown(course_level, time_period):
+    """
+    Returns the mean percentage of students of a course level awarded QTS in each ethnic group for a time period.
+
+    Parameters:
+    - course_level: str, one of the COURSE_LEVELS.
+    - time_period: int, the academic year for filtering the data, formatted as YYYYYY.
+
+    Returns:
+    - ethnicity_data: DataFrame, with the columns 'Ethnicity', holding the pct_total_ethnic_* column names, and
+      'Percentage'.
+    """
+    ethnicity_columns = [
+        'pct_total_ethnic_asian',
+        'pct_total_ethnic_black',
+        'pct_total_ethnic_mixed_ethnicity',
+        'pct_total_ethnic_other',
+        'pct_total_ethnic_white',
+        'pct_total_ethnic_unknown'
+    ]
+    # Average over the students of the course level who were awarded QTS in the specific time period
+    ethnicity_data = aggregates().means(ethnicity_columns, time_period=time_period,
+                                        course_level_recoded=course_level, qts_status='Awarded QTS').reset_index()
+    ethnicity_data.columns = ['Ethnicity', 'Percentage']
+    return ethnicity_data
+
+
+@cached_figure
+def bar_ethnicity(course_level, time_period):
+    """
+    Generates an interactive bar chart for the percentage of students of a course level awarded QTS by their ethnicity for a given time period.
+
+    Parameters:
+    - course_level: str, one of the COURSE_LEVELS.
+    - time_period: int, the academic year for filtering the data, formatted as YYYYYY.
+    """
+    ethnicity_data = ethnicity_breakdown(course_level, time_period)
+
+    # Create a color mapping for each ethnicity
+    color_discrete_map = {
+        'pct_total_ethnic_asian': 'blue',
+        'pct_total_ethnic_black': 'green',
+        'pct_total_ethnic_mixed_ethnicity': 'red',
+        'pct_total_ethnic_other': 'cyan',
+        'pct_total_ethnic_white': 'magenta',
+        'pct_total_ethnic_unknown': 'yellow'
+    }
+
+    # Clean up the 'Ethnicity' column to have nicer labels
+    ethnicity_data['Ethnicity'] = ethnicity_data['Ethnicity'].str.replace('pct_total_', '')
+
+    # Plotting with the fast figure builders
+    fig = fast_figure.bar(ethnicity_data, x='Ethnicity', y='Percentage',
+                          title=f'Percentage of {BAR_TITLE_GROUPS[course_level]} Awarded QTS by Ethnicity ({time_period})',
+                          labels={'Ethnicity': 'Ethnicity', 'Percentage': 'Percentage (%)'},
+                          color='Ethnicity',  # Assign colors based on the 'Ethnicity' column
+                          color_discrete_map=color_discrete_map)
+
+    # Update the layout to rotate the x-axis labels to prevent overlap
+    fast_figure.update_layout(
+        fig,
+        xaxis_tickangle=-30  # Rotate labels by 45 degrees
+    )
+
+    return fig
+
+
+def yearly_totals(course_level, feature):
+    """
+    Returns the total number of students of a course level (n_total) in each time period, filtered based on the selected feature.
+
+    Parameters:
+    - course_level: str, one of the COURSE_LEVELS.
+    - feature: str, one of 'Awarded QTS', 'Not awarded QTS', or 'Teaching in a state-funded school'
+
+    Returns:
+    - grouped_data: DataFrame, with the columns 'time_period' and 'n_total', in time period order.
+    """
+    # Filter data based on the feature selected
+    if feature in ['Awarded QTS', 'Not awarded QTS']:
+        filters = {'qts_status': feature}
+    else:
+        filters = {'employment_status': feature}
+
+    # Sum the total numbers of each time period
+    grouped_data = aggregates().sums('time_period', course_level_recoded=course_level, **filters)
+    return grouped_data
+
+
+@cached_figure
+def line_chart(course_level, feature):
+    """
+    Generates a line chart displaying the total number of students of a course level (n_total)
+    over all time periods, filtered based on the selected feature.
+
+    Parameters:
+    - course_level: str, one of the COURSE_LEVELS.
+    - feature: str, one of 'Awarded QTS', 'Not awarded QTS', or 'Teaching in a state-funded school'
+
+    Returns:
+    - fig: A figure dictionary representing the line chart.
+    """
+    grouped_data = yearly_totals(course_level, feature)
+
+    # Convert the 'time_period' column to string to ensure no decimals are shown on the x-axis
+    grouped_data['time_period'] = grouped_data['time_period'].astype(str)
+
+    # Generate the line chart
+    fig = fast_figure.line(grouped_data, x='time_period', y='n_total',
+                           title=f'Total Number of {course_level}s Over Time ({feature})',
+                           labels={'time_period': 'Academic Year', 'n_total': f'Total Number of {course_level}s'},
+                           markers=True)
+
+    # Update the layout to customize the x-axis tick labels
+    fast_figure.update_layout(
+        fig,
+        xaxis = {
+            'tickmode': 'array',
+            'tickvals': grouped_data['time_period'],
+            'ticktext': grouped_data['time_period']
+        }
+    )
+
+    return fig
@@ -1,13 +1,31 @@
-from pathlib import Path
-import pandas as pd
-import plotly.express as px
+from figures.aggregates import aggregates
+from figures.data_store import get_snapshot
+from figures import fast_figure
+from figures.figure_cache import cached_figure
 
-# Extract the data
-data_path = Path(__file__).parent.parent.parent.joinpath("data", "df_prepared.csv")
 
-data = pd.read_csv(data_path)
+def qts_distribution(time_period):
+    """
+    Returns the number of undergraduates and postgraduates awarded QTS in a time period.
+
+    Parameters:
+    - time_period: int, the academic year for filtering the data, formatted as YYYYYY.
+
+    Returns:
+    - distribution: DataFrame, with the columns 'Course Level' and 'Total'.
+    """
+    snapshot = get_snapshot()
+    # Filter data for the specific time period, for those who were awarded QTS
+    # and exclude the 'Total' category to get only undergraduates and postgraduates
+    course_levels = [level for level in snapshot.values['course_level_recoded'] if level != 'Total']
+    # Sum up the totals of each course level
+    distribution = aggregates().sums('course_level_recoded', time_period=time_period,
+                                     course_level_recoded=course_levels, qts_status='Awarded QTS')
+    distribution.columns = ['Course Level', 'Total']
+    return distribution
 
 
+@cached_figure
 def pie_chart_total(time_period):
     """
     Generates an interactive pie chart showing the number of undergraduates and postgraduates awarded QTS.
@@ -15,25 +33,18 @@ def pie_chart_total(time_period):
     Parameters:
     - time_period: str, the academic year for filtering the data, formatted as YYYYYY.
     """
-    # Filter data for the specific time period, for those who were awarded QTS
-    # and exclude the 'Total' category to get only undergraduates and postgraduates
-    filtered_data = data[(data['time_period'] == time_period) &
-                         (data['qts_status'] == 'Awarded QTS') &
-                         (~data['course_level_recoded'].isin(['Total']))]
-
-    # Group by course level and sum up the totals
-    distribution = filtered_data.groupby(['course_level_recoded'])['n_total'].sum().reset_index()
-    distribution.columns = ['Course Level', 'Total']
+    distribution = qts_distribution(time_period)
 
     custom_colors = ['#EB89B5', '#330C73', '#FFD700', '#C1E1C1', '#6A0DAD']
-    # Plotting with Plotly Express
-    fig = px.pie(distribution, names='Course Level', values='Total',
-                 title=f'Distribution of Awarded QTS Among Course Levels ({time_period})',
-                 labels={'Course Level': 'Course Level', 'Total': 'Number Awarded QTS'},
-                 color_discrete_sequence=custom_colors)
+    # Plotting with the fast figure builders
+    fig = fast_figure.pie(distribution, names='Course Level', values='Total',
+                          title=f'Distribution of Awarded QTS Among Course Levels ({time_period})',
+                          labels={'Course Level': 'Course Level', 'Total': 'Number Awarded QTS'},
+                          color_discrete_sequence=custom_colors)
 
     # Here's the updated layout configuration for a transparent background
-    fig.update_layout(
+    fast_figure.update_layout(
+        fig,
         paper_bgcolor='rgba(0,0,0,0)',
         plot_bgcolor='rgba(0,0,0,0)',
         # Additional style settings as needed
@@ -42,24 +53,22 @@ def pie_chart_total(time_period):
     return fig
 
 
-def pie_chart_age(time_period, course_level):
+def age_split(time_period, course_level):
     """
-    Generates an interactive pie chart for the distribution of percentage total age under 25 and 25 and over
-    with awarded QTS, with a checklist of undergraduates and postgraduates and a dropdown for time period.
+    Returns the mean percentage of those awarded QTS aged under 25 and aged 25 and over.
 
     Parameters:
-    - time_period: str, the academic year for filtering the data, formatted as YYYYYY.
-    - course_level: list, the course levels to include in the chart.
-    """
-    # Filter data for the specific time period, awarded QTS, and the selected course levels
-    filtered_data = data[(data['time_period'] == time_period) &
-                         (data['qts_status'] == 'Awarded QTS') &
-                         (data['course_level_recoded'].isin(course_level))]
+    - time_period: int, the academic year for filtering the data, formatted as YYYYYY.
+    - course_level: list, the course levels to include.
 
+    Returns:
+    - age_distribution: DataFrame, with the columns 'Age Group' and 'Percentage'.
+    """
     # Assuming the data has columns for age distribution percentages named 'pct_total_age_u25' and 'pct_total_age_25andover'
     age_columns = ['pct_total_age_u25', 'pct_total_age_25andover']
-    # Calculate the mean of the percentages as we are showing distribution
-    age_distribution = filtered_data[age_columns].mean().reset_index()
+    # Calculate the mean of the percentages for the specific time period, awarded QTS, and the selected course levels
+    age_distribution = aggregates().means(age_columns, time_period=time_period, course_level_recoded=course_level,
+                                          qts_status='Awarded QTS').reset_index()
     age_distribution.columns = ['Age Group', 'Percentage']
 
     # Map age group columns to a more readable form if necessary
@@ -67,17 +76,32 @@ def pie_chart_age(time_period, course_level):
         'pct_total_age_u25': 'Percentage age under 25',
         'pct_total_age_25andover': 'Percentage age 25 and Over'
     })
+    return age_distribution
+
+
+@cached_figure
+def pie_chart_age(time_period, course_level):
+    """
+    Generates an interactive pie chart for the distribution of percentage total age under 25 and 25 and over
+    with awarded QTS, with a checklist of undergraduates and postgraduates and a dropdown for time period.
+
+    Parameters:
+    - time_period: str, the academic year for filtering the data, formatted as YYYYYY.
+    - course_level: list, the course levels to include in the chart.
+    """
+    age_distribution = age_split(time_period, course_level)
 
     custom_colors = ['#EB89B5', '#330C73', '#FFD700', '#C1E1C1', '#6A0DAD']
 
-    # Plotting with Plotly Express
-    fig = px.pie(age_distribution, names='Age Group', values='Percentage',
-                 title=f'Percentage Distribution of Age Groups Awarded QTS ({time_period})',
-                 labels={'Percentage': '% of Total Awarded QTS'},
-                 color_discrete_sequence=custom_colors)
+    # Plotting with the fast figure builders
+    fig = fast_figure.pie(age_distribution, names='Age Group', values='Percentage',
+                          title=f'Percentage Distribution of Age Groups Awarded QTS ({time_period})',
+                          labels={'Percentage': '% of Total Awarded QTS'},
+                          color_discrete_sequence=custom_colors)
 
     # Here's the updated layout configuration for a transparent background
-    fig.update_layout(
+    fast_figure.update_layout(
+        fig,
         paper_bgcolor='rgba(0,0,0,0)',
         plot_bgcolor='rgba(0,0,0,0)',
         # Additional style settings as needed
@@ -0,0 +1,108 @@
+# Stores the prepared dataset as an Arrow IPC file that worker processes map into memory instead of parsing.
+# The columns in the file are used in place, so every process serving the app reads the same pages of the OS
+# page cache and the data takes up physical memory once however many workers there are. The file is built
+# next to the CSV and rebuilt whenever the CSV changes; run `python -m figures.mmap_store` to build it ahead
+# of starting the workers.
+import os
+from figures.data_store import SCHEMA, build_lock, data_path, file_version
+
+# Schema metadata key recording the version of the CSV a snapshot file was built from
+VERSION_KEY = b'source_version'
+
+
+def snapshot_path(source=data_path):
+    """
+    Returns the location of the memory-mappable snapshot of a CSV file.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+
+    Returns:
+    - path: Path, the snapshot file next to the CSV, e.g. data/df_prepared.arrow.
+    """
+    return source.with_suffix('.arrow')
+
+
+def _version_text(source):
+    return ','.join(str(part) for part in file_version(source)).encode()
+
+
+def _map(target):
+    # Maps the snapshot file, or returns None if it is missing or unreadable
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    try:
+        return ipc.open_file(pa.memory_map(str(target), 'r')).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+def _is_current(table, version):
+    return table is not None and (table.schema.metadata or {}).get(VERSION_KEY) == version
+
+
+def build(source=data_path, target=None):
+    """
+    Parses the CSV once and writes its columns to an Arrow IPC file.
+
+    The file is written under a temporary name and then renamed, so a process mapping the snapshot never sees
+    a partly written file and processes that already mapped the previous file keep their copy. The caller holds
+    the exclusive build_lock() of the target, as read_mapped() does, so workers rebuilding together do not
+    parse the CSV once each.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the snapshot file, defaulted to the one next to the CSV.
+
+    Returns:
+    - target: Path, the snapshot file.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pandas as pd
+
+    target = target or snapshot_path(source)
+    version = _version_text(source)
+    table = pa.Table.from_pandas(pd.read_csv(source, dtype=SCHEMA, usecols=list(SCHEMA)), preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, VERSION_KEY: version})
+
+    staging = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    with ipc.new_file(staging, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(staging, target)
+    return target
+
+
+def read_mapped(source=data_path, target=None):
+    """
+    Maps the snapshot file read-only and returns its columns as a DataFrame, rebuilding it if the CSV changed.
+
+    The numeric columns and the codes of the categorical columns point into the mapped file rather than
+    being copied, so the returned frame is read-only. Only one process rebuilds at a time; the others wait for
+    it and then map its file.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the snapshot file, defaulted to the one next to the CSV.
+
+    Returns:
+    - data: DataFrame, the dataset with the dtypes from SCHEMA.
+    """
+    target = target or snapshot_path(source)
+    version = _version_text(source)
+    with build_lock(target, shared=True):
+        table = _map(target)
+    if not _is_current(table, version):
+        with build_lock(target):
+            # Another worker may have rebuilt the same change while this one waited for the lock
+            table = _map(target)
+            if not _is_current(table, version):
+                build(source, target)
+                table = _map(target)
+    return table.to_pandas(split_blocks=True)
+
+
+if __name__ == '__main__':
+    with build_lock(snapshot_path()):
+        print(f'Built {build()}')
@@ -0,0 +1,97 @@
+# Groups and sums the dataset with NumPy instead of chains of pandas boolean masks or groupby.
+# The key columns are dictionary-encoded as small integer codes and combined into a single key per row, so the
+# totals of every combination of key values are summed from the contiguous metric arrays in one pass over the
+# keys. No intermediate Series or sub-frames are created. The aggregation engine in figures/aggregates.py builds
+# its per-combination totals with it, and answers every filter from those.
+from math import prod
+
+
+def encode(column):
+    """
+    Dictionary-encodes a column as integer codes.
+
+    Parameters:
+    - column: Series, a categorical or numeric column without missing values.
+
+    Returns:
+    - codes: ndarray, the int32 position of each row's value in the dictionary.
+    - dictionary: tuple, the distinct values in sorted or category order.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if hasattr(column, 'cat'):
+        return column.cat.codes.to_numpy().astype(np.int32), tuple(column.cat.categories)
+    # factorize hashes the values rather than sorting every row as np.unique would
+    codes, values = pd.factorize(column, sort=True)
+    return codes.astype(np.int32), tuple(values.tolist())
+
+
+class EncodedFrame:
+    """
+    The key and metric columns of a frame held as NumPy arrays for the query kernel.
+
+    Every row gets one integer key combining the codes of its key columns, with the first column the most
+    significant, so the keys enumerate every possible combination of the dictionaries in order.
+
+    Attributes:
+    - key_columns: list, the names of the key columns.
+    - dictionaries: dict, maps each key column to the tuple of its distinct values.
+    - keys: ndarray, the combined key of every row.
+    - size: int, the number of possible keys, the product of the dictionary sizes.
+    - metrics: dict, maps each metric column to its contiguous array.
+    """
+
+    def __init__(self, data, key_columns, metric_columns):
+        import numpy as np
+
+        self.key_columns = list(key_columns)
+        self.dictionaries = {}
+        # The keys are kept as intp, the index type NumPy gathers and counts with, so they are never converted
+        keys = np.zeros(len(data), dtype=np.intp)
+        for column in self.key_columns:
+            codes, dictionary = encode(data[column])
+            self.dictionaries[column] = dictionary
+            keys *= len(dictionary)
+            keys += codes
+        self.size = prod(len(dictionary) for dictionary in self.dictionaries.values())
+        self.keys = keys
+        self.metrics = {column: np.ascontiguousarray(data[column].to_numpy()) for column in metric_columns}
+
+    def group_sums(self, columns):
+        """
+        Sums metric columns and counts the rows for every possible key, in one pass over the keys per column.
+
+        Parameters:
+        - columns: list, the metric columns to sum.
+
+        Returns:
+        - counts: ndarray, the number of rows with each key.
+        - sums: dict, the int64 or float64 sums of each column for each key.
+        """
+        import numpy as np
+
+        counts = np.bincount(self.keys, minlength=self.size)
+        sums = {}
+        for column in columns:
+            values = self.metrics[column]
+            sums[column] = np.bincount(self.keys, weights=values, minlength=self.size)
+            # bincount adds in float64, which is exact for integer totals below 2 ** 53
+            if values.dtype.kind in 'iub':
+                sums[column] = sums[column].astype(np.int64)
+        return counts, sums
+
+    def decode(self, keys):
+        """
+        Returns the codes of every key column for some combined keys.
+
+        Parameters:
+        - keys: ndarray, combined keys.
+
+        Returns:
+        - codes: dict, maps each key column to the codes of its values.
+        """
+        import numpy as np
+
+        shape = [len(dictionary) for dictionary in self.dictionaries.values()]
+        return dict(zip(self.key_columns, np.unravel_index(keys, shape)))
@@ -0,0 +1,443 @@
+# Stores the prepared dataset in a SQLite database file and answers the figures' aggregations with SQL.
+# The CSV stays the ingest format: it is loaded into the database in batches the first time the database is
+# opened and again whenever it changes, each version into a file of its own. A composite index over
+# INDEX_COLUMNS lets every filtered GROUP BY read only the matching rows, and only the grouped results are returned
+# to Python, so the memory of each worker process stays the same however many rows the dataset has. Run
+# `python -m figures.sqlite_store` to build the database ahead of starting the workers.
+from contextlib import ExitStack, contextmanager
+import fcntl
+import os
+import queue
+import sqlite3
+import threading
+from types import MappingProxyType
+import weakref
+from figures.data_store import INDEX_COLUMNS, PCT_COLUMNS, SCHEMA, build_lock, data_path, file_version, validate
+
+# The columns that can be summed or averaged
+MEASURES = ['n_total', *PCT_COLUMNS]
+
+# Rows of CSV parsed and inserted per batch while loading, so large files are never held in memory at once
+BATCH_ROWS = 100_000
+
+# Connections each process opens to the database; set SQLITE_CONNECTIONS to override
+CONNECTIONS = int(os.environ.get('SQLITE_CONNECTIONS', 4))
+
+# Bytes of the database each connection maps into memory, so pages are read from the OS page cache that every
+# worker process shares rather than copied into a private cache per connection
+MMAP_SIZE = 1 << 30
+
+# Records the version of the CSV the database was loaded from
+VERSION_TABLE = 'source_version'
+
+_TYPES = {'int32': 'INTEGER', 'uint8': 'INTEGER', 'category': 'TEXT'}
+
+
+def database_path(source=data_path):
+    """
+    Returns the location of the SQLite copy of a CSV file.
+
+    Each version of the CSV is loaded into a file of its own named after this one, see version_path().
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+
+    Returns:
+    - path: Path, the database path next to the CSV, e.g. data/df_prepared.sqlite.
+    """
+    return source.with_suffix('.sqlite')
+
+
+def version_path(target, version):
+    """
+    Returns the database file holding one version of the CSV.
+
+    A file is never written again once built, so connections opened to it at any time read the same rows.
+
+    Parameters:
+    - target: Path, the database path from database_path().
+    - version: tuple, the version of the CSV from file_version().
+
+    Returns:
+    - path: Path, e.g. data/df_prepared.1712345678000000000-5120.sqlite.
+    """
+    return target.with_name(f'{target.stem}.{version[0]}-{version[1]}{target.suffix}')
+
+
+def is_current(source=data_path, target=None):
+    """
+    Checks whether the current version of the CSV has been loaded into its database.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the database path, defaulted to the one next to the CSV.
+
+    Returns:
+    - current: bool, True if the database of the CSV's version exists.
+    """
+    target = target or database_path(source)
+    return version_path(target, file_version(source)).exists()
+
+
+def build(source=data_path, target=None):
+    """
+    Loads the CSV into a table with a composite index over INDEX_COLUMNS, in the file of its version.
+
+    The CSV is parsed in batches of BATCH_ROWS rows, each validated like a snapshot, and only the columns in
+    SCHEMA are kept. The database is written under a temporary name and then renamed, so readers never see a
+    partly loaded database, and the files of earlier versions are left for the snapshots still reading them. The
+    table is analyzed after loading, so SQLite can also use the index for filters that leave out time_period. The
+    caller holds the exclusive build_lock() of the target, as load_sqlite() does, so workers loading the same
+    change do not parse the CSV once each.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the database path, defaulted to the one next to the CSV.
+
+    Returns:
+    - path: Path, the database file of the version loaded, from version_path().
+
+    Raises:
+    - ValueError: if a batch of the CSV fails validate() or the CSV has no rows.
+    """
+    import pandas as pd
+
+    target = target or database_path(source)
+    version = file_version(source)
+    path = version_path(target, version)
+    staging = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    staging.unlink(missing_ok=True)
+    connection = sqlite3.connect(staging)
+    try:
+        columns = ', '.join(f'"{column}" {_TYPES[dtype]} NOT NULL' for column, dtype in SCHEMA.items())
+        connection.execute(f'CREATE TABLE outcomes ({columns})')
+        insert = f'INSERT INTO outcomes VALUES ({", ".join("?" * len(SCHEMA))})'
+        rows = 0
+        for batch in pd.read_csv(source, dtype=SCHEMA, usecols=list(SCHEMA), chunksize=BATCH_ROWS):
+            validate(batch)
+            batch = batch[list(SCHEMA)].astype({column: 'object' for column, dtype in SCHEMA.items()
+                                                if dtype == 'category'})
+            connection.executemany(insert, zip(*(batch[column].tolist() for column in SCHEMA)))
+            rows += len(batch)
+        if not rows:
+            raise ValueError('The dataset has no rows')
+        index_columns = ', '.join(f'"{column}"' for column in INDEX_COLUMNS)
+        connection.execute(f'CREATE INDEX outcomes_filters ON outcomes ({index_columns})')
+        connection.execute(f'CREATE TABLE {VERSION_TABLE} (mtime_ns INTEGER, size INTEGER)')
+        connection.execute(f'INSERT INTO {VERSION_TABLE} VALUES (?, ?)', version)
+        connection.execute('ANALYZE')
+        connection.commit()
+    except BaseException:
+        connection.close()
+        staging.unlink(missing_ok=True)
+        raise
+    connection.close()
+    os.replace(staging, path)
+    return path
+
+
+class ConnectionPool:
+    """
+    Read-only connections to a database file, shared by the threads of a process.
+
+    Connections are opened when first needed, up to size, and a thread waits for one to be returned when all are
+    in use. SQLite connections must not be used across fork(), so a forked worker process opens its own instead
+    of using those of its parent. Each connection keeps the statements it has prepared, so running the same SQL
+    again only binds the new parameters.
+
+    Attributes:
+    - path: Path, the database file.
+    - size: int, the most connections opened by one process.
+    """
+
+    def __init__(self, path, size=CONNECTIONS):
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+
+    def _open(self):
+        connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager lending a connection to the calling thread until it exits.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            idle = self._idle
+            connection = None
+            if idle.empty() and self._opened < self.size:
+                self._opened += 1
+                connection = self._open()
+        if connection is None:
+            connection = idle.get()
+        try:
+            yield connection
+        finally:
+            idle.put(connection)
+
+    def query(self, sql, parameters=()):
+        """
+        Runs a query and returns every row of its result.
+
+        Parameters:
+        - sql: str, the statement, with ? placeholders.
+        - parameters: sequence, the values bound to the placeholders.
+
+        Returns:
+        - rows: list, the result rows as tuples.
+        """
+        with self.connection() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+
+def _where(filters):
+    # Builds the WHERE clause and its parameters from filters in the form taken by Aggregates.where()
+    conditions, parameters = [], []
+    for column in INDEX_COLUMNS:
+        value = filters.get(column)
+        if value is None:
+            continue
+        values = list(dict.fromkeys(value)) if isinstance(value, (list, tuple, set)) else [value]
+        if column == 'time_period':
+            values = [int(period) for period in values]
+        conditions.append(f'"{column}" IN ({", ".join("?" * len(values))})')
+        parameters += values
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+
+def _check(columns, allowed):
+    # Column names are written into the SQL, so only the dataset's own columns are accepted
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown columns: {", ".join(unknown)}')
+
+
+def _frame(rows, columns, typed):
+    # Builds a frame giving the typed columns their dtypes from SCHEMA and adding the text labels of
+    # 'time_period', like a DataSnapshot
+    import pandas as pd
+
+    data = pd.DataFrame.from_records(rows, columns=columns)
+    data = data.astype({column: SCHEMA[column] for column in typed})
+    if 'time_period' in columns:
+        periods = data['time_period'].astype('category')
+        data = data.assign(time_period_label=periods.cat.rename_categories(periods.cat.categories.astype(str)))
+    return data
+
+
+class SqliteSnapshot:
+    """
+    A snapshot of the dataset held in a SQLite database rather than in memory.
+
+    It has the version and values of a DataSnapshot, and its aggregations are run by SqlAggregates. The rows are
+    only read into memory when asked for with data. A snapshot cannot be changed once built. It holds a shared
+    lock on its database file, that of build_lock(), until it is garbage collected, in this process and any
+    forked from it, so the file is not removed while a request pinned to the snapshot may still open connections
+    to it.
+
+    Attributes:
+    - version: tuple, identifies the CSV contents the database was loaded from, as recorded in the database.
+    - values: mapping, maps each index column to the sorted values that occur in the data.
+    - pool: ConnectionPool, the connections to the database.
+    - engine: SqlAggregates, the aggregations of the snapshot.
+    """
+
+    def __init__(self, path, version=None):
+        # The lock is released when the last process holding the file descriptor closes it, rather than unlocked,
+        # so a forked worker collecting its copy does not release the lock of its parent
+        hold = open(path.with_name(f'{path.name}.lock'), 'a')
+        fcntl.flock(hold, fcntl.LOCK_SH)
+        weakref.finalize(self, hold.close)
+        pool = ConnectionPool(path)
+        combinations = pool.query(f'SELECT DISTINCT {", ".join(INDEX_COLUMNS)} FROM outcomes')
+        values = {column: tuple(sorted({combination[position] for combination in combinations}))
+                  for position, column in enumerate(INDEX_COLUMNS)}
+        version = version or tuple(pool.query(f'SELECT mtime_ns, size FROM {VERSION_TABLE}')[0])
+
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'values', MappingProxyType(values))
+        object.__setattr__(self, 'pool', pool)
+        object.__setattr__(self, 'engine', SqlAggregates(self))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SqliteSnapshot is immutable')
+
+    @property
+    def data(self):
+        # Reads every row, so the aggregations should be used instead wherever possible
+        return _frame(self.pool.query('SELECT * FROM outcomes ORDER BY rowid'), list(SCHEMA), SCHEMA)
+
+
+class SqlAggregates:
+    """
+    Answers the queries of the aggregation engine with SQL on the database of a SqliteSnapshot.
+
+    It has the methods of figures.aggregates.Aggregates and returns the same results, but each query runs a
+    SUM or AVG ... GROUP BY with bound parameters, so only the grouped rows are read into Python. Averages are
+    taken over the rows themselves, which equals the Aggregates means of sums divided by row counts.
+    """
+
+    def __init__(self, snapshot):
+        self._pool = snapshot.pool
+        self._values = snapshot.values
+
+    def where(self, time_period=None, course_level_recoded=None, qts_status=None, employment_status=None):
+        """
+        Returns the sum of every measure and the number of rows for each combination matching every filter.
+
+        Parameters:
+        - time_period: int or list, the academic years formatted as YYYYYY.
+        - course_level_recoded: str or list, the course levels.
+        - qts_status: str or list, the QTS statuses.
+        - employment_status: str or list, the employment statuses.
+
+        Returns:
+        - combinations: DataFrame, ordered by the INDEX_COLUMNS.
+        """
+        return self._grouped('SUM', time_period=time_period, course_level_recoded=course_level_recoded,
+                             qts_status=qts_status, employment_status=employment_status)
+
+    def _grouped(self, function, **filters):
+        where, parameters = _where(filters)
+        keys = ', '.join(f'"{column}"' for column in INDEX_COLUMNS)
+        pcts = ', '.join(f'{function}("{column}")' for column in PCT_COLUMNS)
+        rows = self._pool.query(f'SELECT {keys}, SUM("n_total"), {pcts}, COUNT(*) FROM outcomes{where} '
+                                f'GROUP BY {keys} ORDER BY {keys}', parameters)
+        # The sums and averages outgrow the dtypes of the columns they are taken from, so only the keys are typed
+        data = _frame(rows, [*INDEX_COLUMNS, *MEASURES, 'rows'], INDEX_COLUMNS)
+        # Put 'time_period_label' next to 'time_period', as in the Aggregates table
+        return data[[*INDEX_COLUMNS[:1], 'time_period_label', *INDEX_COLUMNS[1:], *MEASURES, 'rows']]
+
+    def sums(self, by, column='n_total', **filters):
+        """
+        Returns the sum of a measure for each value of a column, over the rows matching the filters.
+
+        Parameters:
+        - by: str, the column to group by.
+        - column: str, the measure to sum, defaulted to 'n_total'.
+        - filters: the filters passed to where().
+
+        Returns:
+        - sums: DataFrame, with the columns by and column, ordered by the values of by.
+        """
+        import pandas as pd
+
+        _check([by], INDEX_COLUMNS)
+        _check([column], MEASURES)
+        where, parameters = _where(filters)
+        rows = self._pool.query(f'SELECT "{by}", SUM("{column}") FROM outcomes{where} GROUP BY "{by}" '
+                                f'ORDER BY "{by}"', parameters)
+        return pd.DataFrame.from_records(rows, columns=[by, column])
+
+    def means(self, columns, **filters):
+        """
+        Returns the mean of some measures over every row matching the filters.
+
+        Parameters:
+        - columns: list, the measures to average.
+        - filters: the filters passed to where().
+
+        Returns:
+        - means: Series, the mean of each measure indexed by its name, NaN when no row matches.
+        """
+        import pandas as pd
+
+        _check(columns, MEASURES)
+        where, parameters = _where(filters)
+        averages = ', '.join(f'AVG("{column}")' for column in columns)
+        row = self._pool.query(f'SELECT {averages} FROM outcomes{where}', parameters)[0]
+        return pd.Series(row, index=columns, dtype='float64')
+
+    def series(self, **filters):
+        """
+        Returns the mean of every percentage for each combination matching the filters, in time period order.
+
+        Parameters:
+        - filters: the filters passed to where().
+
+        Returns:
+        - series: DataFrame, one row per combination, with the summed 'n_total' and the number of 'rows'.
+        """
+        # Sorted stably, the same way as Aggregates.series(), so rows of the same period keep the key order
+        return self._grouped('AVG', **filters).sort_values('time_period_label', kind='stable')
+
+
+def _remove_unused(target, keep):
+    # Removes the database files of other versions that no snapshot in any process holds a lock on
+    for path in target.parent.glob(f'{target.stem}.*{target.suffix}'):
+        if path == keep:
+            continue
+        try:
+            with build_lock(path, blocking=False):
+                path.unlink(missing_ok=True)
+                path.with_name(f'{path.name}.lock').unlink(missing_ok=True)
+        except BlockingIOError:
+            pass
+
+
+def _update(source, target):
+    # Loads the CSV into the database of its version if it has changed and removes the files no snapshot needs.
+    # The caller holds the exclusive build_lock() of the target until it has locked the file returned.
+    path = version_path(target, file_version(source))
+    if not path.exists():
+        path = build(source, target)
+    _remove_unused(target, path)
+    return path
+
+
+def read_sqlite(source=data_path, target=None):
+    """
+    Reads every row of the database, loading the CSV into it first if it has changed.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the database path, defaulted to the one next to the CSV.
+
+    Returns:
+    - data: DataFrame, the dataset with the dtypes from SCHEMA.
+    """
+    target = target or database_path(source)
+    with ExitStack() as stack:
+        with build_lock(target):
+            path = _update(source, target)
+            stack.enter_context(build_lock(path, shared=True))
+        pool = ConnectionPool(path, size=1)
+        return _frame(pool.query('SELECT * FROM outcomes ORDER BY rowid'), list(SCHEMA), SCHEMA)
+
+
+def load_sqlite(source=data_path, target=None):
+    """
+    Opens the database as a snapshot, loading the CSV into it first if it has changed.
+
+    Only one process loads the CSV at a time; the others wait for it and then open its database. The files of
+    earlier versions are removed once no snapshot holds them, at the next load after that.
+
+    Parameters:
+    - source: Path, the CSV file, defaulted to data/df_prepared.csv.
+    - target: Path, the database path, defaulted to the one next to the CSV.
+
+    Returns:
+    - snapshot: SqliteSnapshot, the dataset and its aggregations.
+
+    Raises:
+    - ValueError: if the CSV fails validation while it is loaded.
+    """
+    target = target or database_path(source)
+    with build_lock(target):
+        return SqliteSnapshot(_update(source, target))
+
+
+if __name__ == '__main__':
+    with build_lock(database_path()):
+        print(f'Built {build()}')
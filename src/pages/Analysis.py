@@ -1,16 +1,13 @@
-from dash import html, register_page, dcc, Input, Output, callback
+from dash import html, register_page, dcc, Input, Output
 import dash_bootstrap_components as dbc
-from pathlib import Path
-import pandas as pd
+from figures.data_store import get_snapshot
 from figures.figure_analysis import line_chart_analysis
+from services.background import background_progress
+from services.clientside import chart_callback
+from services.partial_update import partial_figure
 
-# register the page in the app
-register_page(__name__, name="Analysis", title="Analysis", path="/Analysis")
-
-# Extract the data
-data_path = Path(__file__).parent.parent.parent.joinpath("data", "df_prepared.csv")
-
-data = pd.read_csv(data_path)
+# register the page in the app, in the position of its link in the navigation bar
+register_page(__name__, name="Analysis", title="Analysis", path="/Analysis", order=3)
 
 # Define the layout of the page
 time_periods = [
@@ -20,7 +17,6 @@ time_periods = [
     '202021',
     '202122'
 ]
-line_chart_a = line_chart_analysis(data, 'pct_total_age_u25', time_periods)
 
 # Dropdown for selecting the feature to compare
 feature_dropdown = dbc.Select(
@@ -60,12 +56,6 @@ row_two = dbc.Row([
             width=12),
 ])
 
-row_three = dbc.Row([
-    dbc.Col(children=[
-        dcc.Graph(id="line_chart_a", figure=line_chart_a),
-    ], width=12),
-])
-
 row_four = dbc.Row([dbc.Col(html.P(""),
                             width=12),])
 
@@ -76,26 +66,47 @@ row_five = dbc.Row([
 ])
 
 # Add an HTML layout to the Dash app.
-# The layout is wrapped in a DBC Container()
-layout = dbc.Container([
-    row_one,
-    row_two,
-    row_three,
-    row_four,
-    row_five,
-])
+# The layout is a function so the figure is only built when the page is first visited; after that it comes
+# from the figure cache. The layout already shows the figure for the default inputs, so the callback below
+# is not called when the page loads.
+def layout():
+    start, end = time_period_slider.value
+    line_chart_a = line_chart_analysis(get_snapshot(), feature_dropdown.value, time_periods[start:end + 1])
+
+    row_three = dbc.Row([
+        dbc.Col(children=[
+            *background_progress("line_chart_a"),
+            dcc.Graph(id="line_chart_a", figure=line_chart_a),
+        ], width=12),
+    ])
+
+    # The layout is wrapped in a DBC Container()
+    return dbc.Container([
+        row_one,
+        row_two,
+        row_three,
+        row_four,
+        row_five,
+    ])
 
 
 # Callback for the line chart and feature dropdown
-@callback(
+@chart_callback(
     Output('line_chart_a', 'figure'),
     [Input('feature_dropdown', 'value'),
-     Input('time_period_slider', 'value')]
+     Input('time_period_slider', 'value')],
+    input_space=[(option['value'], [start, end]) for option in feature_dropdown.options
+                 for start in range(len(time_periods)) for end in range(start, len(time_periods))],
+    prevent_initial_call=True,
+    background=True
 )
 def update_line_chart(selected_feature, selected_time_range):
     # Convert slider indices to actual time period values
     selected_time_periods = [time_periods[i]
                              for i in range(selected_time_range[0], selected_time_range[1] + 1)]
 
-    fig = line_chart_analysis(data, selected_feature, selected_time_periods)
-    return fig
+    fig = line_chart_analysis(get_snapshot(), selected_feature, selected_time_periods)
+    # After the first render only the lines, the titles and the order of the years change. The traces are
+    # replaced as a list because a course level with no data in the selected range has no trace.
+    return partial_figure(fig, [('data',), ('layout', 'title'), ('layout', 'yaxis', 'title'),
+                                ('layout', 'xaxis', 'categoryarray')])
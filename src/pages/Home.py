@@ -1,14 +1,13 @@
-from dash import html, register_page, dcc, Input, Output, callback
+from dash import html, register_page, dcc, Input, Output
 import dash_bootstrap_components as dbc
 from figures.figure_home import pie_chart_total, pie_chart_age
+from services.clientside import chart_callback
+from services.partial_update import partial_figure, trace_paths
 
-# register the page in the app
-register_page(__name__, name="Home", title="Home", path="/")
+# register the page in the app, in the position of its link in the navigation bar
+register_page(__name__, name="Home", title="Home", path="/", order=0)
 
 # Define the layout of the page
-pie_chart_t = pie_chart_total(201718)
-pie_chart_a = pie_chart_age(201718, ['Undergraduate', 'Postgraduate'])
-
 # Dropdown for selecting the time period of home page
 time_period_dropdown_h = dcc.Dropdown(
     id='time_period_dropdown_h',
@@ -71,12 +70,6 @@ row_two = dbc.Row([
             width=2),
 ])
 
-row_three = dbc.Row([
-    dbc.Col(children=[
-        dcc.Graph(id="pie_chart_total", figure=pie_chart_t),
-    ], width=12, align='center'),
-])
-
 row_four = dbc.Row([
     # First column for the dropdown
     dbc.Col(time_period_dropdown_a, width={'size': 2, 'offset': 0, 'order': 1}),
@@ -84,53 +77,69 @@ row_four = dbc.Row([
     dbc.Col(checklist_a, width={'size': 2, 'offset': 0, 'order': 2}),
 ], justify='start')
 
-row_five = dbc.Row([
-    dbc.Col(children=[
-        dcc.Graph(id="pie_chart_age", figure=pie_chart_a),
-    ], width=12, align='center'),
-])
 
 # Add an HTML layout to the Dash app.
-# The layout is wrapped in a DBC Container()
-layout = dbc.Container([
-    row_one,
-    row_two,
-    # Wrap the graph in a card component for better aesthetics
-    dbc.Card(
-        dbc.CardBody([
-            dcc.Graph(id="pie_chart_total", figure=pie_chart_t),
-        ]),
-        className="mb-3",
-        style={'backgroundColor': '#F0F2F5'}  # Light grey background for the card
-    ),
-    row_four,
-    # Wrap the second graph in a card component
-    dbc.Card(
-        dbc.CardBody([
-            dcc.Graph(id="pie_chart_age", figure=pie_chart_a),
-        ]),
-        className="mb-3",
-        style={'backgroundColor': '#F0F2F5'}  # Light grey background for the card
-    ),
-], fluid=True)
+# The layout is a function so the figures are only built when the page is first visited; after that they
+# come from the figure cache. The layout already shows the figures for the default inputs, so the callbacks
+# below are not called when the page loads.
+def layout():
+    pie_chart_t = pie_chart_total(time_period_dropdown_h.value)
+    pie_chart_a = pie_chart_age(time_period_dropdown_a.value, checklist_a.value)
+
+    # The layout is wrapped in a DBC Container()
+    return dbc.Container([
+        row_one,
+        row_two,
+        # Wrap the graph in a card component for better aesthetics
+        dbc.Card(
+            dbc.CardBody([
+                dcc.Graph(id="pie_chart_total", figure=pie_chart_t),
+            ]),
+            className="mb-3",
+            style={'backgroundColor': '#F0F2F5'}  # Light grey background for the card
+        ),
+        row_four,
+        # Wrap the second graph in a card component
+        dbc.Card(
+            dbc.CardBody([
+                dcc.Graph(id="pie_chart_age", figure=pie_chart_a),
+            ]),
+            className="mb-3",
+            style={'backgroundColor': '#F0F2F5'}  # Light grey background for the card
+        ),
+    ], fluid=True)
+
+
+# Every combination of values the inputs of each chart can take
+time_period_values = [option['value'] for option in time_period_dropdown_h.options]
+course_level_values = [option['value'] for option in checklist_a.options]
+course_level_selections = [[], *[[level] for level in course_level_values],
+                           course_level_values, course_level_values[::-1]]
 
 
 # Define the callback for the bar chart
-@callback(
+@chart_callback(
     Output(component_id='pie_chart_total', component_property='figure'),
-    Input(component_id='time_period_dropdown_h', component_property='value')
+    Input(component_id='time_period_dropdown_h', component_property='value'),
+    input_space=[(time_period,) for time_period in time_period_values],
+    prevent_initial_call=True
 )
 def update_pie_chart_t(time_period):
     figure = pie_chart_total(time_period)
-    return figure
+    # After the first render only the slices and the title change
+    return partial_figure(figure, [*trace_paths(figure, 'labels', 'values'), ('layout', 'title')])
 
 
-@callback(
+@chart_callback(
     Output(component_id='pie_chart_age', component_property='figure'),
     [Input(component_id='time_period_dropdown_a', component_property='value'),
-     Input(component_id='checklist_a', component_property='value')]
+     Input(component_id='checklist_a', component_property='value')],
+    input_space=[(time_period, course_levels) for time_period in time_period_values
+                 for course_levels in course_level_selections],
+    prevent_initial_call=True
 )
 def update_pie_chart_a(time_period, course_levels):
     # Now pass the selected course levels to the pie_chart_age function
     figure = pie_chart_age(time_period, course_levels)
-    return figure
+    # After the first render only the slices and the title change
+    return partial_figure(figure, [*trace_paths(figure, 'labels', 'values'), ('layout', 'title')])
@@ -1,17 +1,17 @@
-from dash import html, register_page, dcc, Input, Output, callback
+from dash import html, register_page, dcc, Input, Output
 import dash_bootstrap_components as dbc
 # Import the necessary module or file
-from figures.figure_undergraduate import bar_ethnicity, line_chart
+from figures.figure_course_level import bar_ethnicity, line_chart
+from services.background import background_progress
+from services.clientside import chart_callback
+from services.partial_update import partial_figure, trace_paths
 
-# register the page in the app
-register_page(__name__, name="Undergraduate", title="Undergraduate", path="/Undergraduate")
+# register the page in the app, in the position of its link in the navigation bar
+register_page(__name__, name="Undergraduate", title="Undergraduate", path="/Undergraduate", order=1)
 
 # Define the layout of the page
 # Variables that define the rows and their contents
 
-bar_u = bar_ethnicity(201718)
-line_u = line_chart('Awarded QTS')
-
 # Dropdown for selecting the time period of bar chart
 time_period_dropdown_u = dcc.Dropdown(
     id='time_period_dropdown_u',
@@ -57,12 +57,6 @@ row_two = dbc.Row([
             width=12),
 ])
 
-row_three = dbc.Row([
-    dbc.Col(children=[
-        dcc.Graph(id="bar_u", figure=bar_u),
-    ], width=12),
-])
-
 row_four = dbc.Row([dbc.Col(html.P(""),
                             width=12),])
 
@@ -73,38 +67,61 @@ row_five = dbc.Row([
     ], width=12),
 ])
 
-row_six = dbc.Row([
-    dbc.Col(children=[
-        dcc.Graph(id="line_u", figure=line_u),
-    ], width=12),
-])
 
 # Add an HTML layout to the Dash app.
-# The layout is wrapped in a DBC Container()
-layout = dbc.Container([
-    row_one,
-    row_two,
-    row_three,
-    row_four,
-    row_five,
-    row_six,
-])
+# The layout is a function so the figures are only built when the page is first visited; after that they
+# come from the figure cache. The layout already shows the figures for the default inputs, so the callbacks
+# below are not called when the page loads.
+def layout():
+    bar_u = bar_ethnicity('Undergraduate', time_period_dropdown_u.value)
+    line_u = line_chart('Undergraduate', line_chart_dropdown_u.value)
+
+    row_three = dbc.Row([
+        dbc.Col(children=[
+            dcc.Graph(id="bar_u", figure=bar_u),
+        ], width=12),
+    ])
+
+    row_six = dbc.Row([
+        dbc.Col(children=[
+            *background_progress("line_u"),
+            dcc.Graph(id="line_u", figure=line_u),
+        ], width=12),
+    ])
+
+    # The layout is wrapped in a DBC Container()
+    return dbc.Container([
+        row_one,
+        row_two,
+        row_three,
+        row_four,
+        row_five,
+        row_six,
+    ])
 
 
 # Define the callback for the bar chart
-@callback(
+@chart_callback(
     Output(component_id='bar_u', component_property='figure'),
-    Input(component_id='time_period_dropdown_u', component_property='value')
+    Input(component_id='time_period_dropdown_u', component_property='value'),
+    input_space=[(option['value'],) for option in time_period_dropdown_u.options],
+    prevent_initial_call=True
 )
 def update_bar_chart(time_period):
-    figure = bar_ethnicity(time_period)
-    return figure
+    figure = bar_ethnicity('Undergraduate', time_period)
+    # After the first render only the bar heights and the title change
+    return partial_figure(figure, [*trace_paths(figure, 'y'), ('layout', 'title')])
 
 
-@callback(
+@chart_callback(
     Output(component_id='line_u', component_property='figure'),
-    Input(component_id='line_chart_dropdown_u', component_property='value')
+    Input(component_id='line_chart_dropdown_u', component_property='value'),
+    input_space=[(option['value'],) for option in line_chart_dropdown_u.options],
+    prevent_initial_call=True,
+    background=True
 )
 def update_line_chart(feature):
-    figure = line_chart(feature)
-    return figure
+    figure = line_chart('Undergraduate', feature)
+    # After the first render only the points, the title and the tick labels change
+    return partial_figure(figure, [*trace_paths(figure, 'x', 'y'), ('layout', 'title'),
+                                   ('layout', 'xaxis', 'tickvals'), ('layout', 'xaxis', 'ticktext')])
@@ -0,0 +1,168 @@
+import hashlib
+from figures import figure_analysis, figure_course_level, figure_home
+from figures.data_store import PCT_COLUMNS, get_snapshot, use_snapshot
+from figures.fast_figure import to_json
+
+# The path of the aggregates endpoint
+API_PATH = '/api/aggregates'
+
+# The metrics shown on the Analysis page, returned when none are asked for
+ANALYSIS_METRICS = ['pct_total_age_u25', 'pct_total_age_25andover', 'pct_total_sex_m', 'pct_total_sex_f']
+
+
+def _qts_distribution(query):
+    result = {}
+    for period in query['periods']:
+        distribution = figure_home.qts_distribution(period)
+        result[str(period)] = dict(zip(distribution['Course Level'].tolist(), distribution['Total'].tolist()))
+    return result
+
+
+def _age_split(query):
+    result = {}
+    for period in query['periods']:
+        result[str(period)] = {}
+        for level in query['course_levels']:
+            split = figure_home.age_split(period, [level])
+            result[str(period)][level] = dict(zip(split['Age Group'].tolist(), split['Percentage'].tolist()))
+    return result
+
+
+def _ethnicity(query):
+    result = {}
+    for period in query['periods']:
+        result[str(period)] = {}
+        for level in query['course_levels']:
+            breakdown = figure_course_level.ethnicity_breakdown(level, period)
+            names = breakdown['Ethnicity'].str.replace('pct_total_', '')
+            result[str(period)][level] = dict(zip(names.tolist(), breakdown['Percentage'].tolist()))
+    return result
+
+
+def _yearly_totals(query):
+    result = {}
+    for level in query['course_levels']:
+        result[level] = {}
+        for feature in query['features']:
+            totals = figure_course_level.yearly_totals(level, feature)
+            totals = totals[totals['time_period'].isin(query['periods'])]
+            result[level][feature] = dict(zip(totals['time_period'].astype(str), totals['n_total'].tolist()))
+    return result
+
+
+def _analysis(query):
+    # The rows are selected once and every metric is read from them. The chart has a row per employment status in
+    # each period, so the points are keyed by it too, giving one point per period in each series.
+    rows = figure_analysis.metric_rows(get_snapshot(), [str(period) for period in query['periods']])
+    rows = rows[rows['course_level_recoded'].isin(query['course_levels'])]
+    result = {}
+    for metric in query['metrics']:
+        result[metric] = {}
+        for (level, status), group in rows.groupby(['course_level_recoded', 'employment_status'], observed=True,
+                                                   sort=True):
+            result[metric].setdefault(level, {})[status] = list(zip(group['time_period'].tolist(),
+                                                                    group[metric].tolist()))
+    return result
+
+
+# Every chart the endpoint can return, with the function computing its aggregates
+CHARTS = {
+    'qts_distribution': _qts_distribution,
+    'age_split': _age_split,
+    'ethnicity': _ethnicity,
+    'yearly_totals': _yearly_totals,
+    'analysis': _analysis,
+}
+
+
+def _listed(args, name, allowed, default):
+    # Reads a comma separated parameter, which may also be repeated, keeping the order of the allowed values
+    values = [value for item in args.getlist(name) for value in item.split(',') if value]
+    if not values:
+        return list(default)
+    unknown = [value for value in values if value not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown {name}: {", ".join(unknown)}')
+    return [value for value in allowed if value in values]
+
+
+def parse_query(args, snapshot):
+    """
+    Reads and validates the parameters of an aggregates request.
+
+    Every parameter is a comma separated list and defaults to everything available. The values are put in a
+    canonical order, so requests asking for the same data in a different order share their ETag.
+
+    Parameters:
+    - args: MultiDict, the query string of the request.
+    - snapshot: DataSnapshot, the data the request is answered from.
+
+    Returns:
+    - query: dict, the charts, periods, course_levels, features and metrics to return.
+
+    Raises:
+    - ValueError: if a parameter holds a value that is not in the data.
+    """
+    values = snapshot.values
+    features = [value for value in values['qts_status'] + values['employment_status'] if value != 'Total']
+    periods = _listed(args, 'periods', [str(period) for period in values['time_period']], [])
+    return {
+        'charts': _listed(args, 'charts', list(CHARTS), CHARTS),
+        'periods': [int(period) for period in periods] or list(values['time_period']),
+        'course_levels': _listed(args, 'course_levels', figure_course_level.COURSE_LEVELS,
+                                 figure_course_level.COURSE_LEVELS),
+        'features': _listed(args, 'features', features, features),
+        'metrics': _listed(args, 'metrics', PCT_COLUMNS, ANALYSIS_METRICS),
+    }
+
+
+def etag(snapshot, query):
+    """
+    Returns the strong ETag of an aggregates response.
+
+    The tag only depends on the version of the data file and the canonical query, so it is the same in every
+    worker process and is known before any aggregate is computed.
+
+    Parameters:
+    - snapshot: DataSnapshot, the data the request is answered from.
+    - query: dict, the canonical query from parse_query().
+
+    Returns:
+    - tag: str, the entity tag, without quotes.
+    """
+    return hashlib.sha256(repr((snapshot.version, sorted(query.items()))).encode()).hexdigest()[:32]
+
+
+def aggregates():
+    """
+    Returns the aggregates behind the charts for many periods, course levels, features and metrics at once.
+
+    The response carries a strong ETag. A request whose If-None-Match header holds it gets 304 Not Modified
+    without the aggregates being computed again, until the data file changes.
+    """
+    from flask import request
+
+    with use_snapshot(get_snapshot()) as snapshot:
+        try:
+            query = parse_query(request.args, snapshot)
+        except ValueError as error:
+            return {'error': str(error)}, 400
+        tag = etag(snapshot, query)
+        headers = {'ETag': f'"{tag}"', 'Cache-Control': 'no-cache'}
+        if request.if_none_match.contains(tag):
+            return '', 304, headers
+
+        body = {'periods': query['periods']}
+        for chart in query['charts']:
+            body[chart] = CHARTS[chart](query)
+    return to_json(body), 200, {**headers, 'Content-Type': 'application/json'}
+
+
+def register_api(server):
+    """
+    Adds the read-only aggregates endpoint to a Flask server.
+
+    Parameters:
+    - server: Flask, the server of the Dash app.
+    """
+    server.add_url_rule(API_PATH, 'aggregates', aggregates, methods=['GET'])
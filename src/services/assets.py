@@ -0,0 +1,232 @@
+# Serves the app's JavaScript and CSS from a bundle of gzip and brotli copies built ahead by build_assets.py.
+# Every file Dash serves from the assets folder or its component suites is compressed once at build time rather
+# than per response. The page refers to each file by the hash of its contents, so a browser can keep it for a year
+# without revalidating: a changed file gets a new URL. Without a bundle the files are served by Dash as before.
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+from pathlib import Path
+import re
+import shutil
+import sys
+import urllib.request
+from dash.fingerprint import check_fingerprint
+import dash_bootstrap_components as dbc
+
+# Where build_assets.py writes the compressed files and their manifest; set ASSET_BUNDLE_DIR to override
+BUNDLE_DIR = Path(os.environ.get('ASSET_BUNDLE_DIR', Path(__file__).parent.parent.parent.joinpath('build', 'assets')))
+
+# The QUARTZ theme, vendored into the assets folder so pages load without a CDN
+THEME_URL = dbc.themes.QUARTZ
+THEME_PATH = Path(__file__).parent.parent.joinpath('assets', 'bootstrap-quartz.min.css')
+
+# Compressed variants in order of preference, with their file suffix
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# For URLs that change whenever their file does
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Dash's fingerprint of a component suite file, e.g. dcc/dash_core_components.v3_2_0m1712345678.js
+FINGERPRINT = re.compile(r'(/_dash-component-suites/[^"\'?]+?\.v[\w-]+m)([0-9a-fA-F]+)(\.[\w.]+)')
+
+# The modification time Dash appends to a file of the assets folder, e.g. /assets/slider_style.css?m=1712345678
+ASSET_VERSION = re.compile(r'(/assets/[^"\'?]+)\?m=([0-9.]+)')
+
+# The comment pointing the browser at a source map, which is not vendored with the theme
+SOURCE_MAP = re.compile(rb'\s*/\*# sourceMappingURL=[^*]*\*/\s*$')
+
+logger = logging.getLogger(__name__)
+
+
+def vendor_theme(url=THEME_URL, target=THEME_PATH):
+    """
+    Downloads the theme stylesheet into the assets folder, where Dash includes it in every page.
+
+    Its source map comment is removed, as the map is not downloaded and browsers would request it.
+
+    Parameters:
+    - url: str, the stylesheet, defaulted to the QUARTZ theme of dash-bootstrap-components.
+    - target: Path, where to write it.
+
+    Returns:
+    - target: Path, the stylesheet.
+    """
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = SOURCE_MAP.sub(b'\n', response.read())
+    staging = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    staging.write_bytes(data)
+    os.replace(staging, target)
+    return target
+
+
+def asset_files(app):
+    """
+    Returns every JavaScript and CSS file Dash can serve for the app, by the path of its URL without a version.
+
+    These are the files of the assets folder and every file registered by the component libraries, including
+    those loaded on demand by the browser.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+
+    Returns:
+    - files: dict, maps a URL path to the file it is served from.
+    """
+    # Dash registers the component suite files while rendering the first page
+    app.server.test_client().get('/')
+    prefix = app.config.requests_pathname_prefix
+    files = {}
+    assets = Path(app.config.assets_folder)
+    for path in sorted(assets.rglob('*')):
+        if path.suffix in ('.js', '.css'):
+            files[f'{prefix}assets/{path.relative_to(assets).as_posix()}'] = path
+    for namespace, paths in app.registered_paths.items():
+        package = Path(sys.modules[namespace].__file__).parent
+        for relative in sorted(paths):
+            if relative.endswith(('.js', '.css')) and (package / relative).is_file():
+                files[f'{prefix}_dash-component-suites/{namespace}/{relative}'] = package / relative
+    return files
+
+
+def build(app, directory=BUNDLE_DIR):
+    """
+    Writes a gzip and a brotli copy of every file from asset_files() with a manifest describing them.
+
+    The copies are named after the SHA-256 of the original contents. The bundle is written to a staging directory
+    and then moved into place, so a server never reads a partial bundle. Without the brotli package only the gzip
+    copies are written.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+    - directory: Path, where to write the bundle, defaulted to build/assets.
+
+    Returns:
+    - manifest: dict, maps each URL path to its 'hash', 'type', source 'file', 'mtime' and the size of each
+      variant in bytes.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        logger.warning('brotli is not installed, only gzip copies are written')
+
+    directory = Path(directory)
+    staging = directory.with_name(f'{directory.name}.{os.getpid()}.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    manifest = {}
+    for url, path in asset_files(app).items():
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        name = f'{digest}{path.suffix}'
+        sizes = {'identity': len(data)}
+        variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(data, quality=11)
+        for encoding, compressed in variants.items():
+            (staging / f'{name}{ENCODINGS[encoding]}').write_bytes(compressed)
+            sizes[encoding] = len(compressed)
+        stat = path.stat()
+        manifest[url] = {'hash': digest, 'type': mimetypes.guess_type(path.name)[0], 'file': str(path),
+                         'mtime': stat.st_mtime_ns, 'sizes': sizes}
+    (staging / 'manifest.json').write_text(json.dumps(manifest, indent=1))
+
+    previous = directory.with_name(f'{directory.name}.{os.getpid()}.old')
+    if directory.exists():
+        os.replace(directory, previous)
+    os.replace(staging, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def load_manifest(directory=BUNDLE_DIR):
+    """
+    Reads the manifest of a bundle, leaving out every file that has changed since the bundle was built.
+
+    Parameters:
+    - directory: Path, the bundle, defaulted to build/assets.
+
+    Returns:
+    - manifest: dict, as returned by build(), or empty if there is no bundle.
+    """
+    try:
+        manifest = json.loads((Path(directory) / 'manifest.json').read_text())
+    except (OSError, ValueError):
+        return {}
+    current = {}
+    for url, entry in manifest.items():
+        try:
+            changed = os.stat(entry['file']).st_mtime_ns != entry['mtime']
+        except OSError:
+            changed = True
+        if changed:
+            logger.warning('%s has changed since the asset bundle was built, run build_assets.py again', url)
+        else:
+            current[url] = entry
+    return current
+
+
+def _content_urls(html, manifest):
+    # Puts the hash of each file's contents in its URL in place of its modification time
+    def component_suite(match):
+        path, _ = check_fingerprint(match.group(0))
+        entry = manifest.get(path)
+        return match.group(1) + entry['hash'] + match.group(3) if entry else match.group(0)
+
+    def asset(match):
+        entry = manifest.get(match.group(1))
+        return f"{match.group(1)}?m={entry['hash']}" if entry else match.group(0)
+
+    return ASSET_VERSION.sub(asset, FINGERPRINT.sub(component_suite, html))
+
+
+def register_assets(app, directory=BUNDLE_DIR):
+    """
+    Serves the precompressed bundle of the app's JavaScript and CSS, when one has been built.
+
+    A request for a file in the bundle gets its brotli or gzip copy, whichever the browser accepts, and the
+    uncompressed file from Dash otherwise. A URL carrying a version is cached by the browser for a year as
+    immutable, and the pages refer to every file in the bundle by the hash of its contents.
+
+    Parameters:
+    - app: Dash, the app.
+    - directory: Path, the bundle, defaulted to build/assets.
+    """
+    from flask import request, send_file
+
+    server = app.server
+    manifest = load_manifest(directory)
+    if not manifest:
+        return
+    prefix = app.config.requests_pathname_prefix
+
+    @server.before_request
+    def send_compressed():
+        path, _ = check_fingerprint(request.path)
+        entry = manifest.get(path)
+        if entry is None:
+            return None
+        encoding = next((name for name in ENCODINGS if request.accept_encodings[name]
+                         and name in entry['sizes']), None)
+        if encoding is None:
+            return None
+        response = send_file(Path(directory) / f"{entry['hash']}{Path(path).suffix}{ENCODINGS[encoding]}",
+                             mimetype=entry['type'], etag=f"{entry['hash']}-{encoding}", conditional=True)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @server.after_request
+    def cache_headers(response):
+        path, fingerprinted = check_fingerprint(request.path)
+        if path in manifest:
+            response.vary.add('Accept-Encoding')
+            if response.status_code in (200, 304) and (fingerprinted or 'm' in request.args):
+                response.headers['Cache-Control'] = IMMUTABLE
+            elif 'Content-Encoding' in response.headers:
+                response.headers['Cache-Control'] = 'no-cache'
+        elif response.mimetype == 'text/html' and path.startswith(prefix) and not response.direct_passthrough:
+            response.set_data(_content_urls(response.get_data(as_text=True), manifest))
+        return response
@@ -0,0 +1,118 @@
+from functools import wraps
+import os
+from pathlib import Path
+from dash import Output
+import dash_bootstrap_components as dbc
+from figures.aggregates import aggregates
+from figures.data_store import get_snapshot
+
+# Set BACKGROUND_CALLBACKS=1 to run the heavy chart callbacks in background processes instead of server threads
+BACKGROUND_CALLBACKS = os.environ.get('BACKGROUND_CALLBACKS', '0') == '1'
+
+# Where the jobs' progress and results are stored; set BACKGROUND_CACHE_DIR to override
+CACHE_DIR = Path(os.environ.get('BACKGROUND_CACHE_DIR',
+                                Path(__file__).parent.parent.parent.joinpath('.cache', 'background')))
+
+# Seconds a finished job's result is kept if the browser never collects it
+RESULT_EXPIRY = 600
+
+# Milliseconds between the browser's checks on a running job
+POLL_INTERVAL = 250
+
+# The progress bar is only shown while a job runs
+SHOWN = {'height': '1.25rem', 'marginBottom': '0.5rem'}
+HIDDEN = {'display': 'none'}
+
+_manager = None
+
+
+def progress_id(output_id):
+    """
+    Returns the id of the progress bar of a chart.
+
+    Parameters:
+    - output_id: str, the id of the chart's dcc.Graph.
+
+    Returns:
+    - id: str, the id of its progress bar.
+    """
+    return f'{output_id}_progress'
+
+
+def background_manager():
+    """
+    Returns the manager that runs background callbacks, creating it on first use.
+
+    Each job runs in its own process forked from the server, which starts with the data already loaded, and a
+    job the user has superseded by changing the inputs again is terminated. The progress and results of the jobs
+    are kept in a diskcache store under CACHE_DIR, shared by every server process, so no broker is needed.
+
+    Returns:
+    - manager: DiskcacheManager, the background callback manager.
+    """
+    global _manager
+    if _manager is None:
+        import diskcache
+        from dash import DiskcacheManager
+        _manager = DiskcacheManager(diskcache.Cache(CACHE_DIR), expire=RESULT_EXPIRY)
+    return _manager
+
+
+def background_progress(output_id):
+    """
+    Returns the progress bar shown while a chart's background job runs, or an empty list when
+    BACKGROUND_CALLBACKS is off.
+
+    Parameters:
+    - output_id: str, the id of the chart's dcc.Graph.
+
+    Returns:
+    - components: list, the components to add to the page layout above the chart.
+    """
+    if not BACKGROUND_CALLBACKS:
+        return []
+    return [dbc.Progress(id=progress_id(output_id), value=0, striped=True, animated=True, style=HIDDEN)]
+
+
+def background_options(output_id):
+    """
+    Returns the keyword arguments that make a Dash callback run in the background with a progress bar.
+
+    Parameters:
+    - output_id: str, the id of the chart's dcc.Graph.
+
+    Returns:
+    - options: dict, the arguments to pass to dash.callback.
+    """
+    bar = progress_id(output_id)
+    return {
+        'background': True,
+        'manager': background_manager(),
+        'interval': POLL_INTERVAL,
+        'progress': [Output(bar, 'value'), Output(bar, 'label')],
+        'progress_default': [0, ''],
+        'running': [(Output(bar, 'style'), SHOWN, HIDDEN)],
+    }
+
+
+def background_job(function):
+    """
+    Wraps a chart callback to report its progress while it runs as a background job.
+
+    The aggregates of the data are prepared first, which is the slow step when the data has just changed, then
+    the figure is built.
+
+    Parameters:
+    - function: callable, the callback.
+
+    Returns:
+    - job: callable, taking Dash's set_progress function before the callback's arguments.
+    """
+    @wraps(function)
+    def job(set_progress, *args):
+        set_progress([10, 'Aggregating the data'])
+        aggregates(get_snapshot())
+        set_progress([60, 'Building the chart'])
+        return function(*args)
+
+    return job
@@ -0,0 +1,141 @@
+from functools import wraps
+import json
+import os
+from dash import State, callback, clientside_callback, dcc
+from figures.data_store import get_snapshot, use_snapshot
+from services.background import BACKGROUND_CALLBACKS, background_job, background_options
+from services.metrics import timed_callback
+
+# Set CLIENTSIDE_CHARTS=1 to update the charts in the browser instead of calling the server
+CLIENTSIDE_CHARTS = os.environ.get('CLIENTSIDE_CHARTS', '0') == '1'
+
+# The id of the dcc.Store holding the pre-computed chart data
+STORE_ID = 'chart_slices'
+
+# Every chart registered with chart_callback: output id -> (callback function, list of argument tuples)
+CHARTS = {}
+
+# The slices built for the current data snapshot, as (snapshot version, slices)
+_slices = (None, None)
+
+# Picks the slice matching the current inputs and keeps the template of the figure already on the page
+CLIENTSIDE_FUNCTION = """
+function(...args) {
+    const figure = args.pop();
+    const slices = args.pop() || {};
+    const slice = (slices[%s] || {})[JSON.stringify(args)];
+    if (!slice) {
+        return window.dash_clientside.no_update;
+    }
+    const layout = Object.assign({}, slice.layout);
+    if (figure && figure.layout && figure.layout.template) {
+        layout.template = figure.layout.template;
+    }
+    return {data: slice.data, layout: layout};
+}
+"""
+
+
+def slice_key(args):
+    """
+    Returns the key of a slice, matching JSON.stringify() of the callback arguments in the browser.
+
+    Parameters:
+    - args: tuple, the callback arguments.
+
+    Returns:
+    - key: str, the compact JSON encoding of the arguments.
+    """
+    return json.dumps(list(args), separators=(',', ':'))
+
+
+def _pin_snapshot(function):
+    # Runs the callback on the data snapshot that is live when it starts, even if the data is reloaded meanwhile
+    @wraps(function)
+    def wrapper(*args):
+        with use_snapshot(get_snapshot()):
+            return function(*args)
+
+    return wrapper
+
+
+def chart_callback(output, *inputs, input_space, prevent_initial_call=False, background=False):
+    """
+    Decorator that registers a callback returning a figure, either on the server or in the browser.
+
+    When CLIENTSIDE_CHARTS is off the function is registered as a normal Dash callback. When it is on the
+    function is run for every argument tuple in input_space when the app starts, the figures are shipped
+    once in the chart_slices store and a clientside callback switches between them. Otherwise, a callback marked
+    as background runs in a background process with a progress bar when BACKGROUND_CALLBACKS is on.
+
+    Parameters:
+    - output: Output, the figure property the callback updates.
+    - inputs: Input or list of Input, the properties the callback depends on.
+    - input_space: list, every tuple of arguments the inputs can take.
+    - prevent_initial_call: bool, whether to skip the call made when the page loads.
+    - background: bool, whether the callback is slow enough to run in the background when that mode is on.
+
+    Returns:
+    - decorator: callable, registers the function and returns it unchanged.
+    """
+    flat_inputs = [item for group in inputs for item in (group if isinstance(group, list) else [group])]
+
+    def decorator(function):
+        CHARTS[output.component_id] = (function, list(input_space))
+        if CLIENTSIDE_CHARTS:
+            clientside_callback(
+                CLIENTSIDE_FUNCTION % json.dumps(output.component_id),
+                output,
+                *flat_inputs,
+                State(STORE_ID, 'data'),
+                State(output.component_id, 'figure'),
+                prevent_initial_call=prevent_initial_call,
+            )
+        elif background and BACKGROUND_CALLBACKS:
+            instrumented = timed_callback(output.component_id, function)
+            callback(output, *inputs, prevent_initial_call=prevent_initial_call,
+                     **background_options(output.component_id))(_pin_snapshot(background_job(instrumented)))
+        else:
+            instrumented = timed_callback(output.component_id, function)
+            callback(output, *inputs, prevent_initial_call=prevent_initial_call)(_pin_snapshot(instrumented))
+        return function
+
+    return decorator
+
+
+def build_slices():
+    """
+    Builds the figure for every registered chart and argument tuple, without its template.
+
+    The slices are built once for each version of the data.
+
+    Returns:
+    - slices: dict, output id -> slice key -> figure data and layout.
+    """
+    global _slices
+    snapshot = get_snapshot()
+    if _slices[0] == snapshot.version:
+        return _slices[1]
+
+    slices = {}
+    with use_snapshot(snapshot):
+        for output_id, (function, input_space) in CHARTS.items():
+            slices[output_id] = {}
+            for args in input_space:
+                figure = function(*args)
+                layout = {key: value for key, value in figure['layout'].items() if key != 'template'}
+                slices[output_id][slice_key(args)] = {'data': figure['data'], 'layout': layout}
+    _slices = (snapshot.version, slices)
+    return slices
+
+
+def slices_store():
+    """
+    Returns the store holding the chart slices, or an empty list when CLIENTSIDE_CHARTS is off.
+
+    Returns:
+    - components: list, the components to add to the app layout.
+    """
+    if not CLIENTSIDE_CHARTS:
+        return []
+    return [dcc.Store(id=STORE_ID, data=build_slices())]
@@ -0,0 +1,76 @@
+# Compresses the responses the app builds per request, chiefly the figure JSON of the chart callbacks, and answers
+# the layout and dependency requests every page load makes with 304 Not Modified when the browser already has them.
+# The scripts and stylesheets are compressed ahead of time by build_assets.py instead (see services.assets).
+import gzip
+import hashlib
+import os
+
+# Set COMPRESS=0 to send every response uncompressed; the layout and dependencies still carry an ETag
+COMPRESS = os.environ.get('COMPRESS', '1') == '1'
+
+# Responses smaller than this many bytes are sent as they are, as they fit in a packet anyway
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+
+# The brotli quality and gzip level; set BROTLI_QUALITY or GZIP_LEVEL to trade CPU for smaller responses
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+
+# The types worth compressing; images and fonts already are
+COMPRESS_TYPES = {'application/json', 'application/javascript', 'text/javascript', 'text/html', 'text/css',
+                  'text/plain', 'image/svg+xml'}
+
+# The Dash endpoints whose response only changes when the app is deployed again or its data is reloaded
+CONDITIONAL_PATHS = {'/_dash-layout', '/_dash-dependencies'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compression functions in order of preference, by content coding
+ENCODERS = {'gzip': lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+if brotli is not None:
+    ENCODERS = {'br': lambda data: brotli.compress(data, quality=BROTLI_QUALITY), **ENCODERS}
+
+
+def _add_etag(response, request):
+    # The layout is built on every request, so the tag is taken from the body rather than from the app version.
+    # It is weak so it still matches once the body is compressed.
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32], weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def _finish(response):
+    from flask import request
+
+    if request.path in CONDITIONAL_PATHS and response.status_code == 200:
+        response = _add_etag(response, request)
+    if (not COMPRESS or response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = next((name for name in ENCODERS if request.accept_encodings[name]), None)
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(ENCODERS[encoding](data))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def register_compression(server):
+    """
+    Compresses the responses of a Flask server with brotli or gzip, unless COMPRESS is off, and adds the ETags of
+    the Dash layout and dependencies.
+
+    A response is compressed when the browser accepts one of them, it has one of the COMPRESS_TYPES and it holds at
+    least COMPRESS_MIN_BYTES. Brotli is preferred when installed. /_dash-layout and /_dash-dependencies also carry
+    an ETag, so a browser sending it back in If-None-Match gets 304 Not Modified until they change.
+
+    Register this before any hook that changes response bodies, as Flask runs them in reverse order.
+
+    Parameters:
+    - server: Flask, the server of the Dash app.
+    """
+    server.after_request(_finish)
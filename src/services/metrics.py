@@ -0,0 +1,253 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+import os
+import threading
+import time
+from dash.exceptions import PreventUpdate
+from figures import fast_figure
+from figures.figure_cache import figure_cache
+
+# Set METRICS=0 to turn the callback instrumentation and the /metrics route off
+METRICS_ENABLED = os.environ.get('METRICS', '1') == '1'
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The path Dash posts callback requests to
+CALLBACK_PATH = '/_dash-update-component'
+
+
+class _Timing:
+    # Timings of the callback request being handled in the current thread
+    __slots__ = ('callback', 'started', 'figure', 'returned')
+
+    def __init__(self):
+        self.callback = None
+        self.started = None
+        self.figure = 0.0
+        self.returned = None
+
+
+class Histogram:
+    """
+    A thread-safe latency histogram with the fixed BUCKETS, kept per label set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, seconds):
+        """
+        Records one measurement.
+
+        Parameters:
+        - labels: tuple, the (name, value) label pairs of the series.
+        - seconds: float, the measured time.
+        """
+        with self._lock:
+            counts, total = self._series.get(labels, ([0] * (len(BUCKETS) + 1), 0.0))
+            counts[bisect_left(BUCKETS, seconds)] += 1
+            self._series[labels] = (counts, total + seconds)
+
+    def samples(self):
+        """
+        Returns a copy of every series as (labels, cumulative bucket counts, sum, count).
+        """
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        result = []
+        for labels, counts, total in sorted(series):
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            result.append((labels, cumulative, total, running))
+        return result
+
+
+class Counter:
+    """
+    A thread-safe counter kept per label set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels):
+        """
+        Adds one to a series.
+
+        Parameters:
+        - labels: tuple, the (name, value) label pairs of the series.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + 1
+
+    def samples(self):
+        """
+        Returns every series as (labels, value).
+        """
+        with self._lock:
+            return sorted(self._values.items())
+
+
+callback_duration = Histogram()
+callback_requests = Counter()
+callback_errors = Counter()
+
+_timing = ContextVar('callback_timing', default=None)
+
+
+def _time_figure(function, args, kwargs):
+    # Runs a figure builder, adding its time to the figure stage of the callback being handled, if any
+    timing = _timing.get()
+    if timing is None:
+        return function(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        timing.figure += time.perf_counter() - start
+
+
+def timed_callback(name, function):
+    """
+    Wraps a chart callback so its requests, errors and stage timings are recorded under the given name.
+
+    The time the callback runs is split into the figure stage, spent in the figure builders, and the filter stage,
+    everything else: selecting and aggregating the data. The serialize stage runs from the callback returning to
+    the response being ready, which is mostly Dash encoding the figure as JSON. Returns the function unchanged when
+    METRICS is off.
+
+    Parameters:
+    - name: str, the label of the callback, e.g. its output id.
+    - function: callable, the callback.
+
+    Returns:
+    - wrapper: callable, the instrumented callback.
+    """
+    if not METRICS_ENABLED:
+        return function
+
+    labels = (('callback', name),)
+
+    @wraps(function)
+    def wrapper(*args):
+        timing = _timing.get()
+        if timing is None:
+            return function(*args)
+        timing.callback = name
+        callback_requests.inc(labels)
+        try:
+            result = function(*args)
+        except PreventUpdate:
+            raise
+        except Exception:
+            callback_errors.inc(labels)
+            raise
+        # Only callbacks that return a figure have their stages timed
+        timing.returned = time.perf_counter()
+        return result
+
+    return wrapper
+
+
+def _start_timing():
+    from flask import request
+    if request.path == CALLBACK_PATH:
+        timing = _Timing()
+        timing.started = time.perf_counter()
+        _timing.set(timing)
+
+
+def _record_timing(response):
+    timing = _timing.get()
+    if timing is not None and timing.callback is not None and timing.returned is not None:
+        now = time.perf_counter()
+        run = timing.returned - timing.started
+        stages = {'filter': max(run - timing.figure, 0.0), 'figure': timing.figure,
+                  'serialize': now - timing.returned, 'total': now - timing.started}
+        for stage, seconds in stages.items():
+            callback_duration.observe((('callback', timing.callback), ('stage', stage)), seconds)
+    return response
+
+
+def _clear_timing(error=None):
+    _timing.set(None)
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def render():
+    """
+    Returns every metric in the Prometheus text exposition format.
+
+    The metrics are those of the process serving the request; with several worker processes each one keeps its own.
+
+    Returns:
+    - text: str, the metrics.
+    """
+    lines = [
+        '# HELP dash_callback_duration_seconds Time spent handling chart callback requests, by stage.',
+        '# TYPE dash_callback_duration_seconds histogram',
+    ]
+    for labels, cumulative, total, count in callback_duration.samples():
+        for bound, value in zip([*BUCKETS, '+Inf'], cumulative):
+            lines.append(f'dash_callback_duration_seconds_bucket{{{_format_labels(labels)},le="{bound}"}} {value}')
+        lines.append(f'dash_callback_duration_seconds_sum{{{_format_labels(labels)}}} {total}')
+        lines.append(f'dash_callback_duration_seconds_count{{{_format_labels(labels)}}} {count}')
+
+    for name, counter, description in [
+        ('dash_callback_requests_total', callback_requests, 'Chart callback requests.'),
+        ('dash_callback_errors_total', callback_errors, 'Chart callback requests that raised an exception.'),
+    ]:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        lines += [f'{name}{{{_format_labels(labels)}}} {value}' for labels, value in counter.samples()]
+
+    info = figure_cache.cache_info()
+    lookups = info['hits'] + info['misses']
+    lines += [
+        '# HELP figure_cache_hits_total Figure cache lookups answered from the cache.',
+        '# TYPE figure_cache_hits_total counter',
+        f"figure_cache_hits_total {info['hits']}",
+        '# HELP figure_cache_misses_total Figure cache lookups not in the process cache.',
+        '# TYPE figure_cache_misses_total counter',
+        f"figure_cache_misses_total {info['misses']}",
+        '# HELP figure_cache_shared_hits_total Figure cache misses answered from the cache shared by every worker.',
+        '# TYPE figure_cache_shared_hits_total counter',
+        f"figure_cache_shared_hits_total {info['shared_hits']}",
+        '# HELP figure_cache_coalesced_total Figure cache misses that waited for a build already in progress.',
+        '# TYPE figure_cache_coalesced_total counter',
+        f"figure_cache_coalesced_total {info['coalesced']}",
+        '# HELP figure_cache_hit_ratio Share of figure cache lookups answered from the cache.',
+        '# TYPE figure_cache_hit_ratio gauge',
+        f"figure_cache_hit_ratio {info['hits'] / lookups if lookups else 0.0}",
+        '# HELP figure_cache_size Figures held in the cache.',
+        '# TYPE figure_cache_size gauge',
+        f"figure_cache_size {info['size']}",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def register_metrics(server):
+    """
+    Adds the request hooks that time callbacks and the /metrics route to a Flask server, unless METRICS is off.
+
+    The builders of figures.fast_figure are also timed as the figure stage from then on.
+
+    Parameters:
+    - server: Flask, the server of the Dash app.
+    """
+    if not METRICS_ENABLED:
+        return
+    fast_figure.build_hook = _time_figure
+    server.before_request(_start_timing)
+    server.after_request(_record_timing)
+    server.teardown_request(_clear_timing)
+    server.add_url_rule('/metrics', 'metrics',
+                        lambda: (render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}))
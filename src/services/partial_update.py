@@ -0,0 +1,52 @@
+from dash import Patch, ctx
+from dash.exceptions import MissingCallbackContextException
+
+
+def _first_render():
+    try:
+        return ctx.triggered_id is None
+    except (MissingCallbackContextException, LookupError):
+        # Called outside a request, e.g. when building the clientside chart slices, or from a thread in which Dash
+        # never set its callback context, e.g. when warming the figures
+        return True
+
+
+def partial_figure(figure, paths):
+    """
+    Returns the whole figure on first render and otherwise a Patch that replaces only the given parts.
+
+    A callback is on its first render when no input triggered it, which is the case when its page loads.
+    Later calls are triggered by the user, and the figure on the page is patched in place so the template
+    and the parts of the layout that do not change are not sent again.
+
+    Parameters:
+    - figure: dict, the complete figure for the current inputs.
+    - paths: list, the locations to replace, each a tuple of keys such as ('data', 0, 'y').
+
+    Returns:
+    - update: dict or Patch, the figure or the partial update to send.
+    """
+    if _first_render():
+        return figure
+
+    patch = Patch()
+    for path in paths:
+        source, target = figure, patch
+        for key in path[:-1]:
+            source, target = source[key], target[key]
+        target[path[-1]] = source[path[-1]]
+    return patch
+
+
+def trace_paths(figure, *properties):
+    """
+    Returns the path of each given property in every trace of a figure.
+
+    Parameters:
+    - figure: dict, the figure.
+    - properties: str, the trace properties, e.g. 'x' and 'y'.
+
+    Returns:
+    - paths: list, one ('data', index, property) tuple per trace and property.
+    """
+    return [('data', index, name) for index in range(len(figure['data'])) for name in properties]
@@ -0,0 +1,157 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import logging
+import os
+import threading
+import time
+import dash
+from dash import dcc
+from figures.data_store import get_snapshot, use_snapshot
+from services.clientside import CHARTS
+from services.static_export import walk
+
+# Set WARMUP=0 to skip building the figure of every chart state at startup
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+
+# Seconds after which warming stops starting new chart states; set WARMUP_BUDGET to override
+WARMUP_BUDGET = float(os.environ.get('WARMUP_BUDGET', 60))
+
+# Threads building the figures while warming; set WARMUP_THREADS to override
+WARMUP_THREADS = int(os.environ.get('WARMUP_THREADS', os.cpu_count() or 1))
+
+logger = logging.getLogger(__name__)
+
+# Cleared while the figures are being warmed, so /healthz reports that the app is not ready yet
+ready = threading.Event()
+ready.set()
+
+
+def warm_up_order(app):
+    """
+    Returns every state of every chart registered with chart_callback, in the order they are warmed.
+
+    The state each chart shows when its page loads comes first, for the pages in navigation order, followed by
+    the rest of each chart's input space. The input spaces are the ones the pages build from their dropdown
+    options, time periods and checklist values.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+
+    Returns:
+    - states: list, the (output id, argument tuple) of every chart state.
+    """
+    # Dash registers the callbacks on its first request
+    if not app.callback_map:
+        app.server.test_client().get('/')
+    defaults = {}
+    for page in dash.page_registry.values():
+        layout = page['layout']() if callable(page['layout']) else page['layout']
+        components = {component.id: component for component in walk(layout)
+                      if isinstance(getattr(component, 'id', None), str)}
+        for component in components.values():
+            if isinstance(component, dcc.Graph) and component.id in CHARTS:
+                inputs = app.callback_map[f'{component.id}.figure']['inputs']
+                defaults[component.id] = tuple(getattr(components[item['id']], item['property'])
+                                               for item in inputs)
+
+    states = list(defaults.items())
+    for output_id, (_, input_space) in CHARTS.items():
+        states += [(output_id, args) for args in input_space if args != defaults.get(output_id)]
+    return states
+
+
+def warm_up(app, budget=WARMUP_BUDGET, threads=WARMUP_THREADS):
+    """
+    Builds the figure of every chart state into the figure cache, so the first users of each page do not wait.
+
+    The states from warm_up_order() are built by a pool of threads, all from the data snapshot live when warming
+    starts. No state is started once budget seconds have passed; those left are built on their first request
+    as usual. A state that fails is logged and skipped. /healthz reports the app as not ready until it finishes.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+    - budget: float, the seconds after which no more states are started.
+    - threads: int, the number of threads building figures.
+
+    Returns:
+    - summary: dict, the number of states 'warmed', 'failed' and 'skipped', and the 'seconds' warming took.
+    """
+    ready.clear()
+    try:
+        start = time.monotonic()
+        states = warm_up_order(app)
+        snapshot = get_snapshot()
+
+        def warm(state):
+            if time.monotonic() - start > budget:
+                return 'skipped'
+            output_id, args = state
+            try:
+                with use_snapshot(snapshot):
+                    CHARTS[output_id][0](*args)
+            except Exception:
+                logger.exception('Could not warm %s with %r', output_id, args)
+                return 'failed'
+            return 'warmed'
+
+        # The states are queued in order, so the threads start the default views first
+        with ThreadPoolExecutor(threads) as pool:
+            counts = Counter(pool.map(warm, states))
+        summary = {outcome: counts[outcome] for outcome in ('warmed', 'failed', 'skipped')}
+        summary['seconds'] = round(time.monotonic() - start, 3)
+        logger.info('Warmed %d of %d chart states in %.2f s', summary['warmed'], len(states), summary['seconds'])
+        if summary['skipped']:
+            logger.warning('Stopped warming after the %s s budget with %d chart states left', budget,
+                           summary['skipped'])
+        return summary
+    finally:
+        ready.set()
+
+
+def start_warm_up(app):
+    """
+    Runs warm_up() in a background thread, for a server that starts taking requests straight away.
+
+    /healthz reports the app as not ready from when this is called until warming finishes.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+
+    Returns:
+    - thread: Thread, the thread warming the figures.
+    """
+    ready.clear()
+    thread = threading.Thread(target=warm_up, args=(app,), name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def preload(app):
+    """
+    Loads everything the app builds on first use, so it can be done once before worker processes are forked.
+
+    The dataset is loaded and indexed, and the app layout and every page layout are built, which fills the figure
+    cache with the default figures and builds the clientside chart data when that mode is on. A first request is
+    also made, as Dash finishes registering the callbacks on its first request and requests arriving together at
+    a new worker could otherwise find some of them missing. Unless WARMUP is off, the figures of every other chart
+    state are then built with warm_up(). The objects created are then moved out of reach of the garbage
+    collector, so it does not write to the memory pages the workers share copy-on-write with the parent process.
+
+    Parameters:
+    - app: Dash, the app to prepare.
+
+    Returns:
+    - summary: dict, the summary from warm_up(), or None when WARMUP is off.
+    """
+    get_snapshot()
+    app.server.test_client().get('/')
+    if callable(app.layout):
+        app.layout()
+    for page in dash.page_registry.values():
+        if callable(page['layout']):
+            page['layout']()
+    summary = warm_up(app) if WARMUP else None
+    gc.collect()
+    gc.freeze()
+    return summary
@@ -0,0 +1,284 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import shutil
+import dash
+from dash import dcc, html
+from dash.development.base_component import Component
+import dash_bootstrap_components as dbc
+import plotly
+from figures import fast_figure
+from services.clientside import CHARTS, slice_key
+
+# The shell page; the pages and charts are built by SHELL_SCRIPT from manifest.json
+SHELL_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Teachers Profile Dashboard</title>
+<style>
+body { margin: 0; font-family: system-ui, sans-serif; }
+nav { position: fixed; top: 0; bottom: 0; left: 0; width: 220px; padding: 1rem; background: #333; color: #fff; }
+nav a { display: block; padding: .5rem; color: #fff; text-decoration: none; border-radius: 4px; }
+nav a.active { background: #0d6efd; }
+main { margin-left: 270px; margin-right: 20px; padding: 2rem 1rem; }
+.controls { display: flex; gap: 1rem; margin: 1rem 0 .5rem; }
+.chart { background: #F0F2F5; padding: 1rem; margin-bottom: 1rem; }
+</style>
+<script src="plotly.min.js"></script>
+<script src="shell.js" defer></script>
+</head>
+<body>
+<nav><h2>Teachers Profile Dashboard</h2><div id="links"></div></nav>
+<main id="page"></main>
+</body>
+</html>
+"""
+
+# Builds each page from the manifest and swaps in the pre-rendered figure matching the chart's inputs
+SHELL_SCRIPT = """
+const figures = new Map();
+
+function fetchJson(url) {
+    if (!figures.has(url)) {
+        figures.set(url, fetch(url).then(response => response.json()));
+    }
+    return figures.get(url);
+}
+
+function control(input, onChange) {
+    const element = document.createElement('span');
+    if (input.type === 'dropdown') {
+        const select = document.createElement('select');
+        input.options.forEach((option, index) => select.add(new Option(option.label, index)));
+        select.selectedIndex = input.options.findIndex(option => option.value === input.value);
+        select.onchange = () => onChange(input.options[select.selectedIndex].value);
+        element.append(select);
+    } else if (input.type === 'checklist') {
+        // Newly ticked values are added at the end, as in dcc.Checklist
+        let value = [...input.value];
+        input.options.forEach(option => {
+            const label = document.createElement('label');
+            const box = document.createElement('input');
+            box.type = 'checkbox';
+            box.checked = value.includes(option.value);
+            box.onchange = () => {
+                value = box.checked ? [...value, option.value] : value.filter(item => item !== option.value);
+                onChange(value);
+            };
+            label.append(box, ' ' + option.label + ' ');
+            element.append(label);
+        });
+    } else if (input.type === 'range') {
+        const ends = input.value.map((end, position) => {
+            const select = document.createElement('select');
+            input.marks.forEach(mark => select.add(new Option(mark.label, mark.value)));
+            select.value = String(end);
+            select.onchange = () => {
+                const range = ends.map(item => Number(item.value));
+                if (range[0] <= range[1]) {
+                    onChange(range);
+                }
+            };
+            return select;
+        });
+        element.append(ends[0], ' to ', ends[1]);
+    }
+    return element;
+}
+
+function chart(block, template) {
+    const element = document.createElement('div');
+    const controls = document.createElement('div');
+    const plot = document.createElement('div');
+    const args = block.inputs.map(input => input.value);
+    controls.className = 'controls';
+    element.className = 'chart';
+
+    function draw() {
+        const file = block.figures[JSON.stringify(args)];
+        if (file) {
+            fetchJson(file).then(figure => {
+                Plotly.react(plot, figure.data, Object.assign({}, figure.layout, {template: template}));
+            });
+        }
+    }
+
+    block.inputs.forEach((input, position) => {
+        controls.append(control(input, value => { args[position] = value; draw(); }));
+    });
+    element.append(controls, plot);
+    draw();
+    return element;
+}
+
+Promise.all([fetchJson('manifest.json'), fetchJson('template.json')]).then(([manifest, template]) => {
+    const links = document.getElementById('links');
+    const page = document.getElementById('page');
+
+    function show() {
+        const path = location.hash.slice(1) || '/';
+        const current = manifest.pages.find(item => item.path === path) || manifest.pages[0];
+        links.querySelectorAll('a').forEach(link => link.classList.toggle('active', link.dataset.path === current.path));
+        page.replaceChildren(...current.blocks.map(block => {
+            if (block.type === 'chart') {
+                return chart(block, template);
+            }
+            const element = document.createElement(block.type);
+            element.textContent = block.text;
+            return element;
+        }));
+    }
+
+    manifest.pages.forEach(item => {
+        const link = document.createElement('a');
+        link.href = '#' + item.path;
+        link.textContent = item.name;
+        link.dataset.path = item.path;
+        links.append(link);
+    });
+    window.addEventListener('hashchange', show);
+    show();
+});
+"""
+
+
+def walk(component):
+    """
+    Yields a component and everything inside it, in the order they appear on the page.
+
+    Parameters:
+    - component: Component or list, a layout or part of one.
+
+    Returns:
+    - components: generator, every component in the layout.
+    """
+    if isinstance(component, (list, tuple)):
+        for child in component:
+            yield from walk(child)
+    elif isinstance(component, Component):
+        yield component
+        yield from walk(getattr(component, 'children', None))
+
+
+def _text(component):
+    # The text of a component and everything inside it
+    children = getattr(component, 'children', None)
+    if isinstance(children, str):
+        return children
+    if isinstance(children, (list, tuple)):
+        return ''.join(child if isinstance(child, str) else _text(child) for child in children)
+    return _text(children) if children is not None else ''
+
+
+def _options(options):
+    return [option if isinstance(option, dict) else {'label': str(option), 'value': option} for option in options]
+
+
+def _describe_input(component):
+    # The control the shell shows for an input of a chart callback
+    if isinstance(component, (dcc.Dropdown, dbc.Select)):
+        return {'id': component.id, 'type': 'dropdown', 'options': _options(component.options), 'value': component.value}
+    if isinstance(component, (dcc.Checklist, dbc.Checklist)):
+        return {'id': component.id, 'type': 'checklist', 'options': _options(component.options),
+                'value': component.value}
+    if isinstance(component, dcc.RangeSlider):
+        marks = [{'value': int(value), 'label': str(label)} for value, label in component.marks.items()]
+        return {'id': component.id, 'type': 'range', 'marks': marks, 'value': component.value}
+    raise ValueError(f'Cannot export an input of type {type(component).__name__}')
+
+
+def _render(task):
+    # Runs in a worker process: builds one chart state and writes it without its template
+    output_id, position, directory = task
+    function, input_space = CHARTS[output_id]
+    figure = function(*input_space[position])
+    layout = {key: value for key, value in figure['layout'].items() if key != 'template'}
+    path = Path(directory) / 'figures' / output_id / f'{position}.json'
+    path.write_bytes(fast_figure.to_json({'data': figure['data'], 'layout': layout}))
+
+
+def manifest(app):
+    """
+    Describes every page of the app for the static shell: its headings, paragraphs and charts with their inputs.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+
+    Returns:
+    - manifest: dict, the pages in navigation order, each with a list of blocks.
+    """
+    app.server.test_client().get('/')
+    pages = []
+    for page in dash.page_registry.values():
+        layout = page['layout']() if callable(page['layout']) else page['layout']
+        components = {component.id: component for component in walk(layout)
+                      if isinstance(getattr(component, 'id', None), str)}
+        blocks = []
+        for component in walk(layout):
+            if isinstance(component, (html.H1, html.H2, html.P)) and _text(component):
+                blocks.append({'type': type(component).__name__.lower(), 'text': _text(component)})
+            elif isinstance(component, dcc.Graph) and component.id in CHARTS:
+                inputs = app.callback_map[f'{component.id}.figure']['inputs']
+                _, input_space = CHARTS[component.id]
+                blocks.append({
+                    'type': 'chart',
+                    'id': component.id,
+                    'inputs': [_describe_input(components[item['id']]) for item in inputs],
+                    'figures': {slice_key(args): f'figures/{component.id}/{position}.json'
+                                for position, args in enumerate(input_space)},
+                })
+        pages.append({'name': page['name'], 'path': page['path'], 'blocks': blocks})
+    return {'pages': pages}
+
+
+def export(app, directory, workers=None, force=False):
+    """
+    Renders every state of every chart and writes them with a static HTML/JS shell that switches between them.
+
+    The bundle needs no Python to serve: any static file server or CDN can host the directory. Every chart
+    registered with chart_callback is rendered for its whole input space, in parallel worker processes. The plot
+    template is written once to template.json and plotly.js is copied next to the shell.
+
+    Parameters:
+    - app: Dash, the app, with its pages registered.
+    - directory: Path, where to write the bundle. An existing directory is replaced if it holds a previous export
+      or is empty.
+    - workers: int, the number of worker processes, defaulted to the number of CPUs.
+    - force: bool, whether to replace an existing directory that does not hold a previous export.
+
+    Returns:
+    - count: int, the number of figures written.
+
+    Raises:
+    - ValueError: if the directory holds anything but a previous export and force is not set.
+    """
+    directory = Path(directory)
+    if directory.exists():
+        previous = (directory / 'manifest.json').is_file() and (directory / 'index.html').is_file()
+        if not (previous or force or not any(directory.iterdir())):
+            raise ValueError(f'{directory} is not empty and does not hold a previous export')
+        shutil.rmtree(directory)
+    for output_id in CHARTS:
+        (directory / 'figures' / output_id).mkdir(parents=True)
+
+    pages = manifest(app)
+    tasks = [(output_id, position, str(directory))
+             for output_id, (_, input_space) in CHARTS.items() for position in range(len(input_space))]
+    # The workers are forked so they start with the app, its pages and the loaded data
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(workers or os.cpu_count(), mp_context=context) as pool:
+        list(pool.map(_render, tasks, chunksize=16))
+
+    # Every figure uses the same template, so it is taken from the first one
+    function, input_space = next(iter(CHARTS.values()))
+    template = function(*input_space[0])['layout'].get('template', {})
+    (directory / 'manifest.json').write_text(json.dumps(pages))
+    (directory / 'template.json').write_bytes(fast_figure.to_json(template))
+    (directory / 'index.html').write_text(SHELL_HTML)
+    (directory / 'shell.js').write_text(SHELL_SCRIPT)
+    shutil.copy(Path(plotly.__file__).parent / 'package_data' / 'plotly.min.js', directory / 'plotly.min.js')
+    return len(tasks)
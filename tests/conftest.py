@@ -1,5 +1,9 @@
 import os
+import shutil
+import pytest
 from selenium.webdriver.chrome.options import Options
+from figures import data_store
+from figures.data_store import data_path
 
 
 def pytest_setup_options():
@@ -17,3 +21,28 @@ def pytest_setup_options():
     else:
         options.add_argument("start-maximized")
     return options
+
+
+@pytest.fixture
+def data_copy(tmp_path):
+    """A copy of the prepared CSV in a temporary directory, which a test can change or convert freely."""
+    source = tmp_path / 'df_prepared.csv'
+    shutil.copy(data_path, source)
+    return source
+
+
+@pytest.fixture
+def live_data(data_copy, monkeypatch):
+    """
+    Swaps the live data snapshot for one of the copy of the prepared CSV, loaded on first use and checked for
+    changes on every request, and restores the snapshot of the prepared CSV afterwards.
+    """
+    monkeypatch.setattr(data_store, 'data_path', data_copy)
+    monkeypatch.setattr(data_store, 'CHECK_INTERVAL', 0)
+    monkeypatch.setattr(data_store, '_snapshot', None)
+    monkeypatch.setattr(data_store, '_rejected_version', None)
+    yield data_copy
+    # A reload still running would otherwise swap its snapshot in after the patches are undone
+    reloader = data_store._reloader
+    if reloader is not None:
+        reloader.join()
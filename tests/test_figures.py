@@ -0,0 +1,418 @@
+import base64
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import multiprocessing
+import shutil
+import threading
+import time
+from unittest import mock
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+import pytest
+from figures import figure_analysis, figure_course_level, figure_home
+from figures import data_store
+from figures.aggregates import Aggregates, aggregates
+from figures.query_kernel import EncodedFrame
+from figures.columnar_store import read_columnar
+from figures.data_store import PCT_COLUMNS, DataSnapshot, data_path, get_snapshot, read_data, use_snapshot
+from figures.figure_cache import FigureCache, open_shared_cache
+from figures.figure_home import pie_chart_total
+from figures.mmap_store import read_mapped
+from figures.sqlite_store import SqlAggregates, load_sqlite
+
+
+class PlotlyExpress:
+    """Stands in for the fast_figure module so a figure function builds its figure with Plotly Express."""
+    pie = staticmethod(px.pie)
+    bar = staticmethod(px.bar)
+    line = staticmethod(px.line)
+
+    @staticmethod
+    def update_layout(fig, **kwargs):
+        return fig.update_layout(**kwargs)
+
+
+def as_json(fig):
+    """Serializes a figure and decodes any binary arrays so figures can be compared by value."""
+    def decode(value):
+        if isinstance(value, dict) and 'bdata' in value:
+            return np.frombuffer(base64.b64decode(value['bdata']), dtype=value['dtype']).tolist()
+        if isinstance(value, dict):
+            return {key: decode(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        return value
+    return decode(json.loads(pio.to_json(fig, validate=False)))
+
+
+def test_figure_cache_returns_cached_figure():
+    """
+    GIVEN the figure cache
+    WHEN the same figure is requested twice
+    THEN the second request should be a cache hit returning the same figure
+    """
+    first = pie_chart_total(201718)
+    second = pie_chart_total(201718)
+
+    assert first is second
+
+
+def test_figure_cache_evicts_least_recently_used():
+    """
+    GIVEN a figure cache with room for two entries
+    WHEN a third entry is added after the first one was used again
+    THEN the second entry should be evicted and the counters should record every lookup
+    """
+    cache = FigureCache(maxsize=2)
+    cache.get_or_build('a', lambda: 1)
+    cache.get_or_build('b', lambda: 2)
+    cache.get_or_build('a', lambda: 1)
+    cache.get_or_build('c', lambda: 3)
+
+    assert cache.get_or_build('b', lambda: 'rebuilt') == 'rebuilt'
+    assert cache.cache_info() == {'hits': 1, 'misses': 4, 'shared_hits': 0, 'coalesced': 0, 'size': 2,
+                                  'maxsize': 2}
+
+
+def test_figure_cache_coalesces_concurrent_builds():
+    """
+    GIVEN a figure cache and a slow figure
+    WHEN many threads request it at once, and then a figure that fails to build
+    THEN it should be built once with every thread sharing the result, and every thread should get the error
+    """
+    cache = FigureCache()
+    builds = []
+    release = threading.Event()
+
+    def build(value):
+        builds.append(value)
+        release.wait(5)
+        if value == 'error':
+            raise ValueError('Cannot build the figure')
+        return {'value': value}
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(cache.get_or_build, 'figure', lambda: build('figure')) for _ in range(8)]
+        failures = [pool.submit(cache.get_or_build, 'error', lambda: build('error')) for _ in range(8)]
+        while cache.cache_info()['misses'] < 16:
+            time.sleep(0.01)
+        release.set()
+
+    assert builds == ['figure', 'error']
+    assert all(future.result() is futures[0].result() for future in futures)
+    assert all(isinstance(future.exception(), ValueError) for future in failures)
+    assert cache.cache_info()['coalesced'] == 14
+
+
+def test_figure_cache_builds_after_waiting_too_long():
+    """
+    GIVEN a figure cache with a short timeout and a figure whose build is stuck
+    WHEN another request asks for the same figure
+    THEN it should stop waiting after the timeout and build the figure itself
+    """
+    cache = FigureCache(timeout=0.05)
+    release = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        stuck = pool.submit(cache.get_or_build, 'figure', lambda: release.wait(5) and 'stuck')
+        while not cache._flights:
+            time.sleep(0.01)
+        assert cache.get_or_build('figure', lambda: 'built') == 'built'
+        release.set()
+    assert stuck.result() == 'stuck'
+
+
+def test_shared_cache_answers_other_processes(tmp_path):
+    """
+    GIVEN two figure caches backed by the same shared cache on disk, as in two worker processes
+    WHEN a figure built by the first is requested from the second, then the data version changes
+    THEN the second should load it without building it, and build it again for the new version
+    """
+    first = FigureCache(shared=open_shared_cache(tmp_path))
+    second = FigureCache(shared=open_shared_cache(tmp_path))
+    snapshot = get_snapshot()
+    changed = DataSnapshot(snapshot.data, version=('changed',))
+
+    first.get_or_build('figure', lambda: {'data': [1, 2]})
+    loaded = second.get_or_build('figure', lambda: 'rebuilt')
+    with use_snapshot(changed):
+        rebuilt = second.get_or_build('figure', lambda: 'rebuilt')
+
+    assert loaded == {'data': [1, 2]}
+    assert rebuilt == 'rebuilt'
+    assert second.cache_info()['shared_hits'] == 1
+    assert isinstance(first.shared_get_or_build(snapshot.version, ('aggregates',), lambda: Aggregates(snapshot)),
+                      Aggregates)
+    assert second.shared_get_or_build(snapshot.version, ('aggregates',), lambda: None).table.equals(
+        aggregates(snapshot).table)
+
+
+@pytest.mark.parametrize("module, name, args", [
+    (figure_home, 'pie_chart_total', (201819,)),
+    (figure_home, 'pie_chart_age', (202021, ['Undergraduate', 'Postgraduate'])),
+    (figure_course_level, 'bar_ethnicity', ('Undergraduate', 201920)),
+    (figure_course_level, 'line_chart', ('Undergraduate', 'Not awarded QTS')),
+    (figure_course_level, 'bar_ethnicity', ('Postgraduate', 202122)),
+    (figure_course_level, 'line_chart', ('Postgraduate', 'Teaching in a state-funded school')),
+    (figure_analysis, 'line_chart_analysis', (get_snapshot(), 'pct_total_sex_f', ['201819', '201920', '202021'])),
+])
+def test_fast_figure_matches_plotly_express(module, name, args):
+    """
+    GIVEN a figure function
+    WHEN the figure is built with the fast figure builders and with Plotly Express
+    THEN both figures should have the same traces and layout
+    """
+    function = getattr(module, name).__wrapped__
+    fast = function(*args)
+    with mock.patch.object(module, 'fast_figure', PlotlyExpress):
+        expected = function(*args)
+
+    assert as_json(fast) == as_json(expected)
+
+
+def test_line_chart_analysis_is_thread_safe():
+    """
+    GIVEN the shared data snapshot
+    WHEN the analysis chart is built from many threads at once
+    THEN every figure should match the one built on a single thread and the snapshot should be unchanged
+    """
+    snapshot = get_snapshot()
+    dtypes = snapshot.data.dtypes.copy()
+    cases = [(feature, periods) for feature in ('pct_total_sex_f', 'pct_total_age_u25', 'pct_total_disability')
+             for periods in (('201718', '201819'), ('201819', '201920', '202021'), ('202122',))]
+    function = figure_analysis.line_chart_analysis.__wrapped__
+    expected = {case: function(snapshot, case[0], list(case[1])) for case in cases}
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda case: (case, function(snapshot, case[0], list(case[1]))), cases * 20))
+
+    assert all(figure == expected[case] for case, figure in results)
+    assert snapshot.data.dtypes.equals(dtypes)
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_line_chart_analysis_keeps_the_point_order_of_the_rows(backend, data_copy):
+    """
+    GIVEN the dataset in memory or in the SQLite backend
+    WHEN the analysis chart is built over the full range of academic years
+    THEN the points of each period should keep the order of the rows in the CSV, as plotted before the aggregates
+    """
+    if backend == 'sqlite':
+        snapshot = load_sqlite(data_copy)
+    else:
+        snapshot = get_snapshot()
+    periods = ['201718', '201819', '201920', '202021', '202122']
+
+    figure = figure_analysis.line_chart_analysis.__wrapped__(snapshot, 'pct_total_sex_f', periods)
+
+    assert [trace['name'] for trace in figure['data']] == ['Postgraduate', 'Undergraduate']
+    assert list(figure['data'][0]['y']) == [82, 96, 80, 96, 76, 97, 74, 96, 76, 95]
+    assert list(figure['data'][1]['y']) == [79, 93, 74, 92, 72, 92, 69, 89, 67, 81]
+
+
+def test_aggregates_match_the_rows():
+    """
+    GIVEN the aggregation engine of a dataset where every row appears three times
+    WHEN totals and means are read from it
+    THEN they should equal the sums and means of the matching rows, without overflowing the column types
+    """
+    data = pd.concat([read_data()] * 3, ignore_index=True)
+    engine = Aggregates(DataSnapshot(data))
+    rows = data[(data['time_period'] == 201718) & data['course_level_recoded'].isin(['Undergraduate', 'Postgraduate'])
+                & (data['qts_status'] == 'Awarded QTS')]
+
+    totals = engine.sums('course_level_recoded', time_period=201718,
+                         course_level_recoded=['Undergraduate', 'Postgraduate'], qts_status='Awarded QTS')
+    means = engine.means(['pct_total_age_u25', 'pct_total_sex_f'], time_period=201718,
+                         course_level_recoded=['Undergraduate', 'Postgraduate'], qts_status='Awarded QTS')
+
+    expected = rows.groupby('course_level_recoded', observed=True)['n_total'].sum()
+    assert totals['n_total'].tolist() == expected.tolist()
+    assert totals['course_level_recoded'].tolist() == expected.index.tolist()
+    assert means.tolist() == rows[['pct_total_age_u25', 'pct_total_sex_f']].mean().tolist()
+    assert engine.table['pct_total_age_u25'].max() > 255
+
+
+def test_query_kernel_group_sums_match_pandas_groupby():
+    """
+    GIVEN the dataset encoded for the query kernel
+    WHEN the rows and some columns are summed for every combination of the key columns
+    THEN the combinations present in the data should have the counts and sums of a pandas groupby
+    """
+    data = read_data()
+    keys = ['time_period', 'course_level_recoded', 'qts_status']
+    columns = ['pct_total_ethnic_asian', 'n_total']
+    encoded = EncodedFrame(data, keys, columns)
+
+    counts, sums = encoded.group_sums(columns)
+
+    present = np.flatnonzero(counts)
+    codes = encoded.decode(present)
+    combinations = list(zip(*(np.array(encoded.dictionaries[column])[codes[column]].tolist() for column in keys)))
+    expected = data.groupby(keys, observed=True)[columns].agg(['sum', 'count'])
+    assert combinations == [tuple(key) for key in expected.index.tolist()]
+    assert counts[present].tolist() == expected[('n_total', 'count')].tolist()
+    for column in columns:
+        assert np.allclose(sums[column][present], expected[(column, 'sum')])
+    assert sums['n_total'].dtype == np.int64
+
+
+def test_parquet_backend_matches_csv(data_copy):
+    """
+    GIVEN a copy of the prepared CSV
+    WHEN it is read through the partitioned Parquet backend with a filter on a partition column
+    THEN the rows should equal the matching rows parsed from the CSV, with the same dtypes
+    """
+
+    columnar = read_columnar(filters={'time_period': [201819, 202021]}, source=data_copy)
+    expected = read_data(data_copy)
+    expected = expected[expected['time_period'].isin([201819, 202021])][list(columnar.columns)]
+
+    assert columnar.reset_index(drop=True).equals(expected.reset_index(drop=True))
+
+
+def test_parquet_backend_converts_once_when_workers_see_a_change_together(data_copy):
+    """
+    GIVEN a copy of the prepared CSV that has just changed
+    WHEN several processes read it through the Parquet backend at the same time
+    THEN every one should read the new rows, and no staging or previous copy should be left behind
+    """
+    read_columnar(source=data_copy)
+    with open(data_copy, 'a') as file:
+        file.write(data_path.read_text().splitlines()[1] + '\n')
+
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(read_columnar, source=data_copy) for _ in range(8)]
+        lengths = [len(future.result()) for future in futures]
+
+    assert lengths == [len(read_data(data_copy))] * 8
+    assert sorted(path.name for path in data_copy.parent.iterdir()) == [
+        'df_prepared.csv', 'df_prepared_parquet', 'df_prepared_parquet.lock']
+
+
+def test_mmap_backend_matches_csv_and_is_read_only(data_copy):
+    """
+    GIVEN a copy of the prepared CSV
+    WHEN it is read through the memory-mapped snapshot, and again after the CSV changes
+    THEN the data should equal the parsed CSV, its columns should be read-only and the snapshot should be rebuilt
+    """
+
+    mapped = read_mapped(source=data_copy)
+    assert mapped.equals(read_data(data_copy)[list(mapped.columns)])
+    assert not mapped['n_total'].to_numpy().flags.writeable
+
+    with open(data_copy, 'a') as file:
+        file.write(data_path.read_text().splitlines()[1] + '\n')
+    assert len(read_mapped(source=data_copy)) == len(mapped) + 1
+
+
+def test_mmap_backend_rebuilds_once_when_workers_see_a_change_together(data_copy):
+    """
+    GIVEN a copy of the prepared CSV that has just changed
+    WHEN several processes read it through the memory-mapped snapshot at the same time
+    THEN every one should map the new rows, and no staging file should be left behind
+    """
+    read_mapped(source=data_copy)
+    with open(data_copy, 'a') as file:
+        file.write(data_path.read_text().splitlines()[1] + '\n')
+
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(read_mapped, source=data_copy) for _ in range(8)]
+        lengths = [len(future.result()) for future in futures]
+
+    assert lengths == [len(read_data(data_copy))] * 8
+    assert sorted(path.name for path in data_copy.parent.iterdir()) == [
+        'df_prepared.arrow', 'df_prepared.arrow.lock', 'df_prepared.csv']
+
+
+def test_sqlite_backend_matches_in_memory_aggregates(data_copy):
+    """
+    GIVEN a copy of the prepared CSV loaded into the SQLite backend
+    WHEN the aggregations behind the figures are run as SQL
+    THEN they should equal those of the in-memory aggregation engine, and only read the grouped rows
+    """
+    snapshot = load_sqlite(data_copy)
+    engine = aggregates(snapshot)
+    expected = Aggregates(DataSnapshot(read_data(data_copy)))
+    filters = {'time_period': [201718, 201920], 'course_level_recoded': ['Undergraduate', 'Postgraduate'],
+               'qts_status': 'Awarded QTS'}
+
+    assert isinstance(engine, SqlAggregates)
+    assert snapshot.values == expected._values
+    assert engine.sums('course_level_recoded', **filters).equals(expected.sums('course_level_recoded', **filters))
+    assert engine.sums('time_period', qts_status='Awarded QTS').equals(expected.sums('time_period',
+                                                                                     qts_status='Awarded QTS'))
+    assert np.allclose(engine.means(PCT_COLUMNS, **filters), expected.means(PCT_COLUMNS, **filters))
+    assert np.isnan(engine.means(['n_total'], time_period=199900)['n_total'])
+    series, expected_series = engine.series(**filters), expected.series(**filters)
+    assert series['course_level_recoded'].tolist() == expected_series['course_level_recoded'].tolist()
+    assert np.allclose(series[PCT_COLUMNS], expected_series[PCT_COLUMNS])
+    rows = snapshot.data
+    assert rows.to_dict('list') == DataSnapshot(read_data(data_copy)).data[rows.columns].to_dict('list')
+    with pytest.raises(ValueError):
+        engine.means(['n_total; DROP TABLE outcomes'])
+
+
+def test_pinned_sqlite_snapshot_keeps_its_database_while_it_is_rebuilt(data_copy):
+    """
+    GIVEN a request pinned to a SQLite snapshot of a copy of the prepared CSV
+    WHEN the CSV changes and its new version is loaded while the request needs a new connection
+    THEN the request should still read the rows of its snapshot, and the old file should only be removed once the
+    snapshot is collected
+    """
+    old = load_sqlite(data_copy)
+    totals = old.engine.sums('time_period')
+    with open(data_copy, 'a') as file:
+        file.write(data_path.read_text().splitlines()[1] + '\n')
+
+    with use_snapshot(old):
+        new = load_sqlite(data_copy)
+        # Every connection of the pool is in use, so the query opens another one
+        with old.pool.connection():
+            assert aggregates().sums('time_period').equals(totals)
+    assert new.version != old.version
+    assert new.engine.sums('time_period')['n_total'].sum() > totals['n_total'].sum()
+
+    old_path = old.pool.path
+    del old
+    assert old_path.exists()
+    load_sqlite(data_copy)
+    assert not old_path.exists() and new.pool.path.exists()
+
+
+def test_data_file_is_reloaded_in_the_background(live_data, monkeypatch):
+    """
+    GIVEN the app serving a copy of the prepared CSV
+    WHEN the file gains a row, and later is replaced by a file missing a column
+    THEN the new rows should be swapped in while pinned requests keep the old snapshot, and the invalid file
+    should be rejected without replacing the data, while a file that could not be read for another reason should
+    be read again at the next check
+    """
+    original = get_snapshot()
+
+    with open(live_data, 'a') as file:
+        file.write(data_path.read_text().splitlines()[1] + '\n')
+    with use_snapshot(original):
+        # Another request notices the change and starts the reload, which must not block it
+        assert data_store.current_snapshot() is original
+        data_store._reloader.join()
+        assert get_snapshot() is original
+    reloaded = get_snapshot()
+    assert len(reloaded.data) == len(original.data) + 1
+
+    live_data.write_text(''.join(line.rsplit(',', 1)[0] + '\n' for line in data_path.read_text().splitlines()))
+    get_snapshot()
+    data_store._reloader.join()
+    assert get_snapshot() is reloaded
+
+    # A load failing for a reason other than the file, e.g. while it is being swapped, is tried again
+    shutil.copy(data_path, live_data)
+    with monkeypatch.context() as patch:
+        patch.setattr(data_store, 'load_snapshot', mock.Mock(side_effect=OSError('Directory not empty')))
+        get_snapshot()
+        data_store._reloader.join()
+    assert get_snapshot() is reloaded
+    data_store._reloader.join()
+    assert len(get_snapshot().data) == len(original.data)
@@ -0,0 +1,215 @@
+import gzip
+import json
+from unittest import mock
+import brotli
+import pandas as pd
+from dash import Dash, html
+from dash.testing.application_runners import import_app
+from flask import Flask, request
+import pytest
+from figures import fast_figure, figure_analysis, figure_home
+from figures.data_store import get_snapshot
+from figures.figure_cache import figure_cache
+from figures.figure_home import pie_chart_total
+from services import api, assets, compression, metrics, static_export
+from services.background import background_job
+from services.clientside import CHARTS
+from services.preload import warm_up, warm_up_order
+
+
+def test_metrics_record_callback_stages_and_errors():
+    """
+    GIVEN a server with the metrics hooks and an instrumented callback that builds a figure with fast_figure
+    WHEN the callback is requested once successfully and once with an error
+    THEN /metrics should report both requests, the error and the timings of every stage of the successful one,
+    with the time of the figure builder in the figure stage
+    """
+    server = Flask(__name__)
+    metrics.register_metrics(server)
+    data = pd.DataFrame({'Course Level': ['Undergraduate', 'Postgraduate'], 'Total': [10, 20]})
+
+    def chart(period):
+        if period is None:
+            raise ValueError('No period selected')
+        return fast_figure.pie(data, names='Course Level', values='Total', title=f'Students ({period})')
+
+    callback = metrics.timed_callback('test_chart', chart)
+    server.add_url_rule(metrics.CALLBACK_PATH, 'callback', lambda: callback(request.get_json()['period']),
+                        methods=['POST'])
+    client = server.test_client()
+
+    client.post(metrics.CALLBACK_PATH, json={'period': 201718})
+    client.post(metrics.CALLBACK_PATH, json={'period': None})
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert 'dash_callback_requests_total{callback="test_chart"} 2' in text
+    assert 'dash_callback_errors_total{callback="test_chart"} 1' in text
+    for stage in ('filter', 'figure', 'serialize', 'total'):
+        assert f'dash_callback_duration_seconds_count{{callback="test_chart",stage="{stage}"}} 1' in text
+    figure_time = text.split('dash_callback_duration_seconds_sum{callback="test_chart",stage="figure"} ')[1]
+    assert float(figure_time.split()[0]) > 0
+
+
+def test_api_returns_chart_aggregates_with_etag():
+    """
+    GIVEN a server with the aggregates API
+    WHEN the pie chart aggregates are requested for two periods, then again with the returned ETag
+    THEN the first response should hold the values behind the chart and the second should be 304 Not Modified
+    """
+    server = Flask(__name__)
+    api.register_api(server)
+    client = server.test_client()
+
+    response = client.get(api.API_PATH, query_string={'charts': 'qts_distribution', 'periods': '201819,201718'})
+    body = response.get_json()
+    distribution = figure_home.qts_distribution(201718)
+    repeat = client.get(api.API_PATH, query_string={'charts': 'qts_distribution', 'periods': '201718,201819'},
+                        headers={'If-None-Match': response.headers['ETag']})
+
+    assert body['periods'] == [201718, 201819]
+    assert body['qts_distribution']['201718'] == dict(zip(distribution['Course Level'], distribution['Total']))
+    assert repeat.status_code == 304
+    assert client.get(api.API_PATH, query_string={'periods': '1999'}).status_code == 400
+
+
+def test_api_analysis_has_one_point_per_series_and_period():
+    """
+    GIVEN a server with the aggregates API
+    WHEN the analysis aggregates are requested for the postgraduates over three periods
+    THEN each employment status should have one point per period, with the values the chart plots
+    """
+    server = Flask(__name__)
+    api.register_api(server)
+    periods = ['201718', '201819', '201920']
+    body = server.test_client().get(api.API_PATH, query_string={
+        'charts': 'analysis', 'periods': ','.join(periods), 'course_levels': 'Postgraduate',
+        'metrics': 'pct_total_sex_f'}).get_json()
+    rows = figure_analysis.metric_rows(get_snapshot(), periods)
+
+    series = body['analysis']['pct_total_sex_f']
+    assert list(series) == ['Postgraduate']
+    for status, points in series['Postgraduate'].items():
+        expected = rows[(rows['course_level_recoded'] == 'Postgraduate') & (rows['employment_status'] == status)]
+        assert [period for period, _ in points] == [int(period) for period in periods]
+        assert [value for _, value in points] == expected['pct_total_sex_f'].tolist()
+    assert len(series['Postgraduate']) == 2
+
+
+def test_responses_are_compressed_and_layout_is_conditional():
+    """
+    GIVEN a server with the compression hook, a large and a small JSON route, an image route and a layout route
+    WHEN they are requested accepting brotli and gzip, and the layout again with its ETag
+    THEN only the large JSON should be compressed, with brotli, and the layout should be 304 Not Modified
+    """
+    server = Flask(__name__)
+    compression.register_compression(server)
+    figure = json.dumps(pie_chart_total(201718))
+    server.add_url_rule('/figure', 'figure', lambda: (figure, 200, {'Content-Type': 'application/json'}))
+    server.add_url_rule('/small', 'small', lambda: {'status': 'ok'})
+    server.add_url_rule('/image', 'image', lambda: (figure, 200, {'Content-Type': 'image/png'}))
+    server.add_url_rule('/_dash-layout', 'layout', lambda: {'props': {'children': figure}})
+    client = server.test_client()
+    headers = {'Accept-Encoding': 'gzip, br'}
+
+    compressed = client.get('/figure', headers=headers)
+    gzipped = client.get('/figure', headers={'Accept-Encoding': 'gzip'})
+    layout = client.get('/_dash-layout', headers=headers)
+    repeat = client.get('/_dash-layout', headers={**headers, 'If-None-Match': layout.headers['ETag']})
+
+    assert compressed.headers['Content-Encoding'] == 'br' and 'Accept-Encoding' in compressed.headers['Vary']
+    assert brotli.decompress(compressed.data).decode() == figure
+    assert gzip.decompress(gzipped.data).decode() == figure
+    assert 'Content-Encoding' not in client.get('/small', headers=headers).headers
+    assert 'Content-Encoding' not in client.get('/image', headers=headers).headers
+    assert layout.headers['Content-Encoding'] == 'br'
+    assert repeat.status_code == 304 and not repeat.data
+
+
+def test_assets_are_served_precompressed_with_content_hashed_urls(tmp_path):
+    """
+    GIVEN an app with the vendored theme in its assets folder and a bundle of its stylesheets and html components
+    WHEN the page is requested, then each of those files by the URL in the page
+    THEN the URLs should carry the hash of each file, and each file should be served as brotli, gzip or
+    uncompressed as the browser accepts, with an immutable cache lifetime
+    """
+    app = Dash(__name__, assets_folder=str(assets.THEME_PATH.parent))
+    app.layout = html.Div()
+    files = assets.asset_files(app)
+    # Only the smaller files are compressed, as brotli takes a while on the largest
+    with mock.patch.object(assets, 'asset_files', lambda app: {url: path for url, path in files.items()
+                                                               if url.endswith('.css') or '/html/' in url}):
+        manifest = assets.build(app, tmp_path / 'assets')
+    app = Dash(__name__, assets_folder=str(assets.THEME_PATH.parent))
+    app.layout = html.Div()
+    assets.register_assets(app, tmp_path / 'assets')
+    client = app.server.test_client()
+
+    page = client.get('/').get_data(as_text=True)
+    theme = manifest['/assets/bootstrap-quartz.min.css']
+    url = f"/assets/bootstrap-quartz.min.css?m={theme['hash']}"
+    responses = {encoding: client.get(url, headers={'Accept-Encoding': encoding})
+                 for encoding in ('br', 'gzip', 'identity')}
+
+    assert len(manifest) == 3
+    assert 'cdn.jsdelivr.net' not in import_app(app_file='src.app').server.test_client().get('/').get_data(as_text=True)
+    assert url in page
+    assert any(f"m{entry['hash']}" in page for entry in manifest.values() if '/html/' in entry['file'])
+    assert responses['br'].headers['Content-Encoding'] == 'br'
+    assert len(responses['br'].data) == theme['sizes']['br'] < theme['sizes']['gzip'] < theme['sizes']['identity']
+    assert responses['gzip'].headers['Content-Encoding'] == 'gzip'
+    assert responses['identity'].data == assets.THEME_PATH.read_bytes()
+    for response in responses.values():
+        assert response.headers['Cache-Control'] == assets.IMMUTABLE
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_warm_up_builds_every_chart_state_default_views_first():
+    """
+    GIVEN the app with its pages registered
+    WHEN the figures are warmed, and again with no time budget
+    THEN every chart state should be cached with the default views first, in navigation order, /healthz should
+    report ready afterwards and no state should be started once the budget is spent
+    """
+    app = import_app(app_file='src.app')
+    states = warm_up_order(app)
+    figure_cache.clear()
+
+    summary = warm_up(app, threads=4)
+
+    assert states[0] == ('pie_chart_total', (201718,))
+    assert [output_id for output_id, _ in states[:len(CHARTS)]] == [
+        'pie_chart_total', 'pie_chart_age', 'bar_u', 'line_u', 'bar_p', 'line_p', 'line_chart_a']
+    assert len(states) == sum(len(input_space) for _, input_space in CHARTS.values())
+    assert summary['warmed'] == len(states) and summary['failed'] == 0
+    assert figure_cache.cache_info()['size'] == len(states)
+    assert app.server.test_client().get('/healthz').status_code == 200
+    assert warm_up(app, budget=0)['skipped'] == len(states)
+
+
+def test_background_job_reports_progress():
+    """
+    GIVEN a chart callback wrapped to run as a background job
+    WHEN the job runs
+    THEN it should report its progress in order before returning the callback's result
+    """
+    reported = []
+    job = background_job(lambda period: pie_chart_total(period))
+
+    figure = job(reported.append, 201718)
+
+    assert figure is pie_chart_total(201718)
+    assert [value for value, _ in reported] == sorted(value for value, _ in reported)
+    assert len(reported) == 2
+
+
+def test_static_export_refuses_a_directory_it_did_not_write(tmp_path):
+    """
+    GIVEN a directory holding a file that is not part of a static export
+    WHEN the app is exported into it
+    THEN the export should be refused and the file kept
+    """
+    (tmp_path / 'notes.txt').write_text('keep')
+
+    with pytest.raises(ValueError):
+        static_export.export(Dash(__name__), tmp_path)
+    assert (tmp_path / 'notes.txt').read_text() == 'keep'